@@ -1,10 +1,21 @@
+import asyncio
+import uuid
+
 from langgraph.graph import StateGraph,END
 from langgraph.prebuilt import ToolNode
+from langchain_core.callbacks import adispatch_custom_event, dispatch_custom_event
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 
+from app.agents.fast_router import ROUTE_EXPERT, ROUTE_SMALL_TALK, fast_router
 from app.agents.state import AgentState
+from app.core.config import settings
 from app.rag.generators import get_supervisor_model
 
-from app.tools.supervisor_tools import supervisor_tools
+from app.tools.supervisor_tools import expert_tools_by_category, supervisor_tools
+
+# Custom stream event carrying an answer produced without the supervisor LLM.
+FAST_PATH_ANSWER_EVENT = "fast_path_answer"
 
 master_tool_node = ToolNode(supervisor_tools)
 supervisor_model = get_supervisor_model()
@@ -28,6 +39,78 @@ You are the Supervisor, the central coordinator of a team of expert AI assistant
 
 model_with_tools = supervisor_model.bind_tools(supervisor_tools)
 
+_category_by_tool_name = {tool.name: category for category, tool in expert_tools_by_category.items()}
+
+
+def _route(state: AgentState) -> dict:
+    """
+    Runs the fast-path router on the latest user message. Small talk gets its
+    template answer; a confident single-product question becomes a direct call
+    to that expert's tool; anything else is left to the supervisor.
+    """
+    question = state["messages"][-1]
+    if not settings.FAST_ROUTER_ENABLED or not isinstance(question, HumanMessage):
+        return {"route": None}
+
+    try:
+        decision = fast_router.classify(question.content, has_history=len(state["messages"]) > 1)
+    except Exception as e:
+        print(f"FAST-PATH ROUTER failed, falling back to the supervisor: {e}")
+        return {"route": None}
+    print(f"FAST-PATH ROUTER: {decision.as_dict()}")
+    if decision.route == ROUTE_SMALL_TALK:
+        return {"messages": [AIMessage(content=decision.reply)], "route": decision.as_dict()}
+    if decision.route == ROUTE_EXPERT:
+        tool_call = {
+            "name": expert_tools_by_category[decision.category].name,
+            "args": {"question": question.content},
+            "id": f"fast_path_{uuid.uuid4().hex}",
+        }
+        return {"messages": [AIMessage(content="", tool_calls=[tool_call])], "route": decision.as_dict()}
+    return {"route": decision.as_dict()}
+
+
+def router_node(state: AgentState):
+    update = _route(state)
+    if (update["route"] or {}).get("route") == ROUTE_SMALL_TALK:
+        dispatch_custom_event(FAST_PATH_ANSWER_EVENT, {"content": update["messages"][-1].content})
+    return update
+
+
+async def arouter_node(state: AgentState):
+    # The classifier embeds the question locally, so keep it off the event loop.
+    update = await asyncio.to_thread(_route, state)
+    if (update["route"] or {}).get("route") == ROUTE_SMALL_TALK:
+        await adispatch_custom_event(FAST_PATH_ANSWER_EVENT, {"content": update["messages"][-1].content})
+    return update
+
+
+def _fast_answer(state: AgentState) -> dict:
+    report = state["messages"][-1]
+    content = report.content if isinstance(report, ToolMessage) else ""
+    return {"messages": [AIMessage(content=content)]}
+
+
+def fast_answer_node(state: AgentState):
+    """Passes a directly-routed expert's report on as the final answer, without a synthesis call."""
+    update = _fast_answer(state)
+    dispatch_custom_event(FAST_PATH_ANSWER_EVENT, {"content": update["messages"][-1].content})
+    return update
+
+
+async def afast_answer_node(state: AgentState):
+    update = _fast_answer(state)
+    await adispatch_custom_event(FAST_PATH_ANSWER_EVENT, {"content": update["messages"][-1].content})
+    return update
+
+
+def _record_supervisor_choice(state: AgentState, response):
+    # Only the supervisor's first decision on a message says which experts it needs.
+    if isinstance(state["messages"][-1], HumanMessage) and response.tool_calls:
+        categories = sorted({_category_by_tool_name.get(call["name"]) for call in response.tool_calls} - {None})
+        fast_router.record_supervisor_choice(state.get("route"), categories)
+
+
 def supervisor_node(state: AgentState):
     """
     The 'thinking' node of the supervisor agent. It calls the LLM to decide the next action.
@@ -37,6 +120,20 @@ def supervisor_node(state: AgentState):
     from langchain_core.messages import SystemMessage
     messages_with_system = [SystemMessage(content=system_prompt)] + state["messages"]
     response = model_with_tools.invoke(messages_with_system)
+    _record_supervisor_choice(state, response)
+    return {"messages": [response]}
+
+async def asupervisor_node(state: AgentState):
+    """
+    Async variant of `supervisor_node`. When the graph is driven through
+    `ainvoke`/`astream_events`, this and the async expert tools let several
+    experts run concurrently on the event loop instead of in worker threads.
+    """
+    print("SUPERVISOR AGENT (async)")
+    from langchain_core.messages import SystemMessage
+    messages_with_system = [SystemMessage(content=system_prompt)] + state["messages"]
+    response = await model_with_tools.ainvoke(messages_with_system)
+    _record_supervisor_choice(state, response)
     return {"messages": [response]}
 
 
@@ -49,13 +146,39 @@ def should_continue_supervisor(state: AgentState):
     else:
         print("SUPERVISOR AGENT DONE")
         return "end_agent_turn" 
+
+
+def route_after_router(state: AgentState):
+    route = (state.get("route") or {}).get("route")
+    if route == ROUTE_SMALL_TALK:
+        return "end_agent_turn"
+    if route == ROUTE_EXPERT:
+        return "direct_to_expert"
+    return "to_supervisor"
+
+
+def route_after_experts(state: AgentState):
+    if (state.get("route") or {}).get("route") == ROUTE_EXPERT:
+        return "fast_answer"
+    return "supervisor"
+
     
 workflow = StateGraph(AgentState)
 
-workflow.add_node("supervisor", supervisor_node)
+workflow.add_node("router", RunnableLambda(router_node, afunc=arouter_node, name="router"))
+workflow.add_node("supervisor", RunnableLambda(supervisor_node, afunc=asupervisor_node, name="supervisor"))
 workflow.add_node("expert_tools", master_tool_node)
+workflow.add_node("fast_answer", RunnableLambda(fast_answer_node, afunc=afast_answer_node, name="fast_answer"))
 
-workflow.set_entry_point("supervisor")
+workflow.set_entry_point("router")
+
+workflow.add_conditional_edges("router",
+        route_after_router, {
+            "to_supervisor": "supervisor",
+            "direct_to_expert": "expert_tools",
+            "end_agent_turn": END
+        }
+)
 
 workflow.add_conditional_edges("supervisor",
         should_continue_supervisor,{
@@ -64,6 +187,12 @@ workflow.add_conditional_edges("supervisor",
         }
 )
 
-workflow.add_edge("expert_tools", "supervisor")
+workflow.add_conditional_edges("expert_tools",
+        route_after_experts, {
+            "supervisor": "supervisor",
+            "fast_answer": "fast_answer"
+        }
+)
+workflow.add_edge("fast_answer", END)
 
 agent_manager = workflow.compile()
\ No newline at end of file
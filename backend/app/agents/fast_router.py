@@ -0,0 +1,374 @@
+import re
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.rag.cache import CachedQueryEmbeddings
+from app.rag.embeddings import get_embedding_model
+
+logger = logging.getLogger(__name__)
+
+ROUTE_SMALL_TALK = "small_talk"
+ROUTE_EXPERT = "expert"
+ROUTE_SUPERVISOR = "supervisor"
+
+# Unambiguous product vocabulary. Words shared by several products ("filter",
+# "drain", "door", "noise") are left to the embedding classifier.
+CATEGORY_KEYWORDS: Dict[str, Sequence[str]] = {
+    "washing_machine": (
+        "washing machine", "washer", "laundry", "spin cycle", "spin", "drum", "detergent",
+        "fabric softener", "rinse", "wash cycle", "wash", "clothes", "front load", "top load", "agitator",
+    ),
+    "refrigerator": (
+        "refrigerator", "fridge", "freezer", "ice maker", "ice", "crisper", "water dispenser",
+        "frost", "defrost", "fresh food", "deli drawer",
+    ),
+    "air_conditioner": (
+        "air conditioner", "air conditioning", "aircon", "ac", "a/c", "hvac", "heat pump",
+        "split unit", "window unit", "btu", "swing", "louver", "dehumidify", "dry mode", "fan mode",
+    ),
+}
+
+# Example questions per category; past chat turns are added on top (see `fit_from_history`).
+SEED_EXAMPLES: Dict[str, Sequence[str]] = {
+    "washing_machine": (
+        "My washing machine will not spin",
+        "How do I clean the washer drum?",
+        "Water is not draining after the wash cycle",
+        "How much detergent should I use?",
+        "The washer shakes and moves during the spin cycle",
+        "Clothes come out still wet",
+        "How do I clean the detergent drawer?",
+        "What does the tub clean cycle do?",
+    ),
+    "refrigerator": (
+        "My fridge is not cooling",
+        "The freezer has too much frost",
+        "The ice maker stopped making ice",
+        "What temperature should the refrigerator be set to?",
+        "Water is leaking under the refrigerator",
+        "How do I replace the water filter in the fridge?",
+        "The fridge makes a clicking noise",
+        "How do I defrost the freezer?",
+    ),
+    "air_conditioner": (
+        "My air conditioner is blowing warm air",
+        "How do I clean the AC filter?",
+        "The AC remote is not working",
+        "Water is dripping from the indoor unit",
+        "How do I set the AC timer?",
+        "What does dry mode do on the air conditioner?",
+        "The outdoor unit is making a loud noise",
+        "How do I change the AC from cooling to heating?",
+    ),
+}
+
+# chat_messages.agent_name as saved by the frontend ("Fetched from X Agent" -> "X").
+AGENT_NAME_CATEGORIES = {
+    "washing machine": "washing_machine",
+    "refrigerator": "refrigerator",
+    "air conditioner": "air_conditioner",
+}
+
+SMALL_TALK_REPLIES = {
+    "greeting": (
+        "Hello! I can help with washing machines, refrigerators and air conditioners. "
+        "What would you like to know?"
+    ),
+    "thanks": "You're welcome! Let me know if there is anything else I can help with.",
+    "goodbye": "Goodbye! Come back any time you have a question about your appliances.",
+}
+
+_SMALL_TALK_WORDS = {
+    "greeting": {"hi", "hello", "hey", "hiya", "howdy", "greetings", "morning", "afternoon", "evening"},
+    "thanks": {"thanks", "thank", "thx", "ty", "cheers", "appreciate", "appreciated"},
+    "goodbye": {"bye", "goodbye", "cya", "later", "farewell"},
+}
+# Words allowed around the core small-talk word ("thank you so much", "good morning there").
+_SMALL_TALK_FILLER = {
+    "good", "there", "you", "so", "much", "a", "lot", "very", "it", "all", "everyone", "team",
+    "again", "ok", "okay", "great", "see", "that", "helped", "helps", "for", "the", "help",
+}
+_FOLLOW_UP_WORDS = {"it", "its", "this", "that", "they", "them", "those", "these", "same", "again", "also", "too", "instead", "either"}
+_WORD_RE = re.compile(r"[a-z0-9/]+")
+
+
+@dataclass
+class RouteDecision:
+    route: str  # ROUTE_SMALL_TALK, ROUTE_EXPERT or ROUTE_SUPERVISOR
+    category: Optional[str] = None  # expert category for ROUTE_EXPERT; best guess otherwise
+    reply: Optional[str] = None  # template answer for ROUTE_SMALL_TALK
+    method: str = ""  # what decided: small_talk, keyword, embedding, or the reason for falling back
+    confidence: float = 0.0
+    latency_ms: float = 0.0
+    scores: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {
+            "route": self.route,
+            "category": self.category,
+            "method": self.method,
+            "confidence": round(self.confidence, 4),
+            "latency_ms": round(self.latency_ms, 3),
+        }
+
+
+def _keyword_pattern(keywords: Sequence[str]) -> re.Pattern:
+    alternatives = sorted((re.escape(keyword) for keyword in keywords), key=len, reverse=True)
+    return re.compile(r"(?<![a-z0-9])(?:" + "|".join(alternatives) + r")(?![a-z0-9])")
+
+
+class FastPathRouter:
+    """
+    Local classifier that decides, before any LLM call, how a chat message
+    should be handled.
+
+    Greetings, thanks and goodbyes are answered from templates. A question
+    that clearly concerns one product goes straight to that expert: either
+    its product keywords all point to one category (and the embedding does
+    not disagree), or its embedding is close to one category's centroid and
+    well ahead of the others. Centroids are built from seed questions plus
+    past chat turns labelled with the expert that answered them. Anything
+    else, including multi-product and follow-up questions, is left to the
+    LLM supervisor.
+    """
+
+    def __init__(
+        self,
+        min_similarity: float,
+        min_margin: float,
+        max_words: int,
+    ):
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.max_words = max_words
+        self.categories = list(settings.VALID_PRODUCT_TYPES)
+        self._keyword_patterns = {category: _keyword_pattern(CATEGORY_KEYWORDS[category]) for category in self.categories}
+        self._centroids: Optional[np.ndarray] = None
+        self._example_counts: Dict[str, int] = {}
+        self._evaluation: Optional[dict] = None
+        self._fit_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._routes: Dict[str, int] = {}
+        self._latencies_ms: deque = deque(maxlen=1000)
+        self._supervisor_agreement = {"agreed": 0, "disagreed": 0}
+
+    # -- training -------------------------------------------------------------
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(get_embedding_model().embed_documents(texts), dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def _embed_query(self, text: str) -> np.ndarray:
+        embedding_key = (settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_DEVICE, settings.EMBEDDING_NORMALIZE)
+        embeddings = CachedQueryEmbeddings(get_embedding_model(), embedding_key)
+        vector = np.asarray(embeddings.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def fit(self, examples: Sequence[Tuple[str, str]] = ()):
+        """Builds the category centroids from the seed questions plus (text, category) examples."""
+        labelled = [(text, category) for category in self.categories for text in SEED_EXAMPLES[category]]
+        labelled += [(text, category) for text, category in examples if category in self.categories and text.strip()]
+        vectors = self._embed([text for text, _ in labelled])
+
+        centroids = []
+        counts = {}
+        for category in self.categories:
+            rows = [i for i, (_, label) in enumerate(labelled) if label == category]
+            centroid = vectors[rows].mean(axis=0)
+            centroids.append(centroid / max(float(np.linalg.norm(centroid)), 1e-12))
+            counts[category] = len(rows)
+        with self._fit_lock:
+            self._centroids = np.stack(centroids)
+            self._example_counts = counts
+        logger.info(f"Fast-path router trained on {len(labelled)} examples: {counts}")
+
+    def fit_from_history(self, limit: Optional[int] = None) -> dict:
+        """
+        Trains on past chat turns: each question whose answer was tagged with
+        a single expert (chat_messages.agent_name) becomes an example for that
+        category. Every FAST_ROUTER_HOLDOUT_EVERY-th example is held out and
+        used to measure routing accuracy. Returns that evaluation.
+        """
+        examples = load_history_examples(limit or settings.FAST_ROUTER_HISTORY_LIMIT)
+        holdout_every = max(2, settings.FAST_ROUTER_HOLDOUT_EVERY)
+        train = [example for i, example in enumerate(examples) if (i + 1) % holdout_every]
+        holdout = [example for i, example in enumerate(examples) if not (i + 1) % holdout_every]
+        self.fit(train)
+        self._evaluation = self.evaluate(holdout)
+        logger.info(f"Fast-path router holdout evaluation: {self._evaluation}")
+        return self._evaluation
+
+    def _ensure_fitted(self):
+        if self._centroids is None:
+            self.fit()
+
+    # -- routing --------------------------------------------------------------
+
+    @staticmethod
+    def _small_talk_kind(words: List[str]) -> Optional[str]:
+        if not words or len(words) > 6:
+            return None
+        kinds = [kind for kind, vocabulary in _SMALL_TALK_WORDS.items() if vocabulary & set(words)]
+        if len(kinds) != 1:
+            return None
+        allowed = _SMALL_TALK_WORDS[kinds[0]] | _SMALL_TALK_FILLER
+        return kinds[0] if all(word in allowed for word in words) else None
+
+    def classify(self, text: str, has_history: bool = False) -> RouteDecision:
+        """
+        Decides how to handle `text`. `has_history` marks a message that
+        continues a conversation, which makes keyword-less questions that
+        refer back ("is it safe to do that?") go to the supervisor.
+        """
+        start = time.perf_counter()
+        decision = self._classify(text, has_history)
+        decision.latency_ms = (time.perf_counter() - start) * 1000
+        self._record(decision)
+        return decision
+
+    def _classify(self, text: str, has_history: bool) -> RouteDecision:
+        lowered = text.lower()
+        words = _WORD_RE.findall(lowered)
+        if not words:
+            return RouteDecision(ROUTE_SUPERVISOR, method="empty")
+
+        small_talk = self._small_talk_kind(words)
+        if small_talk:
+            return RouteDecision(ROUTE_SMALL_TALK, reply=SMALL_TALK_REPLIES[small_talk], method=small_talk, confidence=1.0)
+        if len(words) > self.max_words:
+            return RouteDecision(ROUTE_SUPERVISOR, method="too_long")
+
+        keyword_hits = [category for category in self.categories if self._keyword_patterns[category].search(lowered)]
+
+        self._ensure_fitted()
+        similarities = self._centroids @ self._embed_query(text)
+        scores = {category: float(score) for category, score in zip(self.categories, similarities)}
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best, runner_up = ranked[0], ranked[1] if len(ranked) > 1 else None
+        margin = scores[best] - (scores[runner_up] if runner_up else 0.0)
+
+        if len(keyword_hits) > 1:
+            return RouteDecision(ROUTE_SUPERVISOR, category=best, method="multiple_products", scores=scores)
+        # Checked before the keywords: the expert only sees this message, so
+        # "can I do that with the AC too?" needs the supervisor to resolve "that".
+        if has_history and _FOLLOW_UP_WORDS & set(words):
+            return RouteDecision(ROUTE_SUPERVISOR, category=best, method="follow_up", scores=scores)
+        if keyword_hits:
+            category = keyword_hits[0]
+            # Trust the keyword unless the embedding clearly points elsewhere.
+            if scores[best] - scores[category] <= self.min_margin:
+                return RouteDecision(ROUTE_EXPERT, category=category, method="keyword", confidence=scores[category], scores=scores)
+            return RouteDecision(ROUTE_SUPERVISOR, category=best, method="keyword_disagrees", scores=scores)
+
+        if scores[best] >= self.min_similarity and margin >= self.min_margin:
+            return RouteDecision(ROUTE_EXPERT, category=best, method="embedding", confidence=scores[best], scores=scores)
+        return RouteDecision(ROUTE_SUPERVISOR, category=best, method="low_confidence", scores=scores)
+
+    # -- metrics --------------------------------------------------------------
+
+    def _record(self, decision: RouteDecision):
+        key = f"{decision.route}:{decision.method}"
+        with self._stats_lock:
+            self._routes[key] = self._routes.get(key, 0) + 1
+            self._latencies_ms.append(decision.latency_ms)
+
+    def record_supervisor_choice(self, decision: Optional[dict], categories: Sequence[str]):
+        """
+        Shadow accuracy: when the supervisor handled a message the router
+        passed on, compare the router's best guess with the experts the
+        supervisor actually called.
+        """
+        if not decision or not decision.get("category") or not categories:
+            return
+        with self._stats_lock:
+            key = "agreed" if list(categories) == [decision["category"]] else "disagreed"
+            self._supervisor_agreement[key] += 1
+
+    def evaluate(self, examples: Sequence[Tuple[str, str]]) -> dict:
+        """
+        Routes labelled (text, category) examples without recording them in
+        the live counters. Accuracy counts only the messages routed directly
+        to an expert; coverage is the share that skipped the supervisor.
+        """
+        routed = correct = 0
+        for text, category in examples:
+            decision = self._classify(text, has_history=False)
+            if decision.route == ROUTE_EXPERT:
+                routed += 1
+                correct += decision.category == category
+        return {
+            "examples": len(examples),
+            "routed_directly": routed,
+            "coverage": round(routed / len(examples), 4) if examples else 0.0,
+            "accuracy": round(correct / routed, 4) if routed else None,
+        }
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            routes = dict(self._routes)
+            latencies = sorted(self._latencies_ms)
+            agreement = dict(self._supervisor_agreement)
+        total = sum(routes.values())
+        fast = sum(count for key, count in routes.items() if not key.startswith(ROUTE_SUPERVISOR))
+        compared = agreement["agreed"] + agreement["disagreed"]
+        return {
+            "enabled": settings.FAST_ROUTER_ENABLED,
+            "messages": total,
+            "fast_path": fast,
+            "fast_path_rate": round(fast / total, 4) if total else 0.0,
+            "routes": routes,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+                "p50": round(latencies[len(latencies) // 2], 3) if latencies else 0.0,
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else 0.0,
+            },
+            "supervisor_agreement": {
+                **agreement,
+                "rate": round(agreement["agreed"] / compared, 4) if compared else None,
+            },
+            "training_examples": dict(self._example_counts),
+            "holdout_evaluation": self._evaluation,
+        }
+
+
+def load_history_examples(limit: int) -> List[Tuple[str, str]]:
+    """
+    (question, category) pairs from the chat history: each human message
+    followed by an AI answer whose agent_name names one expert.
+    """
+    from app.database.database import SessionLocal
+    from app.models.session import ChatMessage
+
+    with SessionLocal() as db:
+        recent = (
+            db.query(ChatMessage.session_id, ChatMessage.sender, ChatMessage.content, ChatMessage.agent_name, ChatMessage.created_at)
+            .order_by(ChatMessage.created_at.desc())
+            .limit(limit * 2)
+            .all()
+        )
+    messages = sorted(recent, key=lambda row: (row.session_id, row.created_at))
+
+    examples = []
+    for previous, current in zip(messages, messages[1:]):
+        if previous.session_id != current.session_id or previous.sender != "human" or current.sender != "ai":
+            continue
+        category = AGENT_NAME_CATEGORIES.get((current.agent_name or "").strip().lower())
+        if category:
+            examples.append((previous.content, category))
+    return examples[:limit]
+
+
+fast_router = FastPathRouter(
+    min_similarity=settings.FAST_ROUTER_MIN_SIMILARITY,
+    min_margin=settings.FAST_ROUTER_MIN_MARGIN,
+    max_words=settings.FAST_ROUTER_MAX_WORDS,
+)
@@ -1,9 +1,11 @@
 # app/agents/state.py
-from typing import List, TypedDict, Annotated
+from typing import List, NotRequired, Optional, TypedDict, Annotated
 from langchain_core.messages import BaseMessage
 import operator
 
 MessagesState = Annotated[List[BaseMessage], operator.add]
 
 class AgentState(TypedDict):
-    messages: MessagesState
\ No newline at end of file
+    messages: MessagesState
+    # Set by the supervisor graph's fast-path router (see fast_router.RouteDecision.as_dict).
+    route: NotRequired[Optional[dict]]
\ No newline at end of file
@@ -0,0 +1,103 @@
+import re
+import uuid
+from typing import Optional, Tuple
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from app.agents.state import AgentState
+from app.core.config import settings
+from app.rag.model_numbers import extract_model_numbers
+from app.rag.retrievers import aretrieve_context, retrieve_context
+from app.tools.rag_search_tool import retrieve_knowledge
+
+SUB_AGENT_MODES = ("retrieve_first", "agentic")
+
+# Appended to an expert's system prompt in "retrieve_first" mode.
+PREFETCH_PROMPT_ADDENDUM = """
+**Retrieved Context:** The `retrieve-knowledge` tool has already been run with the user's question and its result is in the conversation. Answer from it directly. Only call the tool again if that context does not contain what you need (for example, to search for a different part, setting, or error code).
+"""
+
+# Conversational lead-ins that add nothing to a search query.
+_FILLER_RE = re.compile(
+    r"^(?:(?:hi|hello|hey|please|thanks|thank you|ok|okay|so|um|uh)\b[\s,!.]*)+"
+    r"|^(?:can|could|would) you (?:please )?(?:tell me|explain|help me(?: understand)?)\s*"
+    r"|^i (?:want|would like|need) to know\s*",
+    re.IGNORECASE,
+)
+
+
+def use_retrieve_first() -> bool:
+    if settings.SUB_AGENT_MODE not in SUB_AGENT_MODES:
+        raise ValueError(f"Unknown SUB_AGENT_MODE '{settings.SUB_AGENT_MODE}'. Valid modes are: {SUB_AGENT_MODES}")
+    return settings.SUB_AGENT_MODE == "retrieve_first"
+
+
+def rewrite_query(question: str) -> Tuple[str, Optional[str]]:
+    """
+    Cheap local rewrite of a question into a search query: conversational
+    lead-ins are dropped, and a single model number mentioned in it is
+    returned separately so the search can be limited to that model's manuals.
+    """
+    query = question.strip()
+    while True:
+        stripped = _FILLER_RE.sub("", query, count=1).strip()
+        if stripped == query or not stripped:
+            break
+        query = stripped
+    model_numbers = extract_model_numbers(question)
+    return query, model_numbers[0] if len(model_numbers) == 1 else None
+
+
+def _prefetch_messages(product_category: str, query: str, model_number: Optional[str], context: str) -> dict:
+    # Recorded as a completed tool call, so the model sees the same shape as
+    # when it searches itself and can follow up with further searches.
+    args = {"query": query, "product_category": product_category}
+    if model_number:
+        args["model_number"] = model_number
+    tool_call_id = f"prefetch_{uuid.uuid4().hex}"
+    return {
+        "messages": [
+            AIMessage(content="", tool_calls=[{"name": retrieve_knowledge.name, "args": args, "id": tool_call_id}]),
+            ToolMessage(content=context, name=retrieve_knowledge.name, tool_call_id=tool_call_id),
+        ]
+    }
+
+
+def _latest_question(state: AgentState) -> Optional[str]:
+    last = state["messages"][-1]
+    return last.content if isinstance(last, HumanMessage) else None
+
+
+def make_prefetch_nodes(product_category: str):
+    """
+    Returns the (sync, async) node functions that retrieve context for the
+    latest question before the expert's first model call.
+    """
+
+    def prefetch_node(state: AgentState):
+        question = _latest_question(state)
+        if not question:
+            return {"messages": []}
+        query, model_number = rewrite_query(question)
+        print(f"    Prefetching {product_category} context for: {query}")
+        try:
+            context = retrieve_context(product_category, query, model_number=model_number)
+        except Exception as e:
+            print(f"    Prefetch failed, the agent will search itself: {e}")
+            return {"messages": []}
+        return _prefetch_messages(product_category, query, model_number, context)
+
+    async def aprefetch_node(state: AgentState):
+        question = _latest_question(state)
+        if not question:
+            return {"messages": []}
+        query, model_number = rewrite_query(question)
+        print(f"    Prefetching {product_category} context for: {query} (async)")
+        try:
+            context = await aretrieve_context(product_category, query, model_number=model_number)
+        except Exception as e:
+            print(f"    Prefetch failed, the agent will search itself: {e}")
+            return {"messages": []}
+        return _prefetch_messages(product_category, query, model_number, context)
+
+    return prefetch_node, aprefetch_node
@@ -1,6 +1,8 @@
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableLambda
 from app.agents.state import AgentState
+from app.agents.sub_agents.prefetch import PREFETCH_PROMPT_ADDENDUM, make_prefetch_nodes, use_retrieve_first
 from app.rag.generators import get_sub_agent_model
 from app.tools.rag_search_tool import retrieve_knowledge
 
@@ -23,6 +25,9 @@ system_prompt = (
 """
 )
 
+if use_retrieve_first():
+    system_prompt += PREFETCH_PROMPT_ADDENDUM
+
 model_with_tools = sub_agent_model.bind_tools(tools)
 
 def agent_node(state: AgentState):
@@ -36,6 +41,17 @@ def agent_node(state: AgentState):
     response = model_with_tools.invoke(messages_with_system)
     return {"messages": [response]}
 
+async def aagent_node(state: AgentState):
+    """
+    Async variant of `agent_node`, used when the graph runs on the event loop
+    so the Gemini call does not occupy a worker thread.
+    """
+    print("REFRIGERATOR SUB-AGENT (async)")
+    from langchain_core.messages import SystemMessage
+    messages_with_system = [SystemMessage(content=system_prompt)] + state["messages"]
+    response = await model_with_tools.ainvoke(messages_with_system)
+    return {"messages": [response]}
+
 def should_continue(state: AgentState):
     """
     Determines if the sub-agent should continue processing or terminate.
@@ -49,10 +65,17 @@ def should_continue(state: AgentState):
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("agent", agent_node)
+workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
 workflow.add_node("tools", tool_node)
 
-workflow.set_entry_point("agent")
+if use_retrieve_first():
+    # Search with the user's question first, so the model answers in one call.
+    prefetch_node, aprefetch_node = make_prefetch_nodes("refrigerator")
+    workflow.add_node("retrieve", RunnableLambda(prefetch_node, afunc=aprefetch_node, name="refrigerator_retrieve"))
+    workflow.set_entry_point("retrieve")
+    workflow.add_edge("retrieve", "agent")
+else:
+    workflow.set_entry_point("agent")
 
 workflow.add_conditional_edges("agent",
         should_continue, {
@@ -6,6 +6,18 @@ from pathlib import Path
 # Get the backend directory (parent of app directory)
 BACKEND_DIR = Path(__file__).parent.parent.parent
 
+
+def async_database_url(url: str) -> str:
+    """The asyncio-driver equivalent of a sync SQLAlchemy URL (asyncpg for Postgres)."""
+    scheme, _, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite://{rest}"
+    return url
+
+
 class Settings(BaseSettings):
     GOOGLE_API_KEY: Optional[str] = None
 
@@ -15,7 +27,99 @@ class Settings(BaseSettings):
     WASHING_MACHINE_MODEL: str = "gemini-2.5-flash"
     AC_MODEL: str = "gemini-2.5-flash"
     REFRIGERATOR_MODEL: str = "gemini-2.5-flash"
+    SUMMARY_MODEL: str = "gemini-2.5-flash"
+
+    #expert sub-agents: "retrieve_first" searches with the question before the one generation call
+    #(the model can still search again); "agentic" lets the model write the first query itself
+    SUB_AGENT_MODE: str = "retrieve_first"
+
+    #local embedding model - loaded once per process and shared
+    EMBEDDING_MODEL_NAME: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_DEVICE: str = "cpu"  # Change to 'cuda' if you have GPU
+    EMBEDDING_NORMALIZE: bool = True
+    EMBEDDING_WARMUP_ON_STARTUP: bool = True
+
+    #retrieval caches - query embeddings and formatted retrieval results
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    QUERY_EMBEDDING_CACHE_SIZE: int = 4096
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS: float = 24 * 3600
+    RETRIEVAL_RESULT_CACHE_SIZE: int = 2048
+    RETRIEVAL_RESULT_CACHE_TTL_SECONDS: float = 3600
+
+    #retrieval mode - "hybrid" (BM25 + vector, reciprocal rank fusion), "mmr" or "fast_mmr" (vectorized)
+    RETRIEVAL_SEARCH_MODE: str = "mmr"
+    HYBRID_RRF_K: int = 60
+    FAST_MMR_FETCH_K: int = 100
+
+    #optional cross-encoder rerank of first-stage candidates
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL_NAME: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20  # first-stage candidates scored per query
+    RERANK_MAX_TOKENS: int = 256  # (query, passage) pairs are truncated to this many tokens
+    RERANK_TIME_BUDGET_MS: float = 400.0  # fall back to first-stage ranking past this; 0 = no limit
+    RERANK_CACHE_SIZE: int = 20000
+    RERANK_CACHE_TTL_SECONDS: float = 24 * 3600
+
+    #context assembly - retrieved chunks are merged, deduplicated and trimmed before generation
+    RETRIEVAL_CONTEXT_TOKEN_BUDGET: int = 2000  # per retrieve-knowledge call; 0 = no limit
+    CONTEXT_DEDUP_MIN_LINE_CHARS: int = 40  # shorter lines are never treated as repeated boilerplate
+
+    #semantic answer cache in front of the expert sub-agents
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_PATH: str = str(BACKEND_DIR / "data" / "cache" / "answer_cache.sqlite3")
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.92
+    ANSWER_CACHE_MAX_ENTRIES_PER_CATEGORY: int = 256
+    ANSWER_CACHE_TTL_SECONDS: Optional[float] = 7 * 24 * 3600
+
+    #conversation context sent to the agents - recent turns verbatim, older ones as a rolling summary
+    CONTEXT_MAX_TURNS: int = 6  # user + assistant message pairs kept verbatim
+    CONTEXT_TOKEN_BUDGET: int = 4000  # estimated tokens for the verbatim messages
+    CONTEXT_SUMMARY_ENABLED: bool = True
+    CONTEXT_SUMMARY_BATCH: int = 4  # update the summary once this many messages have left the window
+    CONTEXT_SUMMARY_MAX_WORDS: int = 250
 
+    #fast-path router in front of the supervisor (no LLM call for small talk and clear single-product questions)
+    FAST_ROUTER_ENABLED: bool = True
+    FAST_ROUTER_MIN_SIMILARITY: float = 0.45  # embedding-only routes need this similarity to a category...
+    FAST_ROUTER_MIN_MARGIN: float = 0.10  # ...and this lead over the runner-up
+    FAST_ROUTER_MAX_WORDS: int = 40  # longer messages go to the supervisor
+    FAST_ROUTER_HISTORY_LIMIT: int = 2000  # past chat turns used as training examples
+    FAST_ROUTER_HOLDOUT_EVERY: int = 5  # every n-th history example is held out to measure accuracy
+
+    #pdf parsing - large manuals are split into page shards across a process pool
+    PDF_PARSE_WORKERS: int = 0  # 0 = one less than the number of CPU cores, 1 = sequential
+    PDF_PARALLEL_MIN_PAGES: int = 24
+    PDF_PARSE_PAGES_PER_SHARD: int = 8
+
+    #ocr for scanned pages - parallel tesseract workers with adaptive DPI
+    OCR_WORKERS: int = 0  # 0 = half the number of CPU cores
+    OCR_INITIAL_DPI: int = 200
+    OCR_MAX_DPI: int = 300
+    OCR_MIN_CONFIDENCE: float = 70.0
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_DIR: str = str(BACKEND_DIR / "data" / "cache" / "ocr")
+
+    #uploads are streamed to disk in chunks, never buffered whole
+    MAX_UPLOAD_BYTES: int = 512 * 1024 * 1024  # per file
+    MAX_BATCH_UPLOAD_BYTES: int = 4 * 1024 * 1024 * 1024  # whole /upload/batch request body
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+    #streaming ingestion pipeline (parse -> chunk -> embed -> upsert)
+    INGEST_EMBED_BATCH_SIZE: int = 64
+    INGEST_QUEUE_SIZE: int = 4  # bounded hand-off queues between stages, in batches
+    INGEST_PROGRESS_INTERVAL_SECONDS: float = 2.0
+
+    #background ingestion jobs
+    INGEST_JOB_WORKERS: int = 2  # ingestions that may run at once (writes are still serialized per category)
+    INGEST_JOB_RESUME_ON_STARTUP: bool = True
+    INGEST_JOB_MAX_ATTEMPTS: int = 3
+    INGEST_JOB_PROGRESS_HISTORY: int = 500  # messages kept in memory for re-attaching streams
+    INGEST_RECONCILE_ON_STARTUP: bool = True  # drop chunks no manifest references (left by killed ingestions)
+
+    #bulk ingestion (scripts/bulk_ingest.py and /knowledge/upload/batch)
+    BULK_INGEST_WORKERS: int = 0  # 0 = one less than the number of CPU cores
+    BULK_INGEST_EMBED_BATCH_SIZE: int = 256  # chunks pooled across manuals per embedding call
+    BULK_INGEST_REPORT_DIR: str = str(BACKEND_DIR / "data" / "reports")
 
     #chroma db paths - using absolute paths
     CHROMA_DB_DIR: str = str(BACKEND_DIR / "chroma_dbs")
@@ -46,6 +150,28 @@ class Settings(BaseSettings):
     
     # Database URL - can be set directly or will be constructed from components above
     DATABASE_URL: Optional[str] = None
+    # Async (asyncpg) URL used by the chat and health routers - derived from DATABASE_URL if not set
+    ASYNC_DATABASE_URL: Optional[str] = None
+
+    # Connection pools - applied to both the sync and the async engine
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds; replaces connections dropped by the server or a proxy
+    DB_POOL_PRE_PING: bool = True
+
+    # Keyset pagination of the chat session list and message history (opt-in via ?limit=)
+    CHAT_PAGE_SIZE_MAX: int = 500
+
+    # Group commit of AI messages saved at the end of a stream (app/services/message_store.py)
+    MESSAGE_GROUP_COMMIT_ENABLED: bool = False
+    MESSAGE_GROUP_COMMIT_WINDOW_MS: float = 0.0  # extra wait to gather a batch; 0 = only batch what is already queued
+    MESSAGE_GROUP_COMMIT_MAX_BATCH: int = 64
+
+    # Chat SSE stream - tokens are coalesced into fewer frames (flush every N ms or M bytes)
+    SSE_COALESCE_TOKENS: bool = True
+    SSE_TOKEN_FLUSH_MS: float = 50.0
+    SSE_TOKEN_FLUSH_BYTES: int = 256
 
     PROJECT_NAME: str = "Multi-Agent RAG Chatbot"
 
@@ -61,5 +187,7 @@ class Settings(BaseSettings):
                 f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
                 f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
             )
+        if not self.ASYNC_DATABASE_URL:
+            self.ASYNC_DATABASE_URL = async_database_url(self.DATABASE_URL)
 
 settings = Settings()
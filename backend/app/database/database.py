@@ -1,13 +1,106 @@
-from sqlalchemy import create_engine
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
+
+def _pool_kwargs(url: str) -> dict:
+    # SQLite (local development) uses its own single-file pools without these options.
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+engine = create_engine(settings.DATABASE_URL, **_pool_kwargs(settings.DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Used by code running on the event loop (the chat and health routers), so a
+# slow query waits on the socket instead of blocking every other request.
+async_engine = create_async_engine(settings.ASYNC_DATABASE_URL, **_pool_kwargs(settings.ASYNC_DATABASE_URL))
+# Objects stay readable after commit; reloading expired attributes would need an await.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+
+class PoolMetrics:
+    """Checkout counters and peak usage of one engine's connection pool."""
+
+    def __init__(self, name: str, engine: Engine):
+        self.name = name
+        self.engine = engine
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.peak_checked_out = 0
+        self.connections_opened = 0
+        self.invalidated = 0
+        self._checked_out = 0
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connections_opened += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self._checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self._checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self._checked_out = max(0, self._checked_out - 1)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidated += 1
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            stats = {
+                "pool": type(pool).__name__,
+                "checked_out": self._checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "connections_opened": self.connections_opened,
+                "invalidated": self.invalidated,
+            }
+        # Only queue pools have a fixed size and overflow.
+        if hasattr(pool, "size") and hasattr(pool, "overflow"):
+            max_overflow = max(0, getattr(pool, "_max_overflow", settings.DB_MAX_OVERFLOW))
+            capacity = pool.size() + max_overflow
+            stats.update({
+                "size": pool.size(),
+                "max_overflow": max_overflow,
+                "idle": pool.checkedin(),
+                "overflow": max(0, pool.overflow()),
+                "utilization": round(pool.checkedout() / capacity, 4) if capacity else 0.0,
+            })
+        return stats
+
+
+_pool_metrics = [PoolMetrics("sync", engine), PoolMetrics("async", async_engine.sync_engine)]
+
+
+def get_pool_stats() -> dict:
+    return {metrics.name: metrics.stats() for metrics in _pool_metrics}
+
+
 def get_db():
     """
     A FastAPI dependency that manages the lifecycle of a database session for each request.
@@ -17,4 +110,13 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    """
+    The asyncio counterpart of `get_db`, for `async def` endpoints: queries
+    are awaited instead of blocking the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,11 +1,79 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
 from starlette.middleware.cors import CORSMiddleware 
 from .core.config import settings
 from app.routers import knowledge, chat, health
+from app.routers.chat import NEXT_CURSOR_HEADER
+from app.rag.embeddings import warmup_embedding_model
+from app.agents.fast_router import fast_router
+from app.rag.rerankers import warmup_cross_encoder
+from app.services.ingestion_jobs import ingestion_job_manager
+from app.services.ingestion_service import reconcile_collection
+from app.services.message_store import message_writer
+from app.services.upload_storage import MULTIPART_OVERHEAD_BYTES, UploadSizeLimitMiddleware
+from app.utils.streaming import HAS_ORJSON
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.EMBEDDING_WARMUP_ON_STARTUP:
+        try:
+            await asyncio.to_thread(warmup_embedding_model)
+        except Exception as e:
+            logger.warning(f"Embedding model warmup failed, it will be loaded on first use: {e}")
+    if settings.RERANK_ENABLED:
+        try:
+            await asyncio.to_thread(warmup_cross_encoder)
+        except Exception as e:
+            logger.warning(f"Cross-encoder warmup failed, it will be loaded on first use: {e}")
+    if settings.FAST_ROUTER_ENABLED:
+        try:
+            await asyncio.to_thread(fast_router.fit_from_history)
+        except Exception as e:
+            logger.warning(f"Could not train the fast-path router from chat history, using seed examples only: {e}")
+    if settings.INGEST_RECONCILE_ON_STARTUP:
+        # Before any job resumes, so only leftovers of a previous run are removed.
+        for product_type in settings.VALID_PRODUCT_TYPES:
+            try:
+                await reconcile_collection(product_type, lock_timeout=0)
+            except TimeoutError:
+                logger.warning(f"Skipped reconciling {product_type}: another process is ingesting into it")
+            except Exception as e:
+                logger.warning(f"Could not reconcile the {product_type} collection with its manifest: {e}")
+    await ingestion_job_manager.start()
+    if settings.MESSAGE_GROUP_COMMIT_ENABLED:
+        await message_writer.start()
+    try:
+        yield
+    finally:
+        await message_writer.stop()
+        await ingestion_job_manager.stop()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    description="Backend for a multi-agent RAG chatbot system."
+    description="Backend for a multi-agent RAG chatbot system.",
+    lifespan=lifespan,
+    # orjson renders large list responses (sessions, history) several times faster.
+    default_response_class=ORJSONResponse if HAS_ORJSON else JSONResponse,
+)
+
+# Oversized uploads are refused before their body is spooled to disk. Added
+# before CORS so the 413 responses still carry CORS headers.
+_knowledge_prefix = f"/api/v1{knowledge.router.prefix}"
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        f"{_knowledge_prefix}/upload/stream": settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        f"{_knowledge_prefix}/jobs": settings.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        f"{_knowledge_prefix}/upload/batch": settings.MAX_BATCH_UPLOAD_BYTES,
+    },
 )
 
 app.add_middleware(
@@ -19,6 +87,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
@@ -0,0 +1,35 @@
+import uuid
+from sqlalchemy import Column, String, TIMESTAMP, JSON, Integer, Text, Index, func
+
+from app.database.database import Base
+
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    product_type = Column(String(50), nullable=False)
+    file_name = Column(String(255), nullable=False)
+    pdf_path = Column(String, nullable=False)
+    file_hash = Column(String(64), nullable=True)
+    # 'queued', 'running', 'succeeded', 'skipped' or 'failed'
+    status = Column(String(20), nullable=False, default="queued")
+    message = Column(Text, nullable=True)  # latest progress message
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(
+        TIMESTAMP(timezone=True), server_default=func.now(), nullable=False
+    )
+    updated_at = Column(
+        TIMESTAMP(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False
+    )
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_ingestion_jobs_status_created_at", "status", "created_at"),
+    )
@@ -1,11 +1,13 @@
 import uuid 
-from sqlalchemy import Column, String,TIMESTAMP, ForeignKey, JSON , BigInteger, func
+from sqlalchemy import Column, String,TIMESTAMP, ForeignKey, JSON , BigInteger, Text, Index, func
 from sqlalchemy.orm import relationship
 
 from app.database.database import Base
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    # Keyset pagination of the session list (migrations/add_pagination_indexes.sql).
+    __table_args__ = (Index("ix_chat_sessions_updated_at_id", "updated_at", "id"),)
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     title = Column(String(255), nullable=True)
@@ -18,6 +20,10 @@ class ChatSession(Base):
         onupdate=func.now(),
         nullable=False
     )
+    # Rolling summary of the messages up to and including summary_message_id
+    # (see app/services/conversation_context.py).
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(BigInteger, nullable=True)
     messages = relationship(
         "ChatMessage", back_populates="session", cascade="all, delete-orphan"
     )
@@ -25,6 +31,8 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    # Keyset pagination of a session's history (migrations/add_pagination_indexes.sql).
+    __table_args__ = (Index("ix_chat_messages_session_id_created_at_id", "session_id", "created_at", "id"),)
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     session_id = Column(
@@ -0,0 +1,140 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+_MISSING = object()
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases and collapses whitespace so trivially different phrasings share a cache entry."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class TTLCache:
+    """
+    A thread-safe LRU cache whose entries also expire after `ttl_seconds`.
+
+    Tracks hits, misses and evictions so the retrieval path can report how
+    effective each tier is.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl_seconds: Optional[float] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Removes every entry whose key matches `predicate`; returns how many were dropped."""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Tier 1: normalized query -> embedding vector (independent of any collection).
+query_embedding_cache = TTLCache(
+    "query_embeddings",
+    maxsize=settings.QUERY_EMBEDDING_CACHE_SIZE,
+    ttl_seconds=settings.QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+)
+
+# Tier 2: (category, query, k, search params, collection version) -> formatted context.
+retrieval_result_cache = TTLCache(
+    "retrieval_results",
+    maxsize=settings.RETRIEVAL_RESULT_CACHE_SIZE,
+    ttl_seconds=settings.RETRIEVAL_RESULT_CACHE_TTL_SECONDS,
+)
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an embedding model and memoizes `embed_query` through the shared
+    query embedding cache. Document embedding (ingestion) is passed through.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_key: Hashable):
+        self.embeddings = embeddings
+        self.model_key = model_key
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if not settings.RETRIEVAL_CACHE_ENABLED:
+            return self.embeddings.embed_query(text)
+
+        key = (self.model_key, normalize_query(text))
+        vector = query_embedding_cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            query_embedding_cache.set(key, vector)
+        return vector
+
+
+def invalidate_category(product_category: str) -> int:
+    """Drops every cached retrieval result for a category after its collection changed."""
+    return retrieval_result_cache.invalidate_where(lambda key: key[0] == product_category)
+
+
+def get_cache_stats() -> dict:
+    return {
+        "enabled": settings.RETRIEVAL_CACHE_ENABLED,
+        "tiers": [query_embedding_cache.stats(), retrieval_result_cache.stats()],
+    }
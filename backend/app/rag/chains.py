@@ -1,10 +1,226 @@
-from typing import List
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
 from langchain_core.documents import Document
 
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio, enough to keep prompts inside a budget.
+CHARS_PER_TOKEN = 4
+# Shortest suffix/prefix match accepted as splitter overlap between two chunks.
+_MIN_OVERLAP_CHARS = 20
+# Chunks whose word sets overlap at least this much are treated as duplicates.
+_NEAR_DUPLICATE_JACCARD = 0.9
+
+_stats_lock = threading.Lock()
+_stats = {"calls": 0, "chunks_in": 0, "blocks_out": 0, "merged": 0, "duplicates_removed": 0,
+          "lines_removed": 0, "dropped_for_budget": 0, "tokens_in": 0, "tokens_out": 0}
+
+
 def format_docs(docs: List[Document]) -> str:
     """
     A helper utility that takes a list of LangChain Document objects and
     formats their page_content into a single string, separated by newlines.
     This prepares the retrieved context to be easily readable by an LLM.
     """
-    return "\n\n".join(doc.page_content for doc in docs)
\ No newline at end of file
+    return "\n\n".join(doc.page_content for doc in docs)
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`, shared by every prompt budget."""
+    return len(text) // CHARS_PER_TOKEN + 1 if text else 0
+
+
+class _Block:
+    """One or more merged chunks of the same manual."""
+
+    def __init__(self, doc: Document, rank: int):
+        metadata = doc.metadata or {}
+        page = metadata.get("page_number")
+        self.source = metadata.get("source") or "unknown"
+        self.page_start = metadata.get("page_start", page)
+        self.page_end = metadata.get("page_end", page)
+        self.text = doc.page_content.strip()
+        self.rank = rank  # best (lowest) retrieval rank among the merged chunks
+
+    def pages_touch(self, other: "_Block") -> bool:
+        if None in (self.page_start, self.page_end, other.page_start, other.page_end):
+            return False
+        return self.page_start <= other.page_end + 1 and other.page_start <= self.page_end + 1
+
+    def absorb(self, other: "_Block", text: str):
+        self.text = text
+        self.rank = min(self.rank, other.rank)
+        if other.page_start is not None:
+            self.page_start = other.page_start if self.page_start is None else min(self.page_start, other.page_start)
+            self.page_end = other.page_end if self.page_end is None else max(self.page_end, other.page_end)
+
+    def header(self) -> str:
+        if self.page_start is None:
+            return f"[Source: {self.source}]"
+        if self.page_start == self.page_end:
+            return f"[Source: {self.source}, page {self.page_start}]"
+        return f"[Source: {self.source}, pages {self.page_start}-{self.page_end}]"
+
+    def render(self) -> str:
+        return f"{self.header()}\n{self.text}"
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is a prefix of `right`."""
+    limit = min(len(left), len(right))
+    for size in range(limit, _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _merged_text(a: str, b: str) -> Optional[str]:
+    """`a` and `b` joined without their shared text, or None if they do not overlap."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    size = _overlap(a, b)
+    if size:
+        return a + b[size:]
+    size = _overlap(b, a)
+    if size:
+        return b + a[size:]
+    return None
+
+
+def _merge_blocks(blocks: List[_Block]) -> Tuple[List[_Block], int]:
+    merged = 0
+    changed = True
+    while changed:
+        changed = False
+        for i, block in enumerate(blocks):
+            for j in range(i + 1, len(blocks)):
+                other = blocks[j]
+                if block.source != other.source or not block.pages_touch(other):
+                    continue
+                text = _merged_text(block.text, other.text)
+                if text is not None:
+                    block.absorb(other, text)
+                    del blocks[j]
+                    merged += 1
+                    changed = True
+                    break
+            if changed:
+                break
+    return blocks, merged
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _remove_near_duplicates(blocks: List[_Block]) -> Tuple[List[_Block], int]:
+    """Drops chunks that are near-duplicates of a better-ranked one, e.g. the same notice in two manuals."""
+    kept: List[_Block] = []
+    word_sets: List[set] = []
+    for block in sorted(blocks, key=lambda b: b.rank):
+        words = set(_normalize(block.text).split())
+        if any(words and len(words & seen) / len(words | seen) >= _NEAR_DUPLICATE_JACCARD for seen in word_sets):
+            continue
+        kept.append(block)
+        word_sets.append(words)
+    return kept, len(blocks) - len(kept)
+
+
+def _remove_repeated_lines(blocks: List[_Block]) -> Tuple[List[_Block], int]:
+    """Keeps only the first copy of long repeated lines, such as warnings printed on every page."""
+    seen_lines = set()
+    lines_removed = 0
+    for block in sorted(blocks, key=lambda b: b.rank):
+        lines = []
+        for line in block.text.split("\n"):
+            key = _normalize(line)
+            if len(key) >= settings.CONTEXT_DEDUP_MIN_LINE_CHARS:
+                if key in seen_lines:
+                    lines_removed += 1
+                    continue
+                seen_lines.add(key)
+            lines.append(line)
+        block.text = "\n".join(lines).strip()
+    return [block for block in blocks if block.text], lines_removed
+
+
+def _fit_budget(blocks: List[_Block], token_budget: int) -> Tuple[List[_Block], int]:
+    """Most relevant blocks that fit the budget; the best one is truncated to fit if needed."""
+    if token_budget <= 0:
+        return blocks, 0
+    selected = []
+    used = 0
+    for block in sorted(blocks, key=lambda b: b.rank):
+        tokens = estimate_tokens(block.render())
+        if used + tokens <= token_budget:
+            selected.append(block)
+            used += tokens
+        elif not selected:
+            block.text = block.text[:max(0, token_budget * CHARS_PER_TOKEN - len(block.header()) - 1)]
+            selected.append(block)
+            used = token_budget
+    return selected, len(blocks) - len(selected)
+
+
+def assemble_context(docs: List[Document], token_budget: Optional[int] = None) -> str:
+    """
+    Turns retrieved chunks into the context passed to the model.
+
+    Near-duplicate chunks are dropped, then chunks of the same manual on the
+    same or adjacent pages that overlap (the splitter repeats up to
+    `chunk_overlap` characters between neighbours) are merged into one block,
+    and repeated boilerplate lines are removed. The most relevant blocks are kept up to `token_budget`
+    (RETRIEVAL_CONTEXT_TOKEN_BUDGET), then emitted grouped by manual, in page
+    order, each with a short source/page header. Token savings against a plain
+    join are tracked and reported by `get_context_assembly_stats`.
+    """
+    if not docs:
+        return ""
+    token_budget = settings.RETRIEVAL_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+
+    blocks = [_Block(doc, rank) for rank, doc in enumerate(docs) if doc.page_content.strip()]
+    blocks, duplicates = _remove_near_duplicates(blocks)
+    blocks, merged = _merge_blocks(blocks)
+    blocks, lines_removed = _remove_repeated_lines(blocks)
+    blocks, dropped = _fit_budget(blocks, token_budget)
+
+    # Manuals in order of their best-ranked block; pages in reading order within each.
+    source_rank: Dict[str, int] = {}
+    for block in blocks:
+        source_rank[block.source] = min(source_rank.get(block.source, block.rank), block.rank)
+    blocks.sort(key=lambda b: (source_rank[b.source], b.source, b.page_start if b.page_start is not None else 0))
+    context = "\n\n".join(block.render() for block in blocks)
+
+    tokens_in = estimate_tokens(format_docs(docs))
+    tokens_out = estimate_tokens(context)
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["chunks_in"] += len(docs)
+        _stats["blocks_out"] += len(blocks)
+        _stats["merged"] += merged
+        _stats["duplicates_removed"] += duplicates
+        _stats["lines_removed"] += lines_removed
+        _stats["dropped_for_budget"] += dropped
+        _stats["tokens_in"] += tokens_in
+        _stats["tokens_out"] += tokens_out
+    logger.info(
+        f"Assembled context: {len(docs)} chunks -> {len(blocks)} blocks, ~{tokens_in} -> ~{tokens_out} tokens "
+        f"({merged} merged, {duplicates} duplicates, {lines_removed} repeated lines, {dropped} over budget)"
+    )
+    return context
+
+
+def get_context_assembly_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["tokens_saved"] = stats["tokens_in"] - stats["tokens_out"]
+    stats["saved_ratio"] = round(stats["tokens_saved"] / stats["tokens_in"], 4) if stats["tokens_in"] else 0.0
+    stats["token_budget"] = settings.RETRIEVAL_CONTEXT_TOKEN_BUDGET
+    return stats
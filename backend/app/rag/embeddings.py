@@ -1,21 +1,126 @@
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
 from langchain_huggingface import HuggingFaceEmbeddings
 from app.core.config import settings
 
-def get_embedding_model():
+logger = logging.getLogger(__name__)
+
+# Process-wide registry of loaded embedding models, keyed by
+# (model_name, device, normalize_embeddings). Loading sentence-transformers
+# weights is expensive, so every caller in the process shares one instance.
+_registry: Dict[Tuple[str, str, bool], HuggingFaceEmbeddings] = {}
+_load_times: Dict[Tuple[str, str, bool], float] = {}
+_registry_lock = threading.Lock()
+
+
+def _registry_key(
+    model_name: Optional[str],
+    device: Optional[str],
+    normalize_embeddings: Optional[bool],
+) -> Tuple[str, str, bool]:
+    return (
+        model_name or settings.EMBEDDING_MODEL_NAME,
+        device or settings.EMBEDDING_DEVICE,
+        settings.EMBEDDING_NORMALIZE if normalize_embeddings is None else normalize_embeddings,
+    )
+
+
+def get_embedding_model(
+    model_name: Optional[str] = None,
+    device: Optional[str] = None,
+    normalize_embeddings: Optional[bool] = None,
+) -> HuggingFaceEmbeddings:
     """
-    Returns a local HuggingFace embedding model.
-    
+    Returns a shared local HuggingFace embedding model.
+
+    The model is loaded once per (model_name, device, normalization) and reused
+    by every retrieval and ingestion call in the process.
+
     Options:
     - all-MiniLM-L6-v2: Fast, good quality (384 dimensions) - DEFAULT
     - all-mpnet-base-v2: Better quality, slower (768 dimensions)
     - BAAI/bge-large-en-v1.5: Best quality, slowest (1024 dimensions)
     """
-    
-    # Using a strong local model that runs on CPU/GPU
-    embedding_model = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'},  # Change to 'cuda' if you have GPU
-        encode_kwargs={'normalize_embeddings': True}  # For better similarity scores
-    )
-    
+    key = _registry_key(model_name, device, normalize_embeddings)
+
+    embedding_model = _registry.get(key)
+    if embedding_model is not None:
+        return embedding_model
+
+    with _registry_lock:
+        # Another thread may have finished loading while we waited for the lock.
+        embedding_model = _registry.get(key)
+        if embedding_model is not None:
+            return embedding_model
+
+        name, model_device, normalize = key
+        logger.info(f"Loading embedding model {name} on {model_device} (normalize={normalize})...")
+        start = time.perf_counter()
+        embedding_model = HuggingFaceEmbeddings(
+            model_name=name,
+            model_kwargs={'device': model_device},
+            encode_kwargs={'normalize_embeddings': normalize}  # For better similarity scores
+        )
+        _load_times[key] = time.perf_counter() - start
+        _registry[key] = embedding_model
+        logger.info(f"Loaded embedding model {name} in {_load_times[key]:.2f}s")
+
     return embedding_model
+
+
+def warmup_embedding_model(
+    model_name: Optional[str] = None,
+    device: Optional[str] = None,
+    normalize_embeddings: Optional[bool] = None,
+) -> HuggingFaceEmbeddings:
+    """
+    Loads the embedding model and runs one dummy encode so the first user query
+    does not pay for weight loading or lazy kernel initialisation.
+    """
+    embedding_model = get_embedding_model(model_name, device, normalize_embeddings)
+    embedding_model.embed_query("warmup")
+    return embedding_model
+
+
+def _model_memory_bytes(embedding_model: HuggingFaceEmbeddings) -> int:
+    """Sum of parameter and buffer sizes of the underlying torch module."""
+    client = getattr(embedding_model, "_client", None)
+    if client is None:
+        return 0
+
+    total = 0
+    for tensor in list(client.parameters()) + list(client.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def get_embedding_registry_stats() -> dict:
+    """Reports which embedding models are loaded and how much memory they hold."""
+    with _registry_lock:
+        entries = list(_registry.items())
+
+    models = []
+    for (name, device, normalize), embedding_model in entries:
+        models.append({
+            "model_name": name,
+            "device": device,
+            "normalize_embeddings": normalize,
+            "load_seconds": round(_load_times.get((name, device, normalize), 0.0), 3),
+            "memory_bytes": _model_memory_bytes(embedding_model),
+        })
+
+    return {
+        "loaded_models": len(models),
+        "total_memory_bytes": sum(m["memory_bytes"] for m in models),
+        "models": models,
+    }
+
+
+def clear_embedding_registry():
+    """Drops every cached model so the next call reloads from disk."""
+    with _registry_lock:
+        _registry.clear()
+        _load_times.clear()
@@ -35,3 +35,20 @@ def get_supervisor_model() -> ChatGoogleGenerativeAI:
         google_api_key=settings.GOOGLE_API_KEY
     )
     return llm
+
+
+def get_summary_model() -> ChatGoogleGenerativeAI:
+    """
+    Initializes the LLM that maintains the rolling summary of older
+    conversation turns. Runs in the background, never on the response path.
+    """
+
+    if not settings.GOOGLE_API_KEY:
+        raise ValueError("GOOGLE_API_KEY is not set in the environment.")
+
+    llm = ChatGoogleGenerativeAI(
+        model=settings.SUMMARY_MODEL,
+        temperature=0.0,
+        google_api_key=settings.GOOGLE_API_KEY
+    )
+    return llm
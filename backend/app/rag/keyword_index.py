@@ -0,0 +1,182 @@
+import os
+import re
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.rag.vector_store_pool import get_persist_directory
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_INDEX_FILE_NAME = "keyword_index.sqlite3"
+
+# Runs of letters/digits, optionally joined by - _ . / so model numbers and
+# error codes like "WM-1234X" or "E4.1" survive as one token.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./]")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from how i if in is it its my of on or so that the "
+    "this to was what when where which why will with you your".split()
+)
+
+_rebuild_locks: Dict[str, threading.Lock] = {}
+_rebuild_locks_guard = threading.Lock()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased keyword tokens for BM25. A compound code is indexed both
+    joined ("wm1234x") and as its parts ("wm", "1234x"), so queries match it
+    however the user writes it.
+    """
+    tokens = []
+    for match in _TOKEN_RE.findall(text.lower()):
+        parts = [part for part in _SPLIT_RE.split(match) if part]
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(parts)
+    return [token for token in tokens if token not in _STOPWORDS]
+
+
+class KeywordIndex:
+    """
+    Persisted BM25 inverted index over one category's chunks.
+
+    Backed by an SQLite FTS5 table stored next to the category's ChromaDB
+    files, so it is updated incrementally as chunks are upserted or deleted,
+    is never loaded into memory as a whole, and is wiped together with the
+    vector database. Only chunk IDs and keyword tokens are stored; the chunk
+    text and metadata stay in Chroma.
+    """
+
+    def __init__(self, product_category: str):
+        persist_directory = get_persist_directory(product_category)
+        if not persist_directory:
+            raise ValueError(f"Unknown product category: {product_category}")
+        self.product_category = product_category
+        self.path = os.path.join(persist_directory, KEYWORD_INDEX_FILE_NAME)
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_rows ("
+                "row_id INTEGER PRIMARY KEY AUTOINCREMENT, chunk_id TEXT NOT NULL UNIQUE, source TEXT)"
+            )
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(tokens)")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, chunk_ids: Sequence[str]):
+        for start in range(0, len(chunk_ids), 500):
+            batch = list(chunk_ids[start:start + 500])
+            placeholders = ",".join("?" * len(batch))
+            row_ids = [row[0] for row in conn.execute(
+                f"SELECT row_id FROM chunk_rows WHERE chunk_id IN ({placeholders})", batch
+            )]
+            if row_ids:
+                row_placeholders = ",".join("?" * len(row_ids))
+                conn.execute(f"DELETE FROM chunk_terms WHERE rowid IN ({row_placeholders})", row_ids)
+                conn.execute(f"DELETE FROM chunk_rows WHERE row_id IN ({row_placeholders})", row_ids)
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, chunk_ids: Sequence[str], texts: Sequence[str], sources: Sequence[Optional[str]]):
+        for chunk_id, text, source in zip(chunk_ids, texts, sources):
+            row_id = conn.execute(
+                "INSERT INTO chunk_rows (chunk_id, source) VALUES (?, ?)", (chunk_id, source)
+            ).lastrowid
+            conn.execute("INSERT INTO chunk_terms (rowid, tokens) VALUES (?, ?)", (row_id, " ".join(tokenize(text))))
+
+    def add(self, chunk_ids: Sequence[str], texts: Sequence[str], sources: Optional[Sequence[Optional[str]]] = None):
+        """Indexes (or re-indexes) chunks."""
+        if not chunk_ids:
+            return
+        sources = sources or [None] * len(chunk_ids)
+        with self._connect() as conn:
+            self._delete(conn, chunk_ids)
+            self._insert(conn, chunk_ids, texts, sources)
+
+    def remove(self, chunk_ids: Sequence[str]):
+        if not chunk_ids:
+            return
+        with self._connect() as conn:
+            self._delete(conn, chunk_ids)
+
+    def count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chunk_rows").fetchone()[0]
+
+    def search(self, query: str, limit: int = 20, sources: Optional[Sequence[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Top chunks by BM25 as (chunk_id, score), best first; higher scores are
+        better. `sources` restricts the search to chunks of those manuals.
+        """
+        tokens = sorted(set(tokenize(query)))
+        if not tokens:
+            return []
+        match = " OR ".join(f'"{token}"' for token in tokens)
+        sql = (
+            "SELECT chunk_rows.chunk_id, bm25(chunk_terms) AS score FROM chunk_terms "
+            "JOIN chunk_rows ON chunk_rows.row_id = chunk_terms.rowid "
+            "WHERE chunk_terms MATCH ?"
+        )
+        params: List[object] = [match]
+        if sources:
+            sql += f" AND chunk_rows.source IN ({','.join('?' * len(sources))})"
+            params.extend(sources)
+        with self._connect() as conn:
+            rows = conn.execute(sql + " ORDER BY score LIMIT ?", (*params, limit)).fetchall()
+        # FTS5's bm25() is negated so that ascending order is best-first.
+        return [(chunk_id, -score) for chunk_id, score in rows]
+
+    def rebuild(self, entries: Iterable[Tuple[str, str, Optional[str]]]):
+        """Replaces the whole index with (chunk_id, text, source) entries."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM chunk_terms")
+            conn.execute("DELETE FROM chunk_rows")
+            batch: List[Tuple[str, str, Optional[str]]] = []
+            for entry in entries:
+                batch.append(entry)
+                if len(batch) >= 1000:
+                    self._insert(conn, *zip(*batch))
+                    batch = []
+            if batch:
+                self._insert(conn, *zip(*batch))
+            conn.execute("INSERT INTO chunk_terms (chunk_terms) VALUES ('optimize')")
+
+
+def _iter_collection(collection, page_size: int = 1000):
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            yield chunk_id, text or "", (metadata or {}).get("source")
+        offset += len(page["ids"])
+
+
+def sync_keyword_index(product_category: str, collection) -> KeywordIndex:
+    """
+    Returns the category's keyword index, rebuilding it from the Chroma
+    collection when the two disagree on the number of chunks (e.g. for
+    collections ingested before the index existed).
+    """
+    index = KeywordIndex(product_category)
+    with _rebuild_locks_guard:
+        lock = _rebuild_locks.setdefault(product_category, threading.Lock())
+    with lock:
+        expected = collection.count()
+        if index.count() != expected:
+            logger.info(f"Rebuilding keyword index for {product_category} from {expected} stored chunks")
+            index.rebuild(_iter_collection(collection))
+    return index
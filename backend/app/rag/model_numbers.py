@@ -0,0 +1,76 @@
+import re
+from collections import Counter
+from typing import Iterable, List
+
+from langchain_core.documents import Document
+
+# Explicitly labelled: "Model: WM3400CW", "Model No. LRFVS-3006S", "MODEL# FFHS2611LW".
+_LABELLED_RE = re.compile(
+    r"\bmodel\s*(?:no\.?|number|#)?\s*[:#]?\s*([A-Z0-9][A-Z0-9\-/.]{3,24})",
+    re.IGNORECASE,
+)
+# Bare codes: start with a letter, mix upper-case letters and digits, at least
+# two digits, e.g. "WM3400CW", "AC-307X", "RF28R7351SR".
+_CODE_RE = re.compile(r"\b[A-Z][A-Z0-9]*(?:[-/][A-Z0-9]+)*\b")
+_SEPARATORS_RE = re.compile(r"[-/.\s]")
+# Codes that look like models but are not (matched after normalization):
+# refrigerants (R410A, R600A), standards (ISO9001, IEC 60335-2-40, UL2157,
+# EN 60335, DIN 912) and metric fastener sizes (M6X20, M8x1.25x30).
+_NOT_MODEL_RE = re.compile(
+    r"^(?:"
+    r"R\d{2,4}[A-Z]?"
+    r"|(?:ISO|IEC|UL|EN|DIN)\d+"
+    r"|M\d+(?:X\d+)+"
+    r")$"
+)
+
+
+def normalize_model_number(model_number: str) -> str:
+    """Upper-cases and drops separators so "ac-307x" and "AC 307X" compare equal."""
+    return _SEPARATORS_RE.sub("", model_number).upper()
+
+
+def _looks_like_model(code: str) -> bool:
+    normalized = normalize_model_number(code)
+    digits = sum(ch.isdigit() for ch in normalized)
+    letters = sum(ch.isalpha() for ch in normalized)
+    return 5 <= len(normalized) <= 20 and digits >= 2 and letters >= 2 and not _NOT_MODEL_RE.match(normalized)
+
+
+def extract_model_numbers(text: str) -> List[str]:
+    """Model numbers mentioned in a text, in order of first appearance, without duplicates."""
+    found = {}
+    for match in _LABELLED_RE.finditer(text):
+        code = match.group(1).strip(".-/")
+        normalized = normalize_model_number(code)
+        if any(ch.isdigit() for ch in code) and len(normalized) >= 4 and not _NOT_MODEL_RE.match(normalized):
+            found.setdefault(normalized, code.upper())
+    for match in _CODE_RE.finditer(text):
+        code = match.group(0)
+        if _looks_like_model(code):
+            found.setdefault(normalize_model_number(code), code)
+    return list(found.values())
+
+
+def top_model_numbers(per_chunk: Iterable[List[str]], limit: int = 50) -> List[str]:
+    """The model numbers a manual mentions most often, for its manifest entry."""
+    counts = Counter()
+    display = {}
+    for model_numbers in per_chunk:
+        for code in model_numbers:
+            key = normalize_model_number(code)
+            counts[key] += 1
+            display.setdefault(key, code)
+    return [display[key] for key, _ in counts.most_common(limit)]
+
+
+def annotate_model_numbers(chunk: Document) -> List[str]:
+    """
+    Stores the model numbers a chunk mentions in its metadata as a
+    comma-separated string (Chroma metadata values must be scalars) and
+    returns them.
+    """
+    model_numbers = extract_model_numbers(chunk.page_content)
+    if model_numbers:
+        chunk.metadata["model_numbers"] = ",".join(model_numbers)
+    return model_numbers
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import fitz
+import pytesseract
+from PIL import Image
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def init_ocr_worker():
+    """
+    Process-pool initializer for workers that parse PDFs side by side. Each
+    worker already runs in parallel with the others, so it OCRs one page at a
+    time (unless OCR_WORKERS is set explicitly), and Tesseract's own OpenMP
+    threads are disabled to avoid oversubscribing the CPU.
+    """
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    if settings.OCR_WORKERS <= 0:
+        settings.OCR_WORKERS = 1
+
+
+class OcrCache:
+    """
+    Persistent OCR results keyed by the SHA-256 of the rendered page image, so
+    re-uploading the same manual (under any file name) never re-runs Tesseract.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def _path(self, image_hash: str) -> str:
+        return os.path.join(self.cache_dir, image_hash[:2], f"{image_hash}.json")
+
+    def get(self, image_hash: str) -> Optional[dict]:
+        try:
+            with open(self._path(image_hash), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable OCR cache entry {image_hash}: {e}")
+            return None
+
+    def set(self, image_hash: str, result: dict):
+        path = self._path(image_hash)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write OCR cache entry {image_hash}: {e}")
+
+
+def render_page(page, dpi: int) -> Tuple[Image.Image, str]:
+    """Render a page as an 8-bit grayscale image and hash its pixels."""
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    image_hash = hashlib.sha256(
+        f"{pix.width}x{pix.height}@{dpi}:".encode() + pix.samples
+    ).hexdigest()
+    img = Image.frombytes("L", [pix.width, pix.height], pix.samples)
+    return img, image_hash
+
+
+def run_tesseract(img: Image.Image, lang: str = "eng") -> Tuple[str, float]:
+    """
+    OCR an image in a single Tesseract run, returning the text and the mean
+    word confidence (0-100). Lines and paragraphs are rebuilt from the word boxes.
+    """
+    data = pytesseract.image_to_data(img, lang=lang, output_type=pytesseract.Output.DICT)
+
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        conf = float(data["conf"][i])
+        if conf < 0 or not word.strip():
+            continue
+        confidences.append(conf)
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+
+    text_parts = []
+    previous_paragraph = None
+    for key in sorted(lines):
+        paragraph = key[:2]
+        if previous_paragraph is not None and paragraph != previous_paragraph:
+            text_parts.append("")
+        text_parts.append(" ".join(lines[key]))
+        previous_paragraph = paragraph
+
+    mean_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return "\n".join(text_parts), mean_confidence
+
+
+class OcrEngine:
+    """
+    OCRs scanned pages with a pool of parallel Tesseract workers.
+
+    Pages are first rendered at a low DPI; only pages whose mean confidence
+    falls below OCR_MIN_CONFIDENCE are re-rendered at OCR_MAX_DPI and OCR'd
+    again. Rendering stays on the calling thread because fitz documents are
+    not thread-safe; only the Tesseract calls run in the pool.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        initial_dpi: Optional[int] = None,
+        max_dpi: Optional[int] = None,
+        min_confidence: Optional[float] = None,
+        cache: Optional[OcrCache] = None,
+    ):
+        self.workers = workers or settings.OCR_WORKERS or max(1, (os.cpu_count() or 1) // 2)
+        self.initial_dpi = initial_dpi or settings.OCR_INITIAL_DPI
+        self.max_dpi = max_dpi or settings.OCR_MAX_DPI
+        self.min_confidence = settings.OCR_MIN_CONFIDENCE if min_confidence is None else min_confidence
+        self.cache = cache if cache is not None else (
+            OcrCache(settings.OCR_CACHE_DIR) if settings.OCR_CACHE_ENABLED else None
+        )
+
+    def _ocr(self, img: Image.Image) -> Tuple[str, float, float]:
+        start = time.perf_counter()
+        text, confidence = run_tesseract(img)
+        return text, confidence, (time.perf_counter() - start) * 1000
+
+    def _finish(self, fitz_doc, executor, page_num: int, image_hash: str, future, first_result: Optional[dict]):
+        """
+        Handle a completed Tesseract job. Returns (result, retry_future): a final
+        result, or a future for a high-DPI retry when confidence was poor.
+        """
+        try:
+            text, confidence, ocr_ms = future.result()
+        except Exception as ocr_error:
+            logger.error(f"  -> OCR processing failed for page {page_num}: {ocr_error}")
+            return first_result, None
+
+        if first_result is None:
+            result = {"text": text, "confidence": confidence, "dpi": self.initial_dpi, "ocr_ms": ocr_ms}
+            if confidence < self.min_confidence and self.max_dpi > self.initial_dpi:
+                logger.info(
+                    f"  -> Page {page_num} OCR confidence {confidence:.0f} at {self.initial_dpi} DPI; "
+                    f"retrying at {self.max_dpi} DPI."
+                )
+                img, _ = render_page(fitz_doc[page_num - 1], self.max_dpi)
+                return result, executor.submit(self._ocr, img)
+        elif confidence >= first_result["confidence"]:
+            result = {"text": text, "confidence": confidence, "dpi": self.max_dpi, "ocr_ms": first_result["ocr_ms"] + ocr_ms}
+        else:
+            result = {**first_result, "ocr_ms": first_result["ocr_ms"] + ocr_ms}
+
+        if self.cache:
+            self.cache.set(image_hash, {key: result[key] for key in ("text", "confidence", "dpi")})
+        return result, None
+
+    def ocr_pages(self, fitz_doc, page_numbers: List[int]) -> Dict[int, dict]:
+        """
+        OCR the given 1-based pages of an open fitz document.
+
+        Returns {page_number: {"text", "confidence", "dpi", "cached", "ocr_ms"}}.
+        Pages whose OCR fails are omitted. At most twice as many page images as
+        there are workers are held in memory at once.
+        """
+        results: Dict[int, dict] = {}
+        if not page_numbers:
+            return results
+
+        max_in_flight = self.workers * 2
+        in_flight = deque()  # (page_num, image_hash, future, first_result)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+
+            def drain_one():
+                page_num, image_hash, future, first_result = in_flight.popleft()
+                result, retry = self._finish(fitz_doc, executor, page_num, image_hash, future, first_result)
+                if retry is not None:
+                    in_flight.append((page_num, image_hash, retry, result))
+                elif result is not None:
+                    results[page_num] = {**result, "cached": False}
+
+            for page_num in page_numbers:
+                img, image_hash = render_page(fitz_doc[page_num - 1], self.initial_dpi)
+                cached = self.cache.get(image_hash) if self.cache else None
+                if cached is not None:
+                    results[page_num] = {**cached, "cached": True, "ocr_ms": 0.0}
+                    continue
+
+                in_flight.append((page_num, image_hash, executor.submit(self._ocr, img), None))
+                del img
+                while len(in_flight) >= max_in_flight:
+                    drain_one()
+
+            while in_flight:
+                drain_one()
+
+        return results
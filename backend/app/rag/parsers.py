@@ -1,91 +1,328 @@
 import os
 import fitz
+import queue
 import pdfplumber
 import logging
-from typing import List
-from PIL import Image
-import pytesseract
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.core.config import settings
+from app.rag.ocr import OcrEngine, init_ocr_worker
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def process_pdf(pdf_path: str) -> List[Document]:
-    """Extract text and tables from PDF using hybrid digital/OCR approach."""
-    logger.info(f"Starting HYBRID PDF processing for: {os.path.basename(pdf_path)}")
-    all_docs = []
+class _TableIndex:
+    """
+    Uniform-grid spatial index over table bounding boxes.
 
-    try:
-        fitz_doc = fitz.open(pdf_path)
+    Each table is registered in every grid cell it overlaps, so testing whether
+    a text block's centre lies inside a table only checks the few tables in
+    that block's cell instead of every table on the page.
+    """
+
+    def __init__(self, bboxes: List[tuple], cell_size: float = 72.0):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[tuple]] = {}
+        for bbox in bboxes:
+            x0, y0, x1, y1 = bbox
+            for cx in range(int(x0 // cell_size), int(x1 // cell_size) + 1):
+                for cy in range(int(y0 // cell_size), int(y1 // cell_size) + 1):
+                    self.cells.setdefault((cx, cy), []).append(bbox)
+
+    def contains(self, x: float, y: float) -> bool:
+        candidates = self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), ())
+        return any(
+            bbox[0] <= x <= bbox[2] and bbox[1] <= y <= bbox[3]
+            for bbox in candidates
+        )
+
+
+def _analyze_layout(plumber_page) -> Tuple[list, _TableIndex]:
+    """Detect tables exactly once per page and index their bounding boxes."""
+    tables = [tbl for tbl in plumber_page.find_tables() if tbl.bbox]
+    return tables, _TableIndex([tbl.bbox for tbl in tables])
+
+
+def _process_page(page, plumber_page, page_num: int, source: str) -> Tuple[List[Document], dict]:
+    """
+    Extract text and tables from a single digital page.
+
+    Returns the page's documents and a timing record (milliseconds per stage).
+    Scanned pages return None instead of documents so the caller can batch
+    them through the OCR worker pool.
+    """
+    page_start = time.perf_counter()
+    timing = {"page_number": page_num, "kind": "digital", "text_ms": 0.0, "layout_ms": 0.0, "table_extract_ms": 0.0, "ocr_ms": 0.0}
+    page_docs = []
+
+    stage_start = time.perf_counter()
+    blocks = [block for block in page.get_text("blocks") if block[6] == 0]
+    digital_text_length = sum(len(block[4].strip()) for block in blocks)
+    timing["text_ms"] = (time.perf_counter() - stage_start) * 1000
+
+    if digital_text_length > 100:
+        logger.info(f"  -> Page {page_num} is digital. Processing for text & tables.")
+        page_elements = []
+
+        stage_start = time.perf_counter()
+        tables, table_index = _analyze_layout(plumber_page)
+        timing["layout_ms"] = (time.perf_counter() - stage_start) * 1000
+
+        for block in blocks:
+            x0, y0, x1, y1, text, _, _ = block
+            if text.strip():
+                block_center_x, block_center_y = (x0 + x1) / 2, (y0 + y1) / 2
+                if not table_index.contains(block_center_x, block_center_y):
+                    page_elements.append({"bbox": (y0, x0), "content": text, "type": "text"})
+
+        # Extract tables from the same detection result used for masking.
+        stage_start = time.perf_counter()
+        for table_obj in tables:
+            table = table_obj.extract()
+            if table:
+                table_text = "\n".join(["\t".join(map(str, cell or "")) for cell in table])
+                page_elements.append({
+                    "bbox": (table_obj.bbox[1], table_obj.bbox[0]), 
+                    "content": f"[TABLE]\n{table_text}", 
+                    "type": "table"
+                })
+        timing["table_extract_ms"] = (time.perf_counter() - stage_start) * 1000
+
+        page_elements.sort(key=lambda el: el["bbox"])
         
+        for el in page_elements:
+            page_docs.append(Document(
+                page_content=el["content"],
+                metadata={"source": source, "page_number": page_num, "element_type": el["type"]}
+            ))
+    else:
+        # Scanned pages are OCR'd in a batch by the caller (see app.rag.ocr).
+        logger.warning(f"  -> Page {page_num} appears to be scanned. Queuing for OCR.")
+        timing["kind"] = "ocr"
+        page_docs = None
+
+    timing["total_ms"] = (time.perf_counter() - page_start) * 1000
+    return page_docs, timing
+
+
+def summarize_page_timings(page_timings: List[dict]) -> dict:
+    """Aggregate per-page timings into per-stage totals and the slowest pages."""
+    stages = ["text_ms", "layout_ms", "table_extract_ms", "ocr_ms", "total_ms"]
+    totals = {stage: round(sum(t.get(stage, 0.0) for t in page_timings), 1) for stage in stages}
+    slowest = sorted(page_timings, key=lambda t: t.get("total_ms", 0.0), reverse=True)[:5]
+    return {
+        "pages": len(page_timings),
+        "ocr_pages": sum(1 for t in page_timings if t.get("kind") == "ocr"),
+        "totals_ms": totals,
+        "slowest_pages": [(t["page_number"], round(t["total_ms"], 1)) for t in slowest],
+    }
+
+
+def _process_page_range(pdf_path: str, first_page: int, last_page: int, progress_queue=None) -> Tuple[List[Document], List[dict]]:
+    """
+    Process pages first_page..last_page (1-based, inclusive) of a PDF.
+
+    Runs inside a worker process in parallel mode, so it opens its own fitz and
+    pdfplumber handles. Each finished page is announced on `progress_queue`.
+    Returns the documents and one timing record per page.
+    """
+    docs_by_page: Dict[int, List[Document]] = {}
+    timings_by_page: Dict[int, dict] = {}
+    scanned_pages = []
+    source = os.path.basename(pdf_path)
+    fitz_doc = fitz.open(pdf_path)
+    try:
         with pdfplumber.open(pdf_path) as plumber_doc:
-            for page_num, page in enumerate(fitz_doc, start=1):
+            for page_num in range(first_page, last_page + 1):
                 logger.info(f"Processing page {page_num}/{len(fitz_doc)}...")
-                
-                digital_text = page.get_text("text")
-
-                if len(digital_text.strip()) > 100:
-                    logger.info(f"  -> Page {page_num} is digital. Processing for text & tables.")
-                    plumber_page = plumber_doc.pages[page_num - 1]
-                    page_elements = []
-
-                    table_bboxes = [tbl.bbox for tbl in plumber_page.find_tables() if tbl.bbox]
-
-                    for block in page.get_text("blocks"):
-                        x0, y0, x1, y1, text, _, _ = block
-                        if text.strip():
-                            block_center_x, block_center_y = (x0 + x1) / 2, (y0 + y1) / 2
-                            is_inside_table = any(
-                                bbox[0] <= block_center_x <= bbox[2] and
-                                bbox[1] <= block_center_y <= bbox[3]
-                                for bbox in table_bboxes
-                            )
-                            if not is_inside_table:
-                                page_elements.append({"bbox": (y0, x0), "content": text, "type": "text"})
-
-                    # Extract tables.
-                    for table_obj in plumber_page.find_tables():
-                        table = table_obj.extract()
-                        if table:
-                            table_text = "\n".join(["\t".join(map(str, cell or "")) for cell in table])
-                            page_elements.append({
-                                "bbox": (table_obj.bbox[1], table_obj.bbox[0]), 
-                                "content": f"[TABLE]\n{table_text}", 
-                                "type": "table"
-                            })
-
-                    page_elements.sort(key=lambda el: el["bbox"])
-                    
-                    for el in page_elements:
-                        all_docs.append(Document(
-                            page_content=el["content"],
-                            metadata={"source": os.path.basename(pdf_path), "page_number": page_num, "element_type": el["type"]}
-                        ))
-                else:
-                    logger.warning(f"  -> Page {page_num} appears to be scanned. Using OCR fallback.")
-                    
-                    pix = page.get_pixmap(dpi=300)
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    
-                    try:
-                        ocr_text = pytesseract.image_to_string(img, lang='eng')
-                        
-                        if ocr_text.strip():
-                            all_docs.append(Document(
-                                page_content=ocr_text,
-                                metadata={
-                                    "source": os.path.basename(pdf_path),
-                                    "page_number": page_num,
-                                    "element_type": "ocr_text_block"
-                                }
-                            ))
-                            logger.info(f"  -> Successfully extracted text from page {page_num} using OCR.")
-                    except Exception as ocr_error:
-                        logger.error(f"  -> OCR processing failed for page {page_num}: {ocr_error}")
+                page_docs, timing = _process_page(fitz_doc[page_num - 1], plumber_doc.pages[page_num - 1], page_num, source)
+                timings_by_page[page_num] = timing
+                if page_docs is None:
+                    scanned_pages.append(page_num)
+                    continue
+                docs_by_page[page_num] = page_docs
+                if progress_queue is not None:
+                    progress_queue.put(page_num)
+
+        if scanned_pages:
+            ocr_results = OcrEngine().ocr_pages(fitz_doc, scanned_pages)
+            for page_num in scanned_pages:
+                result = ocr_results.get(page_num)
+                page_docs = []
+                if result and result["text"].strip():
+                    page_docs.append(Document(
+                        page_content=result["text"],
+                        metadata={
+                            "source": source,
+                            "page_number": page_num,
+                            "element_type": "ocr_text_block"
+                        }
+                    ))
+                    logger.info(
+                        f"  -> Extracted text from page {page_num} using OCR "
+                        f"({result['dpi']} DPI, confidence {result['confidence']:.0f}{', cached' if result['cached'] else ''})."
+                    )
+                timing = timings_by_page[page_num]
+                timing["ocr_ms"] = result["ocr_ms"] if result else 0.0
+                timing["total_ms"] += timing["ocr_ms"]
+                docs_by_page[page_num] = page_docs
+                if progress_queue is not None:
+                    progress_queue.put(page_num)
+    finally:
+        fitz_doc.close()
+
+    docs = [doc for page_num in sorted(docs_by_page) for doc in docs_by_page[page_num]]
+    timings = [timings_by_page[page_num] for page_num in sorted(timings_by_page)]
+    return docs, timings
+
+
+def _resolve_parse_workers(workers: Optional[int]) -> int:
+    if workers is None:
+        workers = settings.PDF_PARSE_WORKERS
+    if workers <= 0:
+        workers = max(1, (os.cpu_count() or 1) - 1)
+    return workers
+
+
+class _CallbackQueue:
+    """Adapts a progress callback to the queue interface used by worker shards."""
+
+    def __init__(self, callback: Callable[[int, int], None], total: int):
+        self.callback = callback
+        self.total = total
+        self.done = 0
+
+    def put(self, page_num: int):
+        self.done += 1
+        self.callback(self.done, self.total)
+
+
+def _page_shards(page_count: int) -> List[Tuple[int, int]]:
+    shard_size = max(1, settings.PDF_PARSE_PAGES_PER_SHARD)
+    return [
+        (first, min(first + shard_size - 1, page_count))
+        for first in range(1, page_count + 1, shard_size)
+    ]
+
+
+def _iter_shards_sequential(
+    pdf_path: str,
+    page_count: int,
+    progress_callback: Optional[Callable[[int, int], None]],
+) -> Iterator[Tuple[List[Document], List[dict]]]:
+    progress_queue = _CallbackQueue(progress_callback, page_count) if progress_callback else None
+    for first, last in _page_shards(page_count):
+        yield _process_page_range(pdf_path, first, last, progress_queue)
+
 
+def _iter_shards_parallel(
+    pdf_path: str,
+    page_count: int,
+    workers: int,
+    progress_callback: Optional[Callable[[int, int], None]],
+) -> Iterator[Tuple[List[Document], List[dict]]]:
+    """
+    Shard page ranges across a process pool and yield the results in page order.
+
+    At most two shards per worker are scheduled ahead of the consumer, so a slow
+    downstream stage applies backpressure instead of piling up parsed pages.
+    """
+    shards = _page_shards(page_count)
+    logger.info(f"Parsing {page_count} pages in {len(shards)} shards across {workers} worker processes.")
+
+    # 'spawn' keeps workers clear of any threads/torch state in the parent.
+    mp_context = multiprocessing.get_context("spawn")
+    with mp_context.Manager() as manager:
+        progress_queue = manager.Queue()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=init_ocr_worker) as executor:
+            remaining = deque(shards)
+            in_flight = deque()
+            pages_done = 0
+
+            def drain_progress(timeout: float):
+                nonlocal pages_done
+                try:
+                    progress_queue.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                pages_done += 1
+                if progress_callback:
+                    progress_callback(pages_done, page_count)
+
+            while remaining or in_flight:
+                while remaining and len(in_flight) < workers * 2:
+                    first, last = remaining.popleft()
+                    in_flight.append(executor.submit(_process_page_range, pdf_path, first, last, progress_queue))
+
+                head = in_flight[0]
+                while not head.done():
+                    drain_progress(timeout=0.2)
+                in_flight.popleft()
+                yield head.result()
+
+            # Progress messages can trail the last shard's completion.
+            while pages_done < page_count and not progress_queue.empty():
+                drain_progress(timeout=0)
+
+
+def iter_pdf_documents(
+    pdf_path: str,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    page_timings: Optional[List[dict]] = None,
+) -> Iterator[List[Document]]:
+    """
+    Parse a PDF and yield its document elements one page shard at a time, in
+    page order, so downstream chunking and embedding can start before the whole
+    manual is parsed. Errors propagate to the caller.
+    """
+    logger.info(f"Starting HYBRID PDF processing for: {os.path.basename(pdf_path)}")
+    with fitz.open(pdf_path) as fitz_doc:
+        page_count = len(fitz_doc)
+
+    workers = min(_resolve_parse_workers(workers), page_count)
+    if workers > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+        shards = _iter_shards_parallel(pdf_path, page_count, workers, progress_callback)
+    else:
+        shards = _iter_shards_sequential(pdf_path, page_count, progress_callback)
+
+    all_timings = []
+    for shard_docs, shard_timings in shards:
+        all_timings.extend(shard_timings)
+        if page_timings is not None:
+            page_timings.extend(shard_timings)
+        yield shard_docs
+
+    logger.info(f"Parse timing summary: {summarize_page_timings(all_timings)}")
+
+
+def process_pdf(
+    pdf_path: str,
+    workers: Optional[int] = None,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+    page_timings: Optional[List[dict]] = None,
+) -> List[Document]:
+    """
+    Extract text and tables from PDF using hybrid digital/OCR approach.
+
+    Large PDFs are parsed in parallel page shards across a process pool
+    (see PDF_PARSE_WORKERS); `progress_callback(pages_done, total_pages)` is
+    called as each page finishes. Pass a list as `page_timings` to receive
+    one per-stage timing record per page.
+    """
+    all_docs = []
+
+    try:
+        for shard_docs in iter_pdf_documents(pdf_path, workers, progress_callback, page_timings):
+            all_docs.extend(shard_docs)
     except Exception as e:
         logger.error(f"Failed to process PDF {pdf_path}. Error: {e}", exc_info=True)
         return []
@@ -94,12 +331,8 @@ def process_pdf(pdf_path: str) -> List[Document]:
     return all_docs
 
 
-def chunk_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
-    """Split documents into smaller chunks, handling different content types intelligently."""
-    logger.info(f"Starting to chunk {len(documents)} document elements...")
-    chunks = []
-    
-    text_splitter = RecursiveCharacterTextSplitter(
+def _make_text_splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
@@ -107,32 +340,95 @@ def chunk_documents(documents: List[Document], chunk_size: int = 1000, chunk_ove
         is_separator_regex=False,
     )
 
-    current_text_batch = []
-    
+
+def _page_range_metadata(metadata: dict, page_start, page_end) -> dict:
+    return {**metadata, "page_number": page_start, "page_start": page_start, "page_end": page_end}
+
+
+def iter_chunks(
+    documents: Iterable[Document],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    max_buffered_chars: Optional[int] = None,
+) -> Iterator[Document]:
+    """
+    Streaming variant of `chunk_documents`: consumes document elements as they
+    are parsed and yields chunks as soon as they are final.
+
+    Consecutive text elements are combined before splitting, as before. To keep
+    memory bounded, the text buffer is also flushed at a page boundary once it
+    holds more than `max_buffered_chars` characters.
+
+    Every chunk carries `page_start` / `page_end` (and `page_number`, the first
+    page) for the elements its text was actually cut from, so a chunk that
+    straddles a page break cites both pages.
+    """
+    text_splitter = _make_text_splitter(chunk_size, chunk_overlap)
+    if max_buffered_chars is None:
+        max_buffered_chars = chunk_size * 8
+
+    current_text_batch: List[Document] = []
+    buffered_chars = 0
+
+    def flush():
+        # (start offset, end offset, element) of each element in the combined text.
+        spans = []
+        offset = 0
+        for element in current_text_batch:
+            spans.append((offset, offset + len(element.page_content), element))
+            offset += len(element.page_content) + 2
+        combined_text = "\n\n".join(element.page_content for element in current_text_batch)
+
+        search_from = 0
+        for split in text_splitter.split_text(combined_text):
+            start = combined_text.find(split, search_from)
+            if start < 0:
+                start = search_from
+            end = start + len(split)
+            search_from = start + 1
+            overlapping = [element for span_start, span_end, element in spans if span_start < end and span_end > start]
+            overlapping = overlapping or [current_text_batch[-1]]
+            pages = [element.metadata.get("page_number") for element in overlapping if element.metadata.get("page_number") is not None]
+            yield Document(
+                page_content=split,
+                metadata=_page_range_metadata(
+                    overlapping[0].metadata,
+                    min(pages) if pages else None,
+                    max(pages) if pages else None,
+                ),
+            )
+
     for doc in documents:
         element_type = doc.metadata.get('element_type', 'text')
         if element_type in ['table', 'ocr_text_block']:
             if current_text_batch:
-                combined_text = "\n\n".join(current_text_batch)
-                splits = text_splitter.split_text(combined_text)
-                for split in splits:
-                    chunks.append(Document(page_content=split, metadata=doc.metadata))
-                current_text_batch = []
-            
+                yield from flush()
+                current_text_batch, buffered_chars = [], 0
+
+            page_number = doc.metadata.get("page_number")
             if len(doc.page_content) > chunk_size:
-                splits = text_splitter.split_text(doc.page_content)
-                for split in splits:
-                    chunks.append(Document(page_content=split, metadata=doc.metadata))
+                for split in text_splitter.split_text(doc.page_content):
+                    yield Document(page_content=split, metadata=_page_range_metadata(doc.metadata, page_number, page_number))
             else:
-                chunks.append(doc)
+                yield Document(page_content=doc.page_content, metadata=_page_range_metadata(doc.metadata, page_number, page_number))
         else:
-            current_text_batch.append(doc.page_content)
+            if (
+                current_text_batch
+                and buffered_chars >= max_buffered_chars
+                and doc.metadata.get("page_number") != current_text_batch[-1].metadata.get("page_number")
+            ):
+                yield from flush()
+                current_text_batch, buffered_chars = [], 0
+            current_text_batch.append(doc)
+            buffered_chars += len(doc.page_content)
 
     if current_text_batch:
-        combined_text = "\n\n".join(current_text_batch)
-        splits = text_splitter.split_text(combined_text)
-        for split in splits:
-            chunks.append(Document(page_content=split, metadata=documents[-1].metadata))
-    
+        yield from flush()
+
+
+def chunk_documents(documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Document]:
+    """Split documents into smaller chunks, handling different content types intelligently."""
+    logger.info(f"Starting to chunk {len(documents)} document elements...")
+    chunks = list(iter_chunks(documents, chunk_size, chunk_overlap, max_buffered_chars=float("inf")))
     logger.info(f"Finished chunking. Created {len(chunks)} final chunks.")
-    return chunks
\ No newline at end of file
+    return chunks
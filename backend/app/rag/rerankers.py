@@ -0,0 +1,215 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from app.core.config import settings
+from app.rag.cache import TTLCache, normalize_query
+from app.rag.chains import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+_models: Dict[Tuple[str, str, int], object] = {}
+_models_lock = threading.Lock()
+
+# One inference thread: a single CPU forward pass at a time, and requests that
+# run out of time budget can abandon their wait without killing the pass.
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+# (model, normalized query, chunk id) -> relevance score. Chunk IDs are
+# content-addressed, so a cached score stays valid across re-ingestion.
+rerank_score_cache = TTLCache(
+    "rerank_scores",
+    maxsize=settings.RERANK_CACHE_SIZE,
+    ttl_seconds=settings.RERANK_CACHE_TTL_SECONDS,
+)
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "reranked": 0, "fallbacks": 0, "skipped_backlog": 0, "dropped_stale": 0,
+          "pairs_scored": 0, "inference_ms": 0.0}
+
+# Passes submitted to the inference thread and not finished yet, and a moving
+# average of how long one pass takes, to tell whether a new pass could still
+# start within its budget.
+_backlog = {"passes": 0, "pass_ms": 0.0}
+_PASS_MS_SMOOTHING = 0.2
+
+
+def get_cross_encoder(model_name: Optional[str] = None, device: Optional[str] = None, max_tokens: Optional[int] = None):
+    """
+    Returns a shared sentence-transformers CrossEncoder, loaded once per
+    (model, device, max_tokens). Pairs longer than `max_tokens` are truncated
+    by the tokenizer.
+    """
+    key = (
+        model_name or settings.RERANK_MODEL_NAME,
+        device or settings.EMBEDDING_DEVICE,
+        max_tokens or settings.RERANK_MAX_TOKENS,
+    )
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        from sentence_transformers import CrossEncoder
+
+        name, model_device, max_length = key
+        logger.info(f"Loading cross-encoder {name} on {model_device} (max_length={max_length})...")
+        start = time.perf_counter()
+        model = CrossEncoder(name, max_length=max_length, device=model_device)
+        _models[key] = model
+        logger.info(f"Loaded cross-encoder {name} in {time.perf_counter() - start:.2f}s")
+    return model
+
+
+def warmup_cross_encoder():
+    """Loads the reranker and scores one dummy pair so the first query is not slowed by it."""
+    get_cross_encoder().predict([("warmup", "warmup")], show_progress_bar=False)
+
+
+def _chunk_key(doc: Document) -> str:
+    return doc.id or doc.metadata.get("chunk_id") or doc.page_content
+
+
+def _score_pairs(query: str, passages: List[str]) -> List[float]:
+    start = time.perf_counter()
+    scores = get_cross_encoder().predict(
+        [(query, passage) for passage in passages],
+        batch_size=max(1, len(passages)),
+        show_progress_bar=False,
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    with _stats_lock:
+        _stats["pairs_scored"] += len(passages)
+        _stats["inference_ms"] += elapsed_ms
+        previous = _backlog["pass_ms"]
+        _backlog["pass_ms"] = elapsed_ms if not previous else previous + _PASS_MS_SMOOTHING * (elapsed_ms - previous)
+    return [float(score) for score in scores]
+
+
+def _pass_finished(_future):
+    with _stats_lock:
+        _backlog["passes"] -= 1
+
+
+def rerank_documents(
+    query: str,
+    docs: List[Document],
+    top_n: int,
+    time_budget_ms: Optional[float] = None,
+) -> Tuple[List[Document], bool]:
+    """
+    Re-orders first-stage candidates by cross-encoder relevance and keeps the
+    best `top_n`. Returns the documents and whether they were reranked.
+
+    Cached (query, chunk) scores are reused; the rest are scored in one
+    batched forward pass with each passage cut to RERANK_MAX_TOKENS. If that
+    pass does not finish within `time_budget_ms`, the first-stage ranking is
+    returned instead: a pass still waiting on the inference thread is dropped,
+    one already running completes and fills the cache for the next identical
+    request. No pass is queued at all when the passes ahead of it are expected
+    to use up the budget, so the queue stays bounded under load.
+    """
+    with _stats_lock:
+        _stats["requests"] += 1
+    if len(docs) <= 1:
+        return docs[:top_n], True
+
+    time_budget_ms = settings.RERANK_TIME_BUDGET_MS if time_budget_ms is None else time_budget_ms
+    model_name = settings.RERANK_MODEL_NAME
+    normalized = normalize_query(query)
+    max_chars = settings.RERANK_MAX_TOKENS * CHARS_PER_TOKEN
+
+    scores: Dict[str, float] = {}
+    missing: List[Document] = []
+    for doc in docs:
+        key = _chunk_key(doc)
+        score = rerank_score_cache.get((model_name, normalized, key))
+        if score is None:
+            missing.append(doc)
+        else:
+            scores[key] = score
+
+    if missing:
+        budget_seconds = time_budget_ms / 1000 if time_budget_ms and time_budget_ms > 0 else None
+        with _stats_lock:
+            backlog_ms = _backlog["passes"] * _backlog["pass_ms"]
+            if budget_seconds is not None and backlog_ms >= time_budget_ms:
+                _stats["skipped_backlog"] += 1
+                _stats["fallbacks"] += 1
+                skip = True
+            else:
+                _backlog["passes"] += 1
+                skip = False
+        if skip:
+            logger.warning(
+                f"Rerank backlog (~{backlog_ms:.0f} ms) exceeds the {time_budget_ms:.0f} ms budget; using first-stage ranking."
+            )
+            return docs[:top_n], False
+
+        def score_and_cache():
+            new_scores = _score_pairs(query, [doc.page_content[:max_chars] for doc in missing])
+            for doc, score in zip(missing, new_scores):
+                rerank_score_cache.set((model_name, normalized, _chunk_key(doc)), score)
+            return new_scores
+
+        future = _executor.submit(score_and_cache)
+        future.add_done_callback(_pass_finished)
+        try:
+            new_scores = future.result(timeout=budget_seconds)
+        except FutureTimeoutError:
+            logger.warning(f"Rerank exceeded its {time_budget_ms:.0f} ms budget; using first-stage ranking.")
+            # Only succeeds while the pass is still queued; a running one finishes and fills the cache.
+            dropped = future.cancel()
+            with _stats_lock:
+                _stats["fallbacks"] += 1
+                _stats["dropped_stale"] += int(dropped)
+            return docs[:top_n], False
+        except Exception as e:
+            logger.error(f"Rerank failed, using first-stage ranking: {e}")
+            with _stats_lock:
+                _stats["fallbacks"] += 1
+            return docs[:top_n], False
+        for doc, score in zip(missing, new_scores):
+            scores[_chunk_key(doc)] = score
+
+    with _stats_lock:
+        _stats["reranked"] += 1
+    # Stable sort keeps the first-stage order between equal scores.
+    return sorted(docs, key=lambda doc: scores[_chunk_key(doc)], reverse=True)[:top_n], True
+
+
+class RerankingRetriever(BaseRetriever):
+    """Runs a first-stage retriever for candidates, then cross-encoder reranks them."""
+
+    base_retriever: BaseRetriever
+    top_n: int
+    time_budget_ms: Optional[float] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        candidates = self.base_retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        docs, _ = rerank_documents(query, candidates, self.top_n, self.time_budget_ms)
+        return docs
+
+
+def get_rerank_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["queued_passes"] = _backlog["passes"]
+        stats["pass_ms"] = round(_backlog["pass_ms"], 1)
+    stats["inference_ms"] = round(stats["inference_ms"], 1)
+    return {
+        "enabled": settings.RERANK_ENABLED,
+        "model_name": settings.RERANK_MODEL_NAME,
+        **stats,
+        "score_cache": rerank_score_cache.stats(),
+    }
@@ -1,40 +1,363 @@
-import os
-from langchain_chroma import Chroma
-from langchain_core.vectorstores import VectorStoreRetriever
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 
 from app.core.config import settings
-from app.rag.embeddings import get_embedding_model
+from app.rag.cache import normalize_query, retrieval_result_cache
+from app.rag.chains import assemble_context
+from app.rag.keyword_index import KeywordIndex, sync_keyword_index
+from app.rag.rerankers import RerankingRetriever, rerank_documents
+from app.rag.vector_store_pool import vector_store_pool
+from app.services.ingestion_manifest import IngestionManifest
 
-def get_retriever(product_category: str) -> VectorStoreRetriever:
-    """Returns a Chroma retriever for the specified product category."""
+logger = logging.getLogger(__name__)
 
-    embedding_function = get_embedding_model()
+SEARCH_TYPE = "mmr"
+SEARCH_KWARGS = {
+    "k": 8,  # Return top 8 results (increased from 5)
+    "fetch_k": 20,  # Fetch 20 candidates before MMR selection
+    "lambda_mult": 0.7  # Balance between relevance (1.0) and diversity (0.0)
+}
+SEARCH_MODES = ("hybrid", "mmr", "fast_mmr")
 
-    # Using the dynamic pathing from your config.py is better than a dictionary
-    persist_directory = {
-        "washing_machine": settings.CHROMA_DB_DIR_WASHING_MACHINE,
-        "air_conditioner": settings.CHROMA_DB_DIR_AC,
-        "refrigerator": settings.CHROMA_DB_DIR_REFRIGERATOR,
-    }.get(product_category)
+# Collection version at which each category's keyword index was last checked.
+_keyword_index_synced: Dict[str, int] = {}
+# Each category's manifest, keyed by the collection version it was loaded at.
+_manifests: Dict[str, Tuple[int, IngestionManifest]] = {}
 
-    if not persist_directory:
-        raise ValueError(f"Unknown product category provided for retriever: {product_category}")
-    
-    if not os.path.exists(persist_directory):
-        raise FileNotFoundError(f"ChromaDB directory for '{product_category}' not found at {persist_directory}.")
 
-    vectorstore = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embedding_function,
-        collection_name=product_category,
+def resolve_sources(
+    product_category: str,
+    manual: Optional[str] = None,
+    model_number: Optional[str] = None,
+) -> Optional[Tuple[str, ...]]:
+    """
+    The manuals (chunk `source` values) a search should be restricted to, or
+    None for the whole collection. A manual name or model number that matches
+    nothing is logged and ignored rather than returning no context at all.
+    """
+    if not manual and not model_number:
+        return None
+
+    version = vector_store_pool.version(product_category)
+    cached = _manifests.get(product_category)
+    if cached is None or cached[0] != version:
+        cached = _manifests[product_category] = (version, IngestionManifest(product_category))
+    sources = cached[1].find_sources(manual=manual, model_number=model_number)
+    if not sources:
+        logger.info(
+            f"No {product_category} manual matches manual={manual!r} model_number={model_number!r}; "
+            "searching the whole collection"
+        )
+        return None
+    return tuple(sources)
+
+
+def source_filter(sources: Optional[Sequence[str]]) -> Optional[dict]:
+    """Chroma `where` clause restricting a search to chunks of the given manuals."""
+    if not sources:
+        return None
+    if len(sources) == 1:
+        return {"source": sources[0]}
+    return {"source": {"$in": list(sources)}}
+
+
+def hybrid_search(
+    product_category: str,
+    query: str,
+    k: int = SEARCH_KWARGS["k"],
+    fetch_k: int = SEARCH_KWARGS["fetch_k"],
+    rrf_k: Optional[int] = None,
+    sources: Optional[Sequence[str]] = None,
+) -> List[Document]:
+    """
+    BM25 + vector search fused with reciprocal rank fusion.
+
+    Each side contributes its top `fetch_k` chunks; a chunk scores
+    sum(1 / (rrf_k + rank)) over the lists it appears in. Exact tokens such as
+    model numbers and error codes are found by BM25 even when the embedding
+    misses them, and vice versa for paraphrases. `sources` restricts both
+    sides to the chunks of those manuals.
+    """
+    rrf_k = rrf_k or settings.HYBRID_RRF_K
+    vectorstore = vector_store_pool.get(product_category)
+    collection = vectorstore._collection
+
+    version = vector_store_pool.version(product_category)
+    if _keyword_index_synced.get(product_category) != version:
+        keyword_index = sync_keyword_index(product_category, collection)
+        _keyword_index_synced[product_category] = version
+    else:
+        keyword_index = KeywordIndex(product_category)
+
+    vector_docs = vectorstore.similarity_search(query, k=fetch_k, filter=source_filter(sources))
+    keyword_hits = keyword_index.search(query, limit=fetch_k, sources=sources)
+
+    scores: Dict[str, float] = {}
+    docs_by_id: Dict[str, Document] = {}
+    for rank, doc in enumerate(vector_docs):
+        chunk_id = doc.id or doc.metadata.get("chunk_id")
+        if chunk_id is None:
+            continue
+        docs_by_id[chunk_id] = doc
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+    for rank, (chunk_id, _) in enumerate(keyword_hits):
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    top_ids = sorted(scores, key=scores.get, reverse=True)[:k]
+    missing = [chunk_id for chunk_id in top_ids if chunk_id not in docs_by_id]
+    if missing:
+        fetched = collection.get(ids=missing, include=["documents", "metadatas"])
+        for chunk_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"]):
+            docs_by_id[chunk_id] = Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+
+    return [docs_by_id[chunk_id] for chunk_id in top_ids if chunk_id in docs_by_id]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever wrapper around `hybrid_search` for one product category."""
+
+    product_category: str
+    k: int = SEARCH_KWARGS["k"]
+    fetch_k: int = SEARCH_KWARGS["fetch_k"]
+    sources: Optional[Tuple[str, ...]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return hybrid_search(self.product_category, query, k=self.k, fetch_k=self.fetch_k, sources=self.sources)
+
+
+def mmr_select(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = SEARCH_KWARGS["lambda_mult"],
+) -> List[int]:
+    """
+    Maximal marginal relevance over a candidate matrix, vectorized.
+
+    Normalizes once and scores query relevance in one matrix product. Only
+    the similarity rows of selected candidates are ever needed, so each is
+    computed once (k rows instead of the full fetch_k x fetch_k matrix) and
+    folded into a running "most similar selected item" vector; every pick is
+    then a single argmax over all candidates instead of a Python loop.
+    Returns candidate indices in selection order.
+    """
+    n = len(candidate_embeddings)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = candidates @ query
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    redundancy = candidates @ candidates[first]
+    weighted_relevance = lambda_mult * relevance
+    scores = np.empty(n, dtype=np.float32)
+    for _ in range(k - 1):
+        np.subtract(weighted_relevance, (1 - lambda_mult) * redundancy, out=scores)
+        scores[selected] = -np.inf
+        index = int(np.argmax(scores))
+        selected.append(index)
+        np.maximum(redundancy, candidates @ candidates[index], out=redundancy)
+    return selected
+
+
+def fast_mmr_search(
+    product_category: str,
+    query: str,
+    k: int = SEARCH_KWARGS["k"],
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = SEARCH_KWARGS["lambda_mult"],
+    sources: Optional[Sequence[str]] = None,
+) -> List[Document]:
+    """
+    MMR search that fetches the candidates' stored embeddings together with
+    their text in a single Chroma query and selects with `mmr_select`, so a
+    large `fetch_k` (100+) stays cheap. `sources` restricts the candidates to
+    the chunks of those manuals.
+    """
+    fetch_k = max(fetch_k or settings.FAST_MMR_FETCH_K, k)
+    vectorstore = vector_store_pool.get(product_category)
+    query_embedding = vectorstore.embeddings.embed_query(query)
+
+    results = vectorstore._collection.query(
+        query_embeddings=[query_embedding],
+        n_results=fetch_k,
+        where=source_filter(sources),
+        include=["documents", "metadatas", "embeddings"],
     )
+    ids = results["ids"][0]
+    if not ids:
+        return []
+
+    selected = mmr_select(np.asarray(query_embedding), np.asarray(results["embeddings"][0]), k, lambda_mult)
+    documents, metadatas = results["documents"][0], results["metadatas"][0]
+    return [
+        Document(id=ids[i], page_content=documents[i] or "", metadata=metadatas[i] or {})
+        for i in selected
+    ]
+
+
+class FastMMRRetriever(BaseRetriever):
+    """Retriever wrapper around `fast_mmr_search` for one product category."""
+
+    product_category: str
+    k: int = SEARCH_KWARGS["k"]
+    fetch_k: Optional[int] = None
+    sources: Optional[Tuple[str, ...]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return fast_mmr_search(self.product_category, query, k=self.k, fetch_k=self.fetch_k, sources=self.sources)
+
+
+def _resolve_search_mode(search_mode: Optional[str]) -> str:
+    search_mode = search_mode or settings.RETRIEVAL_SEARCH_MODE
+    if search_mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{search_mode}'. Valid modes are: {SEARCH_MODES}")
+    return search_mode
+
+
+def _use_rerank(rerank: Optional[bool]) -> bool:
+    return settings.RERANK_ENABLED if rerank is None else rerank
+
+
+def _first_stage_retriever(
+    product_category: str,
+    search_mode: Optional[str],
+    k: int,
+    sources: Optional[Tuple[str, ...]] = None,
+) -> BaseRetriever:
+    fetch_k = max(SEARCH_KWARGS["fetch_k"], k)
+    search_mode = _resolve_search_mode(search_mode)
+    if search_mode == "hybrid":
+        vector_store_pool.get(product_category)  # fail fast on unknown/missing categories
+        return HybridRetriever(product_category=product_category, k=k, fetch_k=fetch_k, sources=sources)
+    if search_mode == "fast_mmr":
+        vector_store_pool.get(product_category)
+        return FastMMRRetriever(product_category=product_category, k=k, sources=sources)
+
+    # The pool keeps one open Chroma handle per category, so building a
+    # retriever here is just a cheap wrapper around the shared store.
+    vectorstore = vector_store_pool.get(product_category)
     
     # Use MMR (Maximum Marginal Relevance) for better diversity and relevance
+    search_kwargs = {**SEARCH_KWARGS, "k": k, "fetch_k": fetch_k}
+    if sources:
+        search_kwargs["filter"] = source_filter(sources)
     return vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={
-            "k": 8,  # Return top 8 results (increased from 5)
-            "fetch_k": 20,  # Fetch 20 candidates before MMR selection
-            "lambda_mult": 0.7  # Balance between relevance (1.0) and diversity (0.0)
-        }
-    )
\ No newline at end of file
+        search_type=SEARCH_TYPE,
+        search_kwargs=search_kwargs
+    )
+
+
+def get_retriever(
+    product_category: str,
+    search_mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    sources: Optional[Tuple[str, ...]] = None,
+) -> BaseRetriever:
+    """
+    Returns a retriever for the specified product category: hybrid BM25 +
+    vector search, LangChain MMR, or vectorized MMR over a larger candidate
+    pool, per `search_mode` / RETRIEVAL_SEARCH_MODE,
+    optionally followed by cross-encoder reranking (RERANK_ENABLED).
+    `sources` restricts every mode to the chunks of those manuals (see
+    `resolve_sources`), so only that part of the collection is searched.
+    """
+    if not _use_rerank(rerank):
+        return _first_stage_retriever(product_category, search_mode, SEARCH_KWARGS["k"], sources)
+
+    return RerankingRetriever(
+        base_retriever=_first_stage_retriever(product_category, search_mode, settings.RERANK_CANDIDATES, sources),
+        top_n=SEARCH_KWARGS["k"],
+    )
+
+
+def _cache_key(
+    product_category: str,
+    query: str,
+    search_mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    sources: Optional[Tuple[str, ...]] = None,
+) -> tuple:
+    return (
+        product_category,
+        normalize_query(query),
+        _resolve_search_mode(search_mode),
+        sources,
+        tuple(sorted(SEARCH_KWARGS.items())),
+        (settings.RERANK_MODEL_NAME, settings.RERANK_CANDIDATES) if _use_rerank(rerank) else None,
+        vector_store_pool.version(product_category),
+    )
+
+
+def retrieve_context(
+    product_category: str,
+    query: str,
+    search_mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    manual: Optional[str] = None,
+    model_number: Optional[str] = None,
+) -> str:
+    """
+    Retrieves and formats context for a query, memoized per collection version.
+    The cache key changes whenever the category is re-ingested or cleared.
+    `manual` / `model_number` restrict the search to the matching manuals.
+
+    With reranking on, a result that fell back to the first-stage ranking
+    (time budget exceeded) is not cached, so a later call can use the scores
+    the background pass left in the rerank cache.
+    """
+    sources = resolve_sources(product_category, manual, model_number)
+    cache_key = _cache_key(product_category, query, search_mode, rerank, sources)
+
+    if settings.RETRIEVAL_CACHE_ENABLED:
+        context = retrieval_result_cache.get(cache_key)
+        if context is not None:
+            return context
+
+    reranked = True
+    if _use_rerank(rerank):
+        candidates = _first_stage_retriever(product_category, search_mode, settings.RERANK_CANDIDATES, sources).invoke(query)
+        retrieved_docs, reranked = rerank_documents(query, candidates, SEARCH_KWARGS["k"])
+    else:
+        retrieved_docs = get_retriever(product_category, search_mode, rerank=False, sources=sources).invoke(query)
+    context = assemble_context(retrieved_docs)
+
+    if settings.RETRIEVAL_CACHE_ENABLED and reranked:
+        retrieval_result_cache.set(cache_key, context)
+    return context
+
+
+async def aretrieve_context(
+    product_category: str,
+    query: str,
+    search_mode: Optional[str] = None,
+    rerank: Optional[bool] = None,
+    manual: Optional[str] = None,
+    model_number: Optional[str] = None,
+) -> str:
+    """
+    Async variant of `retrieve_context`. Cache hits are answered on the event
+    loop; misses run the local embedding + Chroma search in a worker thread,
+    since neither has a native async API.
+    """
+    if settings.RETRIEVAL_CACHE_ENABLED and not manual and not model_number:
+        context = retrieval_result_cache.get(_cache_key(product_category, query, search_mode, rerank))
+        if context is not None:
+            return context
+
+    return await asyncio.to_thread(
+        retrieve_context, product_category, query, search_mode, rerank, manual, model_number
+    )
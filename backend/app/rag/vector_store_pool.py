@@ -0,0 +1,174 @@
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional
+
+from langchain_chroma import Chroma
+
+from app.core.config import settings
+from app.rag.cache import CachedQueryEmbeddings, invalidate_category
+from app.rag.embeddings import get_embedding_model
+from app.utils.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+def get_persist_directory(product_category: str) -> Optional[str]:
+    """Returns the ChromaDB directory for a product category, or None if unknown."""
+    return {
+        "washing_machine": settings.CHROMA_DB_DIR_WASHING_MACHINE,
+        "air_conditioner": settings.CHROMA_DB_DIR_AC,
+        "refrigerator": settings.CHROMA_DB_DIR_REFRIGERATOR,
+    }.get(product_category)
+
+
+class VectorStorePool:
+    """
+    Keeps one long-lived Chroma handle per product category.
+
+    Opening a Chroma client re-reads the SQLite/HNSW segment files, so handles
+    are opened lazily on first use and reused until the category is invalidated
+    (after ingestion writes to it or the vector databases are cleared).
+
+    Every invalidation also bumps the category's collection version, which is
+    persisted next to the ChromaDB directories so caches keyed on it stay
+    correct across restarts and across processes writing the same databases.
+    """
+
+    def __init__(self, versions_path: Optional[str] = None):
+        self._stores: Dict[str, Chroma] = {}
+        self._lock = threading.Lock()
+        self._versions_path = versions_path or os.path.join(settings.CHROMA_DB_DIR, "collection_versions.json")
+        self._versions_stat: Optional[tuple] = None
+        self._versions: Dict[str, int] = self._load_versions()
+
+    def _file_stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._versions_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_versions(self) -> Dict[str, int]:
+        self._versions_stat = self._file_stat()
+        try:
+            with open(self._versions_path, "r", encoding="utf-8") as f:
+                return {k: int(v) for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Could not read collection versions from {self._versions_path}: {e}")
+            return {}
+
+    def _save_versions(self):
+        try:
+            os.makedirs(os.path.dirname(self._versions_path), exist_ok=True)
+            tmp_path = f"{self._versions_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._versions, f)
+            os.replace(tmp_path, self._versions_path)
+            self._versions_stat = self._file_stat()
+        except Exception as e:
+            logger.warning(f"Could not persist collection versions to {self._versions_path}: {e}")
+
+    def _refresh_versions(self) -> list:
+        """
+        Picks up versions bumped by another process (e.g. scripts/bulk_ingest.py)
+        and returns the categories that changed. Caller holds self._lock.
+        """
+        if self._file_stat() == self._versions_stat:
+            return []
+        versions = self._load_versions()
+        changed = [c for c in set(versions) | set(self._versions) if versions.get(c, 0) != self._versions.get(c, 0)]
+        self._versions = versions
+        for category in changed:
+            # The pooled handle predates the other process's writes.
+            self._stores.pop(category, None)
+        return changed
+
+    def version(self, product_category: str) -> int:
+        """Monotonic version of a category's collection; changes whenever its contents change."""
+        with self._lock:
+            changed = self._refresh_versions()
+            version = self._versions.get(product_category, 0)
+        for category in changed:
+            logger.info(f"Collection '{category}' was changed by another process; reopening it")
+            invalidate_category(category)
+        return version
+
+    def _bump_versions(self, categories):
+        # The file lock makes read-increment-write atomic across processes, so
+        # a bump by the server never overwrites one made by the CLI.
+        with self._lock, file_lock(f"{self._versions_path}.lock"):
+            self._versions = self._load_versions()
+            for category in categories:
+                self._versions[category] = self._versions.get(category, 0) + 1
+            self._save_versions()
+        for category in categories:
+            invalidate_category(category)
+
+    def get(self, product_category: str) -> Chroma:
+        """Returns the pooled Chroma store for a category, opening it if needed."""
+        self.version(product_category)  # drops the handle if another process changed the collection
+        store = self._stores.get(product_category)
+        if store is not None:
+            return store
+
+        persist_directory = get_persist_directory(product_category)
+        if not persist_directory:
+            raise ValueError(f"Unknown product category provided for retriever: {product_category}")
+
+        if not os.path.exists(persist_directory):
+            raise FileNotFoundError(f"ChromaDB directory for '{product_category}' not found at {persist_directory}.")
+
+        with self._lock:
+            store = self._stores.get(product_category)
+            if store is None:
+                logger.info(f"Opening pooled Chroma store for '{product_category}' at {persist_directory}")
+                embedding_key = (settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_DEVICE, settings.EMBEDDING_NORMALIZE)
+                store = Chroma(
+                    persist_directory=persist_directory,
+                    embedding_function=CachedQueryEmbeddings(get_embedding_model(), embedding_key),
+                    collection_name=product_category,
+                )
+                self._stores[product_category] = store
+        return store
+
+    def invalidate(self, product_category: str):
+        """
+        Drops the pooled handle so the next request reopens the category from disk,
+        and bumps its collection version so cached results for it are discarded.
+        """
+        with self._lock:
+            store = self._stores.pop(product_category, None)
+        self._bump_versions([product_category])
+        if store is not None:
+            logger.info(f"Invalidated pooled Chroma store for '{product_category}'")
+
+    def invalidate_all(self, reset_clients: bool = False):
+        """
+        Drops every pooled handle. Pass reset_clients=True when the directories
+        were deleted on disk so chromadb's own per-path client cache is reset too.
+        """
+        with self._lock:
+            categories = list(self._stores)
+            self._stores.clear()
+        self._bump_versions(settings.VALID_PRODUCT_TYPES)
+
+        if reset_clients:
+            try:
+                from chromadb.api.client import SharedSystemClient
+                SharedSystemClient.clear_system_cache()
+            except Exception as e:
+                logger.warning(f"Could not reset chromadb client cache: {e}")
+
+        if categories:
+            logger.info(f"Invalidated pooled Chroma stores: {categories}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"open_stores": sorted(self._stores), "collection_versions": dict(self._versions)}
+
+
+vector_store_pool = VectorStorePool()
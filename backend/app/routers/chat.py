@@ -1,73 +1,168 @@
+import base64
 import json
-from fastapi import APIRouter, Depends, HTTPException, status
+import logging
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List, AsyncGenerator
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, AsyncGenerator, Optional, Tuple
 
-from app.database.database import get_db, SessionLocal
+from app.core.config import settings
+
+from app.database.database import get_async_db
 from app.models.session import ChatSession, ChatMessage
 from app.schemas.chat import ChatSessionResponse, ChatMessageResponse, ChatMessageCreate, ChatSessionTitleUpdate, ChatMessageMetadataUpdate
 
-from app.agents.agent_manager import agent_manager
-from langchain_core.messages import HumanMessage, AIMessage
+from app.agents.agent_manager import FAST_PATH_ANSWER_EVENT, agent_manager
+from app.services.conversation_context import aload_conversation_messages, schedule_summary_update
+from app.services.message_store import append_message, save_message
+from app.utils.streaming import TokenCoalescer, iter_with_deadline, sse_event
 
 router = APIRouter(
     prefix="/chats",
     tags=["Chat"],
 )
 
+logger = logging.getLogger(__name__)
+
+# Set on paginated list responses when there are more rows; pass it back as `before`.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def _encode_cursor(timestamp: datetime, row_id) -> str:
+    payload = json.dumps([timestamp.isoformat(), str(row_id)]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor: str, id_type=str) -> Tuple[datetime, object]:
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), id_type(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+# LangGraph event kinds that can produce an SSE frame; everything else is skipped.
+_STREAMED_EVENT_KINDS = frozenset({"on_chain_start", "on_tool_start", "on_custom_event", "on_chat_model_stream"})
+
+
+def _status_message(kind: str, name: str, langgraph_node: str) -> Optional[str]:
+    """The progress status shown for a chain or tool start event, if any."""
+    if kind == "on_chain_start" and langgraph_node == "supervisor":
+        return 'Supervisor analyzing your question...'
+
+    if kind == "on_tool_start":
+        tool_name = name.replace("_", " ").replace("tool", "").strip().title()
+        if "washing" in name.lower():
+            return 'Delegating to Washing Machine Expert...'
+        elif "refrigerator" in name.lower():
+            return 'Delegating to Refrigerator Expert...'
+        elif "ac" in name.lower() or "air" in name.lower() or "conditioner" in name.lower():
+            return 'Delegating to Air Conditioner Expert...'
+        return f'Calling tool: {tool_name}'
+
+    if kind == "on_chain_start" and langgraph_node and langgraph_node not in ("supervisor", "router", "fast_answer"):
+        # Use the 'name' field which contains the actual node name
+        node_name = name.lower() if name else langgraph_node.lower()
+
+        if "washing" in node_name:
+            return 'Washing Machine Agent searching knowledge base...'
+        elif "refrigerator" in node_name:
+            return 'Refrigerator Agent searching knowledge base...'
+        elif "ac" in node_name or "air" in node_name or "conditioner" in node_name:
+            return 'Air Conditioner Agent searching knowledge base...'
+        # Fallback: clean up the node name
+        clean_name = node_name.replace("_", " ").replace("agent", "").replace("expert", "").strip()
+        clean_name = clean_name.title()
+        return f'Running {clean_name} Agent...'
+    return None
+
 @router.post("/", response_model=ChatSessionResponse, status_code=status.HTTP_201_CREATED)
-def create_chat_session(db: Session = Depends(get_db)):
+async def create_chat_session(db: AsyncSession = Depends(get_async_db)):
     new_session = ChatSession(title="New Chat")
     db.add(new_session)
-    db.commit()
-    db.refresh(new_session)
-    new_session.id = str(new_session.id)
+    await db.commit()
+    await db.refresh(new_session)
     return new_session
 
 @router.get("/", response_model=List[ChatSessionResponse])
-def get_all_chat_sessions(db: Session = Depends(get_db)):
-    sessions = db.query(ChatSession).order_by(ChatSession.updated_at.desc()).all()
-    for session in sessions:
-        session.id = str(session.id)
-    return sessions
+async def get_all_chat_sessions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.CHAT_PAGE_SIZE_MAX, description="Page size; all rows when omitted"),
+    before: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Most recently updated sessions first; one keyset page at a time when `limit` is given."""
+    query = select(ChatSession.id, ChatSession.title, ChatSession.created_at, ChatSession.updated_at)
+    if before:
+        updated_at, session_id = _decode_cursor(before)
+        query = query.where(tuple_(ChatSession.updated_at, ChatSession.id) < tuple_(updated_at, session_id))
+    query = query.order_by(ChatSession.updated_at.desc(), ChatSession.id.desc())
+    rows = (await db.execute(query if limit is None else query.limit(limit + 1))).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(rows[-1].updated_at, rows[-1].id)
+    return rows
 
 @router.get("/{session_id}", response_model=List[ChatMessageResponse])
-def get_chat_history(session_id: str, db: Session = Depends(get_db)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if not session:
+async def get_chat_history(
+    session_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=settings.CHAT_PAGE_SIZE_MAX, description="Page size; all rows when omitted"),
+    before: Optional[str] = Query(None, description="Cursor from the X-Next-Cursor header of the previous page"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    The session's messages in chronological order, or only the latest `limit`
+    of them. The X-Next-Cursor header, when present, fetches the page of
+    older messages before them.
+    """
+    session_exists = await db.scalar(select(ChatSession.id).where(ChatSession.id == session_id))
+    if not session_exists:
         raise HTTPException(status_code=404, detail="Chat session not found")
-        
-    messages = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at).all()
-    for message in messages:
-        message.session_id = str(message.session_id)
-    return messages
+
+    query = select(
+        ChatMessage.id, ChatMessage.session_id, ChatMessage.sender, ChatMessage.content,
+        ChatMessage.agent_name, ChatMessage.time_consumed, ChatMessage.created_at,
+    ).where(ChatMessage.session_id == session_id)
+    if before:
+        created_at, message_id = _decode_cursor(before, int)
+        query = query.where(tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(created_at, message_id))
+    query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+    rows = (await db.execute(query if limit is None else query.limit(limit + 1))).all()
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return list(reversed(rows))
 
 @router.patch("/{session_id}/title", status_code=status.HTTP_200_OK)
-def update_session_title(
+async def update_session_title(
     session_id: str, 
     title_update: ChatSessionTitleUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    session = await db.get(ChatSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
     
     session.title = title_update.title
-    db.commit()
+    await db.commit()
     return {"message": "Title updated successfully"}
 
 @router.patch("/{session_id}/messages/{message_id}/metadata", status_code=status.HTTP_200_OK)
-def update_message_metadata(
+async def update_message_metadata(
     session_id: str,
     message_id: int,
     metadata_update: ChatMessageMetadataUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    message = db.query(ChatMessage).filter(
-        ChatMessage.id == message_id,
-        ChatMessage.session_id == session_id
-    ).first()
+    message = (await db.execute(
+        select(ChatMessage).where(
+            ChatMessage.id == message_id,
+            ChatMessage.session_id == session_id
+        )
+    )).scalars().first()
     
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
@@ -77,120 +172,105 @@ def update_message_metadata(
     if metadata_update.time_consumed is not None:
         message.time_consumed = metadata_update.time_consumed
     
-    db.commit()
+    await db.commit()
     return {"message": "Message metadata updated successfully"}
 
 @router.post("/{session_id}/messages/stream")
 async def stream_message(
     session_id: str,
     message_in: ChatMessageCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-    if not session:
-        raise HTTPException(status_code=404, detail="Chat session not found")
+    # The window is read before the new message is stored and extended in
+    # memory: recent turns verbatim plus the rolling summary of older ones.
+    messages_for_agent = await aload_conversation_messages(db, session_id, new_message=message_in.content)
 
-    user_message = ChatMessage(
-        session_id=session_id,
-        sender="human",
-        content=message_in.content
-    )
-    db.add(user_message)
-    db.commit()
-
-    history_from_db = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at).all()
-    
-    messages_for_agent = []
-    for msg in history_from_db:
-        if msg.sender == "human":
-            messages_for_agent.append(HumanMessage(content=msg.content))
-        elif msg.sender == 'ai':
-            messages_for_agent.append(AIMessage(content=msg.content))
+    # Inserts the message and bumps the session in one statement; None means no such session.
+    if await append_message(db, session_id, "human", message_in.content) is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
             
     initial_state = {"messages": messages_for_agent}
 
     async def event_generator() -> AsyncGenerator[str, None]:
         full_ai_response = ""
+        coalescer = TokenCoalescer()
+        last_status = None
+        debug = logger.isEnabledFor(logging.DEBUG)
         
         try:
-            async for event in agent_manager.astream_events(initial_state, version="v2", config={"recursion_limit": 10}):
+            events = agent_manager.astream_events(initial_state, version="v2", config={"recursion_limit": 10})
+            async for event in iter_with_deadline(events, coalescer.time_left):
+                if event is None:
+                    # No event within the flush interval: send what is buffered.
+                    frame = coalescer.flush()
+                    if frame:
+                        yield frame
+                    continue
+
                 kind = event["event"]
-                name = event.get("name", "")
+                # Most events (chain ends, inner runnables, other nodes'
+                # tokens) produce no frame; drop them before any string work.
+                if kind not in _STREAMED_EVENT_KINDS:
+                    continue
                 metadata = event.get("metadata", {})
                 langgraph_node = metadata.get("langgraph_node", "")
-                
-                print(f"[EVENT] Kind: {kind}, Name: {name}, Node: {langgraph_node}")
-                
-                if kind == "on_chain_start" and langgraph_node == "supervisor":
-                    status_msg = 'Supervisor analyzing your question...'
-                    print(f"[STATUS] {status_msg}")
-                    yield f"data: {json.dumps({'status': status_msg})}\n\n"
-                
-                if kind == "on_tool_start":
-                    tool_name = name.replace("_", " ").replace("tool", "").strip().title()
-                    if "washing" in name.lower():
-                        status_msg = 'Delegating to Washing Machine Expert...'
-                    elif "refrigerator" in name.lower():
-                        status_msg = 'Delegating to Refrigerator Expert...'
-                    elif "ac" in name.lower() or "air" in name.lower() or "conditioner" in name.lower():
-                        status_msg = 'Delegating to Air Conditioner Expert...'
-                    else:
-                        status_msg = f'Calling tool: {tool_name}'
-                    print(f"[STATUS] {status_msg}")
-                    yield f"data: {json.dumps({'status': status_msg})}\n\n"
-                
-                if kind == "on_chain_start" and langgraph_node and langgraph_node != "supervisor":
-                    # Use the 'name' field which contains the actual node name
-                    node_name = name.lower() if name else langgraph_node.lower()
-                    
-                    if "washing" in node_name:
-                        status_msg = 'Washing Machine Agent searching knowledge base...'
-                    elif "refrigerator" in node_name:
-                        status_msg = 'Refrigerator Agent searching knowledge base...'
-                    elif "ac" in node_name or "air" in node_name or "conditioner" in node_name:
-                        status_msg = 'Air Conditioner Agent searching knowledge base...'
-                    else:
-                        # Fallback: clean up the node name
-                        clean_name = node_name.replace("_", " ").replace("agent", "").replace("expert", "").strip()
-                        clean_name = clean_name.title()
-                        status_msg = f'Running {clean_name} Agent...'
-                    print(f"[STATUS] {status_msg}")
-                    yield f"data: {json.dumps({'status': status_msg})}\n\n"
-                
-                if kind == "on_chat_model_stream" and event.get("name") == "ChatGoogleGenerativeAI":
-                    if metadata.get("langgraph_node") == "supervisor":
-                        chunk = event["data"].get("chunk")
-                        if chunk and hasattr(chunk, 'content'):
-                            token = chunk.content
-                            if token:
-                                full_ai_response += token
-                                yield f"data: {json.dumps({'token': token})}\n\n"
+
+                token = None
+                if kind == "on_chat_model_stream":
+                    if langgraph_node != "supervisor" or event.get("name") != "ChatGoogleGenerativeAI":
+                        continue
+                    chunk = event["data"].get("chunk")
+                    token = chunk.content if chunk is not None and hasattr(chunk, 'content') else None
+                # Answers from the fast-path router (small talk, or an expert
+                # report passed through without a supervisor synthesis call).
+                elif kind == "on_custom_event":
+                    if event.get("name") != FAST_PATH_ANSWER_EVENT:
+                        continue
+                    token = event["data"].get("content")
+
+                if debug:
+                    logger.debug(f"[EVENT] Kind: {kind}, Name: {event.get('name', '')}, Node: {langgraph_node}")
+
+                if token:
+                    full_ai_response += token
+                    frame = coalescer.add(token)
+                    if frame:
+                        yield frame
+                    continue
+
+                status_msg = _status_message(kind, event.get("name", ""), langgraph_node)
+                # Nested runnables of one node repeat the same status; send it once.
+                if status_msg and status_msg != last_status:
+                    last_status = status_msg
+                    logger.debug(f"[STATUS] {status_msg}")
+                    frame = coalescer.flush()
+                    if frame:
+                        yield frame
+                    yield sse_event({'status': status_msg})
         except Exception as e:
-            print(f"Error during streaming: {e}")
-            import traceback
-            traceback.print_exc()
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            logger.error(f"Error during streaming: {e}", exc_info=True)
+            frame = coalescer.flush()
+            if frame:
+                yield frame
+            yield sse_event({'error': str(e)})
+
+        frame = coalescer.flush()
+        if frame:
+            yield frame
 
         message_id = None
-        with SessionLocal() as db_session:
-            if full_ai_response:
-                ai_message_to_save = ChatMessage(
-                    session_id=session_id,
-                    sender="ai",
-                    content=full_ai_response.strip()
-                )
-                db_session.add(ai_message_to_save)
-                db_session.commit()
-                db_session.refresh(ai_message_to_save)
-                message_id = ai_message_to_save.id
-                
-                # Update session's updated_at timestamp
-                session_to_update = db_session.query(ChatSession).filter(ChatSession.id == session_id).first()
-                if session_to_update:
-                    session_to_update.updated_at = ai_message_to_save.created_at
-                    db_session.commit()
+        if full_ai_response:
+            try:
+                stored = await save_message(session_id, "ai", full_ai_response.strip())
+                message_id = stored.id if stored else None
+            except Exception as e:
+                logger.error(f"Error saving the AI message: {e}")
+
+        if message_id is not None:
+            # Off the response path: fold turns that left the window into the summary.
+            schedule_summary_update(session_id)
         
-        yield f"data: {json.dumps({'event': 'end', 'message_id': message_id})}\n\n"
+        yield sse_event({'event': 'end', 'message_id': message_id})
     
     return StreamingResponse(
         event_generator(),
@@ -1,18 +1,26 @@
 from fastapi import APIRouter, Depends, status, HTTPException
-from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.database.database import get_db
+from app.agents.fast_router import fast_router
+from app.database.database import get_async_db, get_pool_stats
+from app.rag.chains import get_context_assembly_stats
+from app.rag.embeddings import get_embedding_registry_stats
+from app.rag.cache import get_cache_stats
+from app.rag.rerankers import get_rerank_stats
+from app.rag.vector_store_pool import vector_store_pool
+from app.services.answer_cache import answer_cache
+from app.services.message_store import message_writer
 
 router = APIRouter(tags=["Health Check"])
 
 logger = logging.getLogger(__name__)
 
 @router.get("/health", summary="Perform a comprehensive health check", status_code=status.HTTP_200_OK)
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         logger.info("Health check successful: API is running and DB is connected.")
         return {
             "api_status": "ok",
@@ -29,4 +37,34 @@ async def health_check(db: Session = Depends(get_db)):
                 "message": "API is running, but the database connection has failed.",
                 "error_details": str(e),
             },
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/health/db-pool", summary="Report database connection pool utilization", status_code=status.HTTP_200_OK)
+async def db_pool_health():
+    return {**get_pool_stats(), "message_writer": message_writer.stats()}
+
+
+@router.get("/health/embeddings", summary="Report loaded embedding models and their memory", status_code=status.HTTP_200_OK)
+async def embedding_registry_health():
+    return get_embedding_registry_stats()
+
+
+@router.get("/health/retrieval-cache", summary="Report retrieval cache hit/miss counters", status_code=status.HTTP_200_OK)
+async def retrieval_cache_health():
+    return {
+        **get_cache_stats(),
+        "vector_stores": vector_store_pool.stats(),
+        "rerank": get_rerank_stats(),
+        "context_assembly": get_context_assembly_stats(),
+    }
+
+
+@router.get("/health/answer-cache", summary="Report semantic answer cache hit rates per category", status_code=status.HTTP_200_OK)
+async def answer_cache_health():
+    return answer_cache.stats()
+
+
+@router.get("/health/router", summary="Report fast-path routing rates, accuracy and latency", status_code=status.HTTP_200_OK)
+async def fast_router_health():
+    return fast_router.stats()
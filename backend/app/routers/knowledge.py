@@ -1,16 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-import json
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
 import asyncio
 import logging
 import shutil
 from pathlib import Path
-from typing import AsyncGenerator
+from typing import AsyncGenerator, List, Optional
 
 from fastapi.responses import StreamingResponse
 from starlette import status
 
-from app.services.ingestion_service import store_process_chunk_ingest
+from app.services.ingestion_jobs import ingestion_job_manager, FINISHED_STATUSES
+from app.services.bulk_ingestion import infer_product_type, run_bulk_ingestion
+from app.services.ingestion_service import hold_category_locks
+from app.services.upload_storage import discard_upload, promote_upload, spool_upload, UploadTooLargeError
+from app.rag.vector_store_pool import vector_store_pool
 from app.core.config import settings
+from app.utils.streaming import sse_event
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +24,17 @@ router = APIRouter(
     tags=["Knowledge Base"]
 )   
 
-@router.post("/upload/stream", status_code=status.HTTP_201_CREATED)
+_background_tasks = set()
 
-async def upload_manual(
-    product_type: str = Form(..., description="The type of product"),
-    file: UploadFile = File(..., description="The PDF file to upload")
-):
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+
+async def _spool_pdf(product_type: str, file: UploadFile):
+    """Validates an upload and streams it to the category's manual directory."""
     if product_type not in settings.VALID_PRODUCT_TYPES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -38,62 +47,188 @@ async def upload_manual(
             detail="Invalid file type. Only PDF files are accepted."
         )
     
-    file_contents = await file.read()
+    # Stream the body to disk in chunks instead of buffering the whole PDF.
+    try:
+        return await spool_upload(file, product_type)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+
+async def _enqueue_ingestion(product_type: str, file: UploadFile) -> dict:
+    spooled = await _spool_pdf(product_type, file)
+    try:
+        return await ingestion_job_manager.enqueue(
+            product_type=product_type,
+            file_name=spooled.file_name,
+            pdf_path=spooled.path,
+            file_hash=spooled.sha256
+        )
+    except Exception as e:
+        logger.error(f"Could not queue ingestion of {spooled.file_name}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Could not queue ingestion job: {str(e)}"
+        )
+
+
+async def _bulk_ingest_uploads(manuals: List[tuple], failures: List[dict], queue: asyncio.Queue) -> dict:
+    """
+    Bulk-ingests spooled uploads, then moves each one that was ingested (or
+    was already indexed) over its earlier version and deletes the rest.
+    """
+    report = None
+    try:
+        report = await run_bulk_ingestion(manuals, failures, queue)
+        return report
+    finally:
+        entries = {entry["file"]: entry for entry in (report or {}).get("manuals", [])}
+        for pdf_path, _ in manuals:
+            entry = entries.get(pdf_path)
+            try:
+                if entry is not None and entry["status"] in ("succeeded", "skipped"):
+                    entry["file"] = await asyncio.to_thread(promote_upload, pdf_path)
+                else:
+                    await asyncio.to_thread(discard_upload, pdf_path)
+            except OSError as e:
+                logger.error(f"Could not move bulk upload {pdf_path} into place: {e}")
+
 
+def _job_event_stream(job_id: str) -> StreamingResponse:
+    """
+    SSE stream of a job's progress. The job runs independently of the stream,
+    so a client that disconnects can re-attach later without losing the work.
+    """
     async def event_generator():
-        queue = asyncio.Queue()
-
-        task = asyncio.create_task(
-            store_process_chunk_ingest(
-                queue=queue,
-                file_name=file.filename,
-                file_contents=file_contents,
-                product_type=product_type
-            )
+        try:
+            async for event in ingestion_job_manager.stream(job_id):
+                yield sse_event({**event, 'job_id': job_id})
+        except Exception as e:
+            logger.error(f"[SSE] Error in event generator: {e}")
+            error_message = {"status": "error", "message": f"Stream error: {str(e)}", "job_id": job_id}
+            yield sse_event(error_message)
+            return
+
+        job = await ingestion_job_manager.get(job_id)
+        job_status = job["status"] if job else None
+        if job_status in FINISHED_STATUSES:
+            final_message = {"status": "complete", "message": "Ingestion complete!", "job_id": job_id, "job_status": job_status}
+        else:
+            # Workers stopped (e.g. shutdown); the job resumes on the next start.
+            final_message = {"status": "interrupted", "message": "Ingestion interrupted; it will resume automatically.", "job_id": job_id, "job_status": job_status}
+        yield sse_event(final_message)
+
+    return StreamingResponse(
+        event_generator(), 
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.post("/upload/stream", status_code=status.HTTP_201_CREATED)
+
+async def upload_manual(
+    product_type: str = Form(..., description="The type of product"),
+    file: UploadFile = File(..., description="The PDF file to upload")
+):
+    """Queues the upload as an ingestion job and streams that job's progress."""
+    job = await _enqueue_ingestion(product_type, file)
+    return _job_event_stream(job["id"])
+
+
+@router.post("/upload/batch", status_code=status.HTTP_201_CREATED)
+async def upload_manuals_batch(
+    files: List[UploadFile] = File(..., description="The PDF files to upload"),
+    product_type: Optional[str] = Form(None, description="Category for every file; inferred from each file name when omitted")
+):
+    """
+    Ingests many manuals in one bulk run (parallel parsing, embedding batched
+    across files) and streams progress, ending with the summary report. The
+    run continues, and its report is still written, if the client disconnects.
+    """
+    if product_type is not None and product_type not in settings.VALID_PRODUCT_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid product type. Valid types are: {settings.VALID_PRODUCT_TYPES}"
         )
-        
+
+    manuals, failures = [], []
+    for file in files:
+        file_type = product_type or infer_product_type(file.filename or "")
+        if file_type is None:
+            failures.append({"file": file.filename, "error": "Could not determine product type from the file name."})
+            continue
+        try:
+            spooled = await _spool_pdf(file_type, file)
+        except HTTPException as e:
+            failures.append({"file": file.filename, "product_type": file_type, "error": e.detail})
+            continue
+        manuals.append((spooled.path, file_type))
+
+    queue = asyncio.Queue()
+    task = asyncio.create_task(_bulk_ingest_uploads(manuals, failures, queue))
+    # Keep a reference so the run outlives a disconnected client.
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    async def event_generator():
         while True:
-            try:
-                message = await asyncio.wait_for(queue.get(), timeout=30.0)
-                
-                if message is None:
-                    break
-
-                log_entry = {"status": "processing", "message": str(message)}
-                if isinstance(message, str) and message.lower().startswith("error"):
-                    log_entry["status"] = "error"
-                
-                yield f"data: {json.dumps(log_entry)}\n\n"
-                
-            except asyncio.TimeoutError:
-                continue
-            except Exception as e:
-                logger.error(f"[SSE] Error in event generator: {e}")
-                error_message = {"status": "error", "message": f"Stream error: {str(e)}"}
-                yield f"data: {json.dumps(error_message)}\n\n"
+            message = await queue.get()
+            if message is None:
                 break
+            yield sse_event({'status': 'processing', 'message': str(message)})
 
         try:
-            await task
+            report = await task
         except Exception as e:
-            logger.error(f"[SSE] Task completed with error: {e}")
-            
-        final_message = {"status": "complete", "message": "Ingestion complete!"}
-        yield f"data: {json.dumps(final_message)}\n\n"
-
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "X-Accel-Buffering": "no",
-    }
-    
+            logger.error(f"Bulk ingestion failed: {e}", exc_info=True)
+            yield sse_event({'status': 'error', 'message': f'Error: {e}'})
+            return
+        final_message = {"status": "complete", "message": "Bulk ingestion complete!", "report": report}
+        yield sse_event(final_message)
+
     return StreamingResponse(
-        event_generator(), 
+        event_generator(),
         media_type="text/event-stream",
-        headers=headers
+        headers=SSE_HEADERS
     )
 
 
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_ingestion_job(
+    product_type: str = Form(..., description="The type of product"),
+    file: UploadFile = File(..., description="The PDF file to upload")
+):
+    """Queues the upload for background ingestion and returns the job immediately."""
+    return await _enqueue_ingestion(product_type, file)
+
+
+@router.get("/jobs", status_code=status.HTTP_200_OK)
+async def list_ingestion_jobs(
+    status_filter: Optional[str] = Query(None, alias="status", description="Only jobs with this status"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    return await ingestion_job_manager.list_jobs(limit=limit, status=status_filter)
+
+
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def get_ingestion_job(job_id: str):
+    job = await ingestion_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_ingestion_job(job_id: str):
+    job = await ingestion_job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Ingestion job not found")
+    return _job_event_stream(job_id)
+
+
 @router.delete("/vector-db/clear", status_code=status.HTTP_200_OK)
 async def clear_all_vector_databases():
     """
@@ -103,32 +238,43 @@ async def clear_all_vector_databases():
     try:
         deleted_dbs = []
         errors = []
+
+        # Waits for running ingestions (this process, and the bulk-ingest CLI)
+        # so none of them writes into a directory while it is being deleted.
+        async with hold_category_locks(settings.VALID_PRODUCT_TYPES):
+            # Release pooled handles (and chromadb's per-path clients) before the
+            # files underneath them are deleted.
+            vector_store_pool.invalidate_all(reset_clients=True)
+
+            # List of all database directories
+            db_paths = [
+                (settings.CHROMA_DB_DIR_AC, "ac_db"),
+                (settings.CHROMA_DB_DIR_REFRIGERATOR, "refrigerator_db"),
+                (settings.CHROMA_DB_DIR_WASHING_MACHINE, "washing_machine_db"),
+            ]
         
-        # List of all database directories
-        db_paths = [
-            (settings.CHROMA_DB_DIR_AC, "ac_db"),
-            (settings.CHROMA_DB_DIR_REFRIGERATOR, "refrigerator_db"),
-            (settings.CHROMA_DB_DIR_WASHING_MACHINE, "washing_machine_db"),
-        ]
-        
-        for db_path, db_name in db_paths:
-            try:
-                db_path_obj = Path(db_path)
-                if db_path_obj.exists():
-                    # Remove the entire directory
-                    shutil.rmtree(db_path)
-                    # Recreate the empty directory
-                    db_path_obj.mkdir(parents=True, exist_ok=True)
-                    deleted_dbs.append(db_name)
-                    logger.info(f"Successfully cleared {db_name} at {db_path}")
-                else:
-                    logger.warning(f"{db_name} does not exist at {db_path}")
-                    deleted_dbs.append(f"{db_name} (already empty)")
-            except Exception as e:
-                error_msg = f"Error clearing {db_name}: {str(e)}"
-                logger.error(error_msg)
-                errors.append(error_msg)
+            for db_path, db_name in db_paths:
+                try:
+                    db_path_obj = Path(db_path)
+                    if db_path_obj.exists():
+                        # Remove the entire directory
+                        shutil.rmtree(db_path)
+                        # Recreate the empty directory
+                        db_path_obj.mkdir(parents=True, exist_ok=True)
+                        deleted_dbs.append(db_name)
+                        logger.info(f"Successfully cleared {db_name} at {db_path}")
+                    else:
+                        logger.warning(f"{db_name} does not exist at {db_path}")
+                        deleted_dbs.append(f"{db_name} (already empty)")
+                except Exception as e:
+                    error_msg = f"Error clearing {db_name}: {str(e)}"
+                    logger.error(error_msg)
+                    errors.append(error_msg)
         
+            # Bump collection versions once the data is actually gone so no cached
+            # result computed against the old files survives the clear.
+            vector_store_pool.invalidate_all(reset_clients=True)
+
         if errors:
             return {
                 "status": "partial_success",
@@ -0,0 +1,283 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.rag.cache import CachedQueryEmbeddings, normalize_query
+from app.rag.embeddings import get_embedding_model
+from app.rag.model_numbers import extract_model_numbers, normalize_model_number
+from app.rag.vector_store_pool import vector_store_pool
+
+logger = logging.getLogger(__name__)
+
+
+# Replies where the expert found nothing to answer from; caching them would keep
+# serving "not found" after the answer has become findable.
+_NOT_FOUND_RE = re.compile(
+    r"\b(?:could not|couldn't|cannot|can't|unable to|did not|didn't) find\b"
+    r"|\bno (?:relevant )?information (?:about|on|regarding|in)\b"
+    r"|\bnot (?:found|mentioned|covered) in the (?:provided )?(?:documents?|manuals?|context)\b",
+    re.IGNORECASE,
+)
+
+
+def is_cacheable_answer(answer: str) -> bool:
+    """False for empty answers and for replies saying the manuals did not have the answer."""
+    return bool(answer and answer.strip()) and not _NOT_FOUND_RE.search(answer)
+
+
+def _model_key(question: str) -> str:
+    """The model numbers a question names, normalized and sorted, so only questions about the same models match."""
+    return ",".join(sorted({normalize_model_number(code) for code in extract_model_numbers(question)}))
+
+
+class SemanticAnswerCache:
+    """
+    Caches expert sub-agent answers and serves them for semantically similar
+    questions in the same product category about the same model numbers.
+
+    An entry is only reusable while the category's collection version is the
+    one it was answered against, so re-ingesting or clearing a category makes
+    its cached answers stale. Entries are evicted least-recently-used once a
+    category holds more than `max_entries`. They are persisted to an SQLite
+    file so they survive restarts; each store or hit writes only its own row.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        similarity_threshold: float,
+        max_entries: int,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.path = path
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, List[dict]] = {}
+        self._matrices: Dict[str, np.ndarray] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _embed(self, question: str) -> np.ndarray:
+        embedding_key = (settings.EMBEDDING_MODEL_NAME, settings.EMBEDDING_DEVICE, settings.EMBEDDING_NORMALIZE)
+        embeddings = CachedQueryEmbeddings(get_embedding_model(), embedding_key)
+        vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @contextmanager
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "category TEXT NOT NULL, question_key TEXT NOT NULL, question TEXT NOT NULL, "
+                "answer TEXT NOT NULL, models TEXT NOT NULL, embedding BLOB NOT NULL, version INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (category, question_key))"
+            )
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _write(self, statements: List[tuple]):
+        """Runs (sql, params) statements in one transaction; a failed write only costs persistence."""
+        try:
+            with self._connect() as conn:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+        except Exception as e:
+            logger.warning(f"Could not persist semantic answer cache to {self.path}: {e}")
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        self._entries = {}
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT category, question_key, question, answer, models, embedding, version, "
+                    "created_at, last_used, hits FROM answers"
+                ).fetchall()
+        except Exception as e:
+            logger.warning(f"Could not load semantic answer cache from {self.path}: {e}")
+            return
+        for category, question_key, question, answer, models, embedding, version, created_at, last_used, hits in rows:
+            self._entries.setdefault(category, []).append({
+                "question_key": question_key,
+                "question": question,
+                "answer": answer,
+                "models": models,
+                "embedding": np.frombuffer(embedding, dtype=np.float32),
+                "version": version,
+                "created_at": created_at,
+                "last_used": last_used,
+                "hits": hits,
+            })
+        logger.info(f"Loaded semantic answer cache with {len(rows)} entries from {self.path}")
+
+    def _counter(self, category: str) -> Dict[str, int]:
+        return self._stats.setdefault(category, {"hits": 0, "misses": 0, "stores": 0, "evictions": 0})
+
+    def _prune(self, category: str) -> List[dict]:
+        """Drops entries answered against an old collection version or past their TTL."""
+        version = vector_store_pool.version(category)
+        now = time.time()
+        entries = self._entries.get(category, [])
+        fresh = [
+            entry for entry in entries
+            if entry["version"] == version
+            and (not self.ttl_seconds or now - entry["created_at"] <= self.ttl_seconds)
+        ]
+        if len(fresh) != len(entries):
+            self._entries[category] = fresh
+            self._matrices.pop(category, None)
+            statements = [("DELETE FROM answers WHERE category = ? AND version != ?", (category, version))]
+            if self.ttl_seconds:
+                statements.append((
+                    "DELETE FROM answers WHERE category = ? AND created_at < ?", (category, now - self.ttl_seconds)
+                ))
+            self._write(statements)
+        return fresh
+
+    def _matrix(self, category: str, entries: List[dict]) -> np.ndarray:
+        matrix = self._matrices.get(category)
+        if matrix is None:
+            matrix = np.asarray([entry["embedding"] for entry in entries], dtype=np.float32)
+            self._matrices[category] = matrix
+        return matrix
+
+    def lookup(self, category: str, question: str) -> Optional[str]:
+        """Returns a cached answer for a sufficiently similar question, or None."""
+        if not settings.ANSWER_CACHE_ENABLED:
+            return None
+
+        query_vector = self._embed(question)
+        models = _model_key(question)
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._prune(category)
+            counter = self._counter(category)
+            if not entries:
+                counter["misses"] += 1
+                return None
+
+            similarities = self._matrix(category, entries) @ query_vector
+            # "WM3400CW won't drain" must not be answered with what was found for the WM5000.
+            similarities = np.where([entry["models"] == models for entry in entries], similarities, -1.0)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                counter["misses"] += 1
+                return None
+
+            entry = entries[best]
+            entry["last_used"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            counter["hits"] += 1
+            self._write([(
+                "UPDATE answers SET last_used = ?, hits = ? WHERE category = ? AND question_key = ?",
+                (entry["last_used"], entry["hits"], category, entry["question_key"]),
+            )])
+            logger.info(
+                f"Semantic answer cache hit for '{category}' (similarity={similarities[best]:.3f}): "
+                f"'{question}' ~ '{entry['question']}'"
+            )
+            return entry["answer"]
+
+    def store(self, category: str, question: str, answer: str):
+        """Records an expert answer for later reuse; "not found" replies are not cached."""
+        if not settings.ANSWER_CACHE_ENABLED or not is_cacheable_answer(answer):
+            return
+
+        query_vector = self._embed(question)
+        now = time.time()
+        with self._lock:
+            self._ensure_loaded()
+            entries = self._prune(category)
+            question_key = normalize_query(question)
+            entries = [entry for entry in entries if entry["question_key"] != question_key]
+            entry = {
+                "question_key": question_key,
+                "question": question,
+                "answer": answer,
+                "models": _model_key(question),
+                "embedding": query_vector,
+                "version": vector_store_pool.version(category),
+                "created_at": now,
+                "last_used": now,
+                "hits": 0,
+            }
+            entries.append(entry)
+            statements = [(
+                "INSERT OR REPLACE INTO answers (category, question_key, question, answer, models, embedding, "
+                "version, created_at, last_used, hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (category, question_key, question, answer, entry["models"], np.asarray(query_vector, dtype=np.float32).tobytes(),
+                 entry["version"], now, now, 0),
+            )]
+
+            counter = self._counter(category)
+            counter["stores"] += 1
+            if len(entries) > self.max_entries:
+                entries.sort(key=lambda entry: entry["last_used"])
+                evicted = entries[:len(entries) - self.max_entries]
+                counter["evictions"] += len(evicted)
+                entries = entries[len(evicted):]
+                statements.extend(
+                    ("DELETE FROM answers WHERE category = ? AND question_key = ?", (category, old["question_key"]))
+                    for old in evicted
+                )
+
+            self._entries[category] = entries
+            self._matrices.pop(category, None)
+            self._write(statements)
+
+    def clear(self, category: Optional[str] = None):
+        with self._lock:
+            self._ensure_loaded()
+            if category is None:
+                self._entries.clear()
+                self._matrices.clear()
+                self._write([("DELETE FROM answers", ())])
+            else:
+                self._entries.pop(category, None)
+                self._matrices.pop(category, None)
+                self._write([("DELETE FROM answers WHERE category = ?", (category,))])
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            categories = {}
+            for category in set(self._entries) | set(self._stats):
+                counter = self._counter(category)
+                lookups = counter["hits"] + counter["misses"]
+                categories[category] = {
+                    **counter,
+                    "entries": len(self._entries.get(category, [])),
+                    "hit_rate": round(counter["hits"] / lookups, 4) if lookups else 0.0,
+                }
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "similarity_threshold": self.similarity_threshold,
+                "categories": categories,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    path=settings.ANSWER_CACHE_PATH,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES_PER_CATEGORY,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+)
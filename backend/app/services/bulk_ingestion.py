@@ -0,0 +1,423 @@
+import os
+import json
+import asyncio
+import time
+import logging
+import datetime
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.rag.embeddings import get_embedding_model
+from app.rag.keyword_index import KeywordIndex
+from app.rag.model_numbers import annotate_model_numbers, top_model_numbers
+from app.rag.ocr import init_ocr_worker
+from app.rag.parsers import iter_pdf_documents, chunk_documents
+from app.rag.vector_store_pool import vector_store_pool
+from app.services.ingestion_manifest import ChunkIdAssigner, IngestionManifest, hash_file
+from app.services.ingestion_service import ensure_directories_exist, hold_category_locks
+
+logger = logging.getLogger(__name__)
+
+# Folder / file name fragments that identify a product category.
+CATEGORY_ALIASES = {
+    "washing_machine": "washing_machine",
+    "washing-machine": "washing_machine",
+    "washingmachine": "washing_machine",
+    "washer": "washing_machine",
+    "air_conditioner": "air_conditioner",
+    "air-conditioner": "air_conditioner",
+    "airconditioner": "air_conditioner",
+    "ac": "air_conditioner",
+    "refrigerator": "refrigerator",
+    "fridge": "refrigerator",
+}
+
+
+def infer_product_type(path: str) -> Optional[str]:
+    """
+    Guesses a manual's category from its path: the nearest directory named
+    after a category wins, then a category word in the file name itself.
+    """
+    parts = [part.lower() for part in os.path.normpath(path).split(os.sep)]
+    for part in reversed(parts[:-1]):
+        if part in CATEGORY_ALIASES:
+            return CATEGORY_ALIASES[part]
+
+    stem = os.path.splitext(parts[-1])[0].replace("-", "_").replace(" ", "_")
+    tokens = set(stem.split("_"))
+    for alias, category in CATEGORY_ALIASES.items():
+        alias = alias.replace("-", "_")
+        if alias in tokens or ("_" in alias and alias in stem):
+            return category
+    return None
+
+
+def discover_manuals(paths: Iterable[str], product_type: Optional[str] = None) -> Tuple[List[Tuple[str, str]], List[dict]]:
+    """
+    Expands files and directory trees into (pdf_path, product_type) pairs.
+
+    `product_type` forces the category for everything; otherwise it is
+    inferred per file. Returns the manuals and a failure record for each PDF
+    whose category could not be determined.
+    """
+    manuals, failures = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(
+                os.path.join(root, name)
+                for root, _, files in os.walk(path)
+                # Skips hidden directories such as uploads still waiting for ingestion.
+                if not any(part.startswith(".") for part in os.path.relpath(root, path).split(os.sep) if part != ".")
+                for name in files
+                if name.lower().endswith(".pdf")
+            )
+        else:
+            candidates = [path]
+
+        for pdf_path in candidates:
+            category = product_type or infer_product_type(pdf_path)
+            if category not in settings.VALID_PRODUCT_TYPES:
+                failures.append({
+                    "file": pdf_path,
+                    "error": f"Could not determine product type (valid types: {settings.VALID_PRODUCT_TYPES})",
+                })
+                continue
+            manuals.append((pdf_path, category))
+    return manuals, failures
+
+
+def _parse_manual(pdf_path: str) -> dict:
+    """Parses and chunks one manual in a worker process."""
+    start = time.perf_counter()
+    timings: List[dict] = []
+    documents: List[Document] = []
+    for shard_docs in iter_pdf_documents(pdf_path, workers=1, page_timings=timings):
+        documents.extend(shard_docs)
+    chunks = chunk_documents(documents)
+    return {
+        "pages": len(timings),
+        "elements": len(documents),
+        "chunks": chunks,
+        "parse_seconds": time.perf_counter() - start,
+    }
+
+
+class _ManualState:
+    def __init__(self, pdf_path: str, product_type: str, file_hash: str):
+        self.pdf_path = pdf_path
+        self.product_type = product_type
+        self.source = os.path.basename(pdf_path)
+        self.file_hash = file_hash
+        self.chunk_ids: List[str] = []
+        self.model_numbers: List[List[str]] = []
+        # (chunk_id, metadata) of chunks already stored; applied once the manual is recorded.
+        self.metadata_updates: List[Tuple[str, dict]] = []
+        self.pending = 0
+        self.report = {"file": pdf_path, "product_type": product_type, "status": "queued"}
+
+
+class BulkIngestionRunner:
+    """
+    Ingests many manuals in one pass.
+
+    Whole files are parsed in parallel across a process pool (one core per
+    manual rather than page shards of one manual), and chunks from different
+    manuals are pooled into large embedding batches so the model always sees
+    full batches. A manual is recorded in its category's manifest once all of
+    its chunks are stored, so the usual skip-unchanged and stale-chunk rules
+    apply. Callers must ensure nothing else writes to the same categories
+    while a run is in progress.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        embed_batch_size: Optional[int] = None,
+        progress: Optional[Callable[[str], None]] = None,
+    ):
+        workers = workers if workers is not None else settings.BULK_INGEST_WORKERS
+        self.workers = workers if workers > 0 else max(1, (os.cpu_count() or 1) - 1)
+        self.embed_batch_size = embed_batch_size or settings.BULK_INGEST_EMBED_BATCH_SIZE
+        self.progress = progress or (lambda message: None)
+
+        self._manifests: Dict[str, IngestionManifest] = {}
+        self._batch: List[Tuple[_ManualState, str, Document]] = []
+        self._totals = {"pages": 0, "elements": 0, "chunks": 0, "embedded": 0, "unchanged": 0, "stored": 0, "stale_removed": 0}
+        self._stage_seconds = {"parse": 0.0, "embed": 0.0, "upsert": 0.0}
+
+    def _manifest(self, product_type: str) -> IngestionManifest:
+        if product_type not in self._manifests:
+            self._manifests[product_type] = IngestionManifest(product_type)
+        return self._manifests[product_type]
+
+    # -- embedding / storage ----------------------------------------------------
+
+    def _flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+
+        # Content-addressed IDs: drop chunks the collection already holds.
+        by_category: Dict[str, List[Tuple[_ManualState, str, Document]]] = {}
+        for state, chunk_id, chunk in batch:
+            by_category.setdefault(state.product_type, []).append((state, chunk_id, chunk))
+        new_by_category: Dict[str, List[Tuple[str, Document]]] = {}
+        for product_type, items in by_category.items():
+            collection = vector_store_pool.get(product_type)._collection
+            stored = set(collection.get(ids=[chunk_id for _, chunk_id, _ in items], include=[])["ids"])
+            new_by_category[product_type] = [(chunk_id, chunk) for _, chunk_id, chunk in items if chunk_id not in stored]
+            unchanged = [(state, chunk_id, chunk) for state, chunk_id, chunk in items if chunk_id in stored]
+            for state, chunk_id, chunk in unchanged:
+                # Same text, but a revision can move it to other pages.
+                state.metadata_updates.append((chunk_id, chunk.metadata))
+            self._totals["unchanged"] += len(unchanged)
+
+        new = [(product_type, chunk_id, chunk) for product_type, items in new_by_category.items() for chunk_id, chunk in items]
+        if new:
+            start = time.perf_counter()
+            embeddings = get_embedding_model().embed_documents([chunk.page_content for _, _, chunk in new])
+            self._stage_seconds["embed"] += time.perf_counter() - start
+            self._totals["embedded"] += len(new)
+
+            start = time.perf_counter()
+            offset = 0
+            for product_type, items in new_by_category.items():
+                if items:
+                    ids = [chunk_id for chunk_id, _ in items]
+                    documents = [chunk.page_content for _, chunk in items]
+                    vector_store_pool.get(product_type)._collection.upsert(
+                        ids=ids,
+                        embeddings=embeddings[offset:offset + len(items)],
+                        documents=documents,
+                        metadatas=[chunk.metadata for _, chunk in items],
+                    )
+                    KeywordIndex(product_type).add(ids, documents, [chunk.metadata.get("source") for _, chunk in items])
+                offset += len(items)
+            self._stage_seconds["upsert"] += time.perf_counter() - start
+            self._totals["stored"] += len(new)
+
+        finished = []
+        for state, _, _ in batch:
+            state.pending -= 1
+            if state.pending == 0:
+                finished.append(state)
+        for state in finished:
+            self._finish_manual(state)
+        self.progress(self._summary())
+
+    def _finish_manual(self, state: _ManualState):
+        manifest = self._manifest(state.product_type)
+        if state.metadata_updates:
+            vector_store_pool.get(state.product_type)._collection.update(
+                ids=[chunk_id for chunk_id, _ in state.metadata_updates],
+                metadatas=[metadata for _, metadata in state.metadata_updates],
+            )
+        current_ids = set(state.chunk_ids)
+        previous = manifest.get(state.source) or {}
+        stale_ids = [chunk_id for chunk_id in previous.get("chunk_ids", []) if chunk_id not in current_ids]
+        if stale_ids:
+            vector_store_pool.get(state.product_type).delete(ids=stale_ids)
+            KeywordIndex(state.product_type).remove(stale_ids)
+            self._totals["stale_removed"] += len(stale_ids)
+        manifest.record(state.source, state.file_hash, state.chunk_ids, model_numbers=top_model_numbers(state.model_numbers))
+        manifest.save()
+        state.report["status"] = "succeeded"
+        state.report["stale_removed"] = len(stale_ids)
+
+    def _discard_unrecorded(self, state: _ManualState):
+        """Deletes the chunks an unfinished manual stored that its manifest entry does not list."""
+        recorded = set((self._manifest(state.product_type).get(state.source) or {}).get("chunk_ids", []))
+        orphan_ids = [chunk_id for chunk_id in dict.fromkeys(state.chunk_ids) if chunk_id not in recorded]
+        if orphan_ids:
+            vector_store_pool.get(state.product_type).delete(ids=orphan_ids)
+            KeywordIndex(state.product_type).remove(orphan_ids)
+
+    def _add_chunks(self, state: _ManualState, chunks: List[Document]):
+        assigner = ChunkIdAssigner(state.source)
+        state.pending = len(chunks)
+        for chunk in chunks:
+            chunk_id = assigner.assign(chunk)
+            chunk.metadata["chunk_id"] = chunk_id
+            chunk.metadata["file_hash"] = state.file_hash
+            state.model_numbers.append(annotate_model_numbers(chunk))
+            state.chunk_ids.append(chunk_id)
+            self._batch.append((state, chunk_id, chunk))
+            if len(self._batch) >= self.embed_batch_size:
+                self._flush()
+
+    # -- driver -------------------------------------------------------------------
+
+    def _summary(self) -> str:
+        elapsed = max(time.perf_counter() - self._started_at, 1e-6)
+        return (
+            f"Bulk ingestion: {self._totals['pages']} pages ({self._totals['pages'] / elapsed:.1f} pages/s), "
+            f"{self._totals['chunks']} chunks ({self._totals['chunks'] / elapsed:.1f} chunks/s), "
+            f"embedded {self._totals['embedded']}, unchanged {self._totals['unchanged']}"
+        )
+
+    def _prepare(self, manuals: List[Tuple[str, str]], reports: List[dict]) -> List[_ManualState]:
+        """Hashes every manual and drops the ones that are already indexed."""
+        to_parse = []
+        seen_hashes: Dict[Tuple[str, str], str] = {}
+        seen_sources: Dict[Tuple[str, str], str] = {}
+        for pdf_path, product_type in manuals:
+            try:
+                state = _ManualState(pdf_path, product_type, hash_file(pdf_path))
+            except Exception as e:
+                reports.append({"file": pdf_path, "product_type": product_type, "status": "failed", "error": str(e)})
+                continue
+            reports.append(state.report)
+
+            # Chunk IDs and manifest entries are keyed by file name, so a second
+            # file of the same name in the category would overwrite the first.
+            same_name = seen_sources.setdefault((product_type, state.source), pdf_path)
+            if same_name != pdf_path:
+                state.report.update(status="failed", error=f"Duplicate source name {state.source!r}: already used by {same_name} in this run")
+                continue
+
+            manifest = self._manifest(product_type)
+            duplicate_of = (
+                state.source if manifest.is_current(state.source, state.file_hash)
+                else manifest.find_by_hash(state.file_hash) or seen_hashes.get((product_type, state.file_hash))
+            )
+            if duplicate_of:
+                state.report.update(status="skipped", reason="unchanged" if duplicate_of == state.source else f"duplicate of {duplicate_of}")
+                continue
+            seen_hashes[(product_type, state.file_hash)] = state.source
+            to_parse.append(state)
+        return to_parse
+
+    def run(self, manuals: List[Tuple[str, str]], failures: Optional[List[dict]] = None) -> dict:
+        """
+        Ingests `manuals` ((pdf_path, product_type) pairs) and returns the
+        report: totals, throughput, and per-file status with any errors.
+        """
+        self._started_at = time.perf_counter()
+        reports: List[dict] = [{**failure, "status": "failed"} for failure in failures or []]
+        categories = sorted({product_type for _, product_type in manuals})
+        states: List[_ManualState] = []
+
+        try:
+            for product_type in categories:
+                ensure_directories_exist(product_type)
+            states = self._prepare(manuals, reports)
+            self.progress(f"Found {len(manuals)} manuals; {len(states)} need ingestion")
+
+            if states:
+                get_embedding_model()
+                workers = min(self.workers, len(states))
+                # 'spawn' keeps workers clear of any threads/torch state in the parent.
+                mp_context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=init_ocr_worker) as executor:
+                    remaining = deque(states)
+                    in_flight = deque()
+                    done = 0
+                    while remaining or in_flight:
+                        # Keep at most two parsed manuals per worker waiting for embedding.
+                        while remaining and len(in_flight) < workers * 2:
+                            state = remaining.popleft()
+                            state.report["status"] = "parsing"
+                            in_flight.append((state, executor.submit(_parse_manual, state.pdf_path)))
+
+                        state, future = in_flight.popleft()
+                        done += 1
+                        try:
+                            parsed = future.result()
+                        except Exception as e:
+                            logger.error(f"Bulk ingestion failed to parse {state.pdf_path}: {e}", exc_info=True)
+                            state.report.update(status="failed", error=str(e))
+                            self.progress(f"[{done}/{len(states)}] Failed to parse {state.source}: {e}")
+                            continue
+
+                        self._stage_seconds["parse"] += parsed["parse_seconds"]
+                        self._totals["pages"] += parsed["pages"]
+                        self._totals["elements"] += parsed["elements"]
+                        self._totals["chunks"] += len(parsed["chunks"])
+                        state.report.update(pages=parsed["pages"], chunks=len(parsed["chunks"]))
+                        self.progress(f"[{done}/{len(states)}] Parsed {state.source}: {parsed['pages']} pages, {len(parsed['chunks'])} chunks")
+
+                        if not parsed["chunks"]:
+                            state.report.update(status="failed", error="No content extracted from PDF.")
+                            continue
+                        state.report["status"] = "embedding"
+                        self._add_chunks(state, parsed["chunks"])
+                self._flush()
+        finally:
+            # Manuals cut off mid-embedding: their stored chunks are not in the manifest.
+            for state in states:
+                if state.report["status"] == "embedding":
+                    try:
+                        self._discard_unrecorded(state)
+                    except Exception as e:
+                        logger.error(f"Could not remove the chunks of the unfinished ingestion of {state.pdf_path}: {e}")
+            for product_type in categories:
+                vector_store_pool.invalidate(product_type)
+            # Anything still mid-flight when an error escaped did not make it into the index.
+            for report in reports:
+                if report["status"] in ("queued", "parsing", "embedding"):
+                    report.update(status="failed", error=report.get("error") or "Interrupted")
+
+        elapsed = time.perf_counter() - self._started_at
+        report = {
+            "finished_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "elapsed_seconds": round(elapsed, 2),
+            "files": len(reports),
+            "succeeded": sum(1 for r in reports if r["status"] == "succeeded"),
+            "skipped": sum(1 for r in reports if r["status"] == "skipped"),
+            "failed": sum(1 for r in reports if r["status"] == "failed"),
+            **self._totals,
+            "pages_per_second": round(self._totals["pages"] / max(elapsed, 1e-6), 2),
+            "chunks_per_second": round(self._totals["chunks"] / max(elapsed, 1e-6), 2),
+            "stage_seconds": {k: round(v, 2) for k, v in self._stage_seconds.items()},
+            "workers": self.workers,
+            "embed_batch_size": self.embed_batch_size,
+            "manuals": reports,
+        }
+        logger.info(
+            f"Bulk ingestion finished: {report['succeeded']} succeeded, {report['skipped']} skipped, "
+            f"{report['failed']} failed; {report['pages_per_second']} pages/s, {report['chunks_per_second']} chunks/s"
+        )
+        return report
+
+
+def write_report(report: dict, path: Optional[str] = None) -> str:
+    """Writes a bulk ingestion report as JSON and returns its path."""
+    if path is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(settings.BULK_INGEST_REPORT_DIR, f"bulk_ingest_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+async def run_bulk_ingestion(
+    manuals: List[Tuple[str, str]],
+    failures: Optional[List[dict]] = None,
+    queue: Optional[asyncio.Queue] = None,
+) -> dict:
+    """
+    Runs a bulk ingestion from the API: holds the affected categories' write
+    locks, runs off the event loop, writes the report file, and sends progress
+    messages to `queue` (terminated by None).
+    """
+    loop = asyncio.get_running_loop()
+
+    def report_progress(message: str):
+        if queue is not None:
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    try:
+        async with hold_category_locks(product_type for _, product_type in manuals):
+            runner = BulkIngestionRunner(progress=report_progress)
+            report = await asyncio.to_thread(runner.run, manuals, failures)
+        report["report_path"] = await asyncio.to_thread(write_report, report)
+        return report
+    finally:
+        if queue is not None:
+            await queue.put(None)
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+from typing import List, Optional, Sequence, Set
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database.database import SessionLocal
+from app.models.session import ChatMessage, ChatSession
+from app.rag.chains import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Longest excerpt of one message fed to the summarizer, and most messages per update.
+_SUMMARY_INPUT_CHARS = 2000
+_SUMMARY_MAX_MESSAGES = 40
+
+_SUMMARY_PROMPT = """You maintain a running summary of a customer-support conversation about home appliances (washing machines, refrigerators, air conditioners).
+
+Update the summary with the new messages below. Keep what later questions may depend on: the products and model numbers discussed, symptoms and error codes, steps already suggested or tried, and any open questions. Drop greetings and pleasantries. Write at most {max_words} words of plain prose.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}
+
+Updated summary:"""
+
+_summary_tasks: Set[asyncio.Task] = set()
+_sessions_updating: Set[str] = set()
+
+
+def _window_size() -> int:
+    return max(1, settings.CONTEXT_MAX_TURNS) * 2
+
+
+def _summary_query(session_id: str):
+    return select(ChatSession.summary, ChatSession.summary_message_id).where(ChatSession.id == session_id)
+
+
+def _recent_rows_query(session_id: str, after_id: Optional[int], limit: int):
+    """The newest `limit` messages of a session (after `after_id`), newest first; only the needed columns."""
+    query = select(ChatMessage.id, ChatMessage.sender, ChatMessage.content).where(ChatMessage.session_id == session_id)
+    if after_id is not None:
+        query = query.where(ChatMessage.id > after_id)
+    return query.order_by(ChatMessage.id.desc()).limit(limit)
+
+
+def _fit_budget(rows: Sequence, token_budget: int) -> list:
+    """
+    Newest rows that fit the token budget; the newest one is always kept.
+    The window never opens on an answer whose question was cut off.
+    """
+    kept = []
+    used = 0
+    for row in reversed(rows):
+        tokens = estimate_tokens(row.content)
+        if kept and used + tokens > token_budget:
+            break
+        kept.append(row)
+        used += tokens
+    kept.reverse()
+    while len(kept) > 1 and kept[0].sender == "ai":
+        kept.pop(0)
+    return kept
+
+
+def _to_message(row) -> Optional[BaseMessage]:
+    if row.sender == "human":
+        return HumanMessage(content=row.content)
+    if row.sender == "ai":
+        return AIMessage(content=row.content)
+    return None
+
+
+def _history_limit() -> int:
+    return _window_size() + (max(1, settings.CONTEXT_SUMMARY_BATCH) if settings.CONTEXT_SUMMARY_ENABLED else 0)
+
+
+def _build_messages(summary: Optional[str], rows: Sequence, new_message: Optional[str] = None) -> List[BaseMessage]:
+    rows = list(reversed(rows))
+    if new_message is not None:
+        rows.append(SimpleNamespace(sender="human", content=new_message))
+    rows = _fit_budget(rows, settings.CONTEXT_TOKEN_BUDGET)
+    messages: List[BaseMessage] = []
+    if summary:
+        messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+    messages.extend(message for message in map(_to_message, rows) if message is not None)
+    return messages
+
+
+def load_conversation_messages(db, session_id: str) -> List[BaseMessage]:
+    """
+    Builds the message list for the agents from the session's recent history.
+
+    Messages not yet folded into the rolling summary are sent verbatim, newest
+    first until CONTEXT_TOKEN_BUDGET is spent. That is normally the last
+    CONTEXT_MAX_TURNS turns, plus up to CONTEXT_SUMMARY_BATCH messages waiting
+    for the next summary update. Older turns are represented by the summary,
+    which is prepended as a system message. Only those rows are read.
+    """
+    summary, summary_message_id = None, None
+    if settings.CONTEXT_SUMMARY_ENABLED:
+        session = db.execute(_summary_query(session_id)).first()
+        if session is not None:
+            summary, summary_message_id = session.summary, session.summary_message_id
+    rows = db.execute(_recent_rows_query(session_id, summary_message_id, _history_limit())).all()
+    return _build_messages(summary, rows)
+
+
+async def aload_conversation_messages(
+    db: AsyncSession, session_id: str, new_message: Optional[str] = None
+) -> List[BaseMessage]:
+    """
+    Async variant of `load_conversation_messages` for an `AsyncSession`.
+    `new_message` is a human message not stored yet; it is appended as the
+    newest turn, so the history need not be re-read after inserting it.
+    """
+    summary, summary_message_id = None, None
+    if settings.CONTEXT_SUMMARY_ENABLED:
+        session = (await db.execute(_summary_query(session_id))).first()
+        if session is not None:
+            summary, summary_message_id = session.summary, session.summary_message_id
+    limit = _history_limit() - (1 if new_message is not None else 0)
+    rows = (await db.execute(_recent_rows_query(session_id, summary_message_id, limit))).all()
+    return _build_messages(summary, rows, new_message)
+
+
+def _messages_to_fold(session_id: str) -> tuple:
+    """(current summary, rows that have left the verbatim window and are not summarized yet)."""
+    with SessionLocal() as db:
+        session = (
+            db.query(ChatSession.summary, ChatSession.summary_message_id)
+            .filter(ChatSession.id == session_id)
+            .first()
+        )
+        if session is None:
+            return None, []
+        query = db.query(ChatMessage.id, ChatMessage.sender, ChatMessage.content).filter(ChatMessage.session_id == session_id)
+        if session.summary_message_id is not None:
+            query = query.filter(ChatMessage.id > session.summary_message_id)
+        # The verbatim window is sized by count and token budget exactly as when
+        # it is loaded, so rows dropped for the budget are summarized, not lost.
+        window = _fit_budget(
+            list(reversed(query.order_by(ChatMessage.id.desc()).limit(_window_size()).all())),
+            settings.CONTEXT_TOKEN_BUDGET,
+        )
+        if not window:
+            return session.summary, []
+        window_start = window[0].id
+        rows = query.filter(ChatMessage.id < window_start).order_by(ChatMessage.id).limit(_SUMMARY_MAX_MESSAGES).all()
+    return session.summary, rows
+
+
+def _save_summary(session_id: str, summary: str, summary_message_id: int):
+    with SessionLocal() as db:
+        db.query(ChatSession).filter(ChatSession.id == session_id).update(
+            {ChatSession.summary: summary, ChatSession.summary_message_id: summary_message_id},
+            synchronize_session=False,
+        )
+        db.commit()
+
+
+async def update_session_summary(session_id: str) -> bool:
+    """
+    Folds messages that have left the verbatim window into the session's
+    rolling summary, once at least CONTEXT_SUMMARY_BATCH of them have
+    accumulated. Returns whether the summary was updated.
+    """
+    summary, rows = await asyncio.to_thread(_messages_to_fold, session_id)
+    if len(rows) < max(1, settings.CONTEXT_SUMMARY_BATCH):
+        return False
+
+    transcript = "\n".join(
+        f"{'User' if row.sender == 'human' else 'Assistant'}: {row.content[:_SUMMARY_INPUT_CHARS]}"
+        for row in rows
+    )
+    prompt = _SUMMARY_PROMPT.format(
+        max_words=settings.CONTEXT_SUMMARY_MAX_WORDS,
+        summary=summary or "(none yet)",
+        transcript=transcript,
+    )
+
+    from app.rag.generators import get_summary_model
+
+    response = await get_summary_model().ainvoke(prompt)
+    new_summary = response.content if isinstance(response.content, str) else str(response.content)
+    await asyncio.to_thread(_save_summary, session_id, new_summary.strip(), rows[-1].id)
+    logger.info(f"Folded {len(rows)} messages into the summary of session {session_id}")
+    return True
+
+
+def schedule_summary_update(session_id: str):
+    """
+    Starts a background summary update for a session, unless summaries are
+    disabled or one is already running for it (the next turn catches up).
+    """
+    if not settings.CONTEXT_SUMMARY_ENABLED or session_id in _sessions_updating:
+        return
+
+    async def run():
+        try:
+            await update_session_summary(session_id)
+        except Exception as e:
+            logger.warning(f"Could not update the conversation summary of session {session_id}: {e}")
+        finally:
+            _sessions_updating.discard(session_id)
+
+    _sessions_updating.add(session_id)
+    task = asyncio.create_task(run())
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
@@ -0,0 +1,372 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from sqlalchemy import update, func
+
+from app.core.config import settings
+from app.database.database import SessionLocal
+from app.models.ingestion_job import IngestionJob
+from app.services.ingestion_service import store_process_chunk_ingest
+from app.services.upload_storage import discard_upload, promote_upload
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_SKIPPED = "skipped"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = {JOB_SUCCEEDED, JOB_SKIPPED, JOB_FAILED}
+
+
+def job_to_dict(job: IngestionJob) -> dict:
+    return {
+        "id": job.id,
+        "product_type": job.product_type,
+        "file_name": job.file_name,
+        "file_hash": job.file_hash,
+        "status": job.status,
+        "message": job.message,
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def progress_event(message: str) -> dict:
+    """SSE payload for one progress message, in the format the upload stream has always used."""
+    status = "error" if message.lower().startswith("error") else "processing"
+    return {"status": status, "message": message}
+
+
+# -- database helpers (sync; run on a worker thread) --------------------------
+
+def _create_job(product_type: str, file_name: str, pdf_path: str, file_hash: Optional[str]) -> dict:
+    with SessionLocal() as db:
+        job = IngestionJob(
+            product_type=product_type,
+            file_name=file_name,
+            pdf_path=pdf_path,
+            file_hash=file_hash,
+            status=JOB_QUEUED,
+            message="Queued for ingestion",
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job_to_dict(job)
+
+
+def _get_job(job_id: str) -> Optional[dict]:
+    with SessionLocal() as db:
+        job = db.get(IngestionJob, job_id)
+        return job_to_dict(job) if job else None
+
+
+def _list_jobs(limit: int, status: Optional[str]) -> List[dict]:
+    with SessionLocal() as db:
+        query = db.query(IngestionJob)
+        if status:
+            query = query.filter(IngestionJob.status == status)
+        jobs = query.order_by(IngestionJob.created_at.desc()).limit(limit).all()
+        return [job_to_dict(job) for job in jobs]
+
+
+def _claim_job(job_id: str) -> Optional[dict]:
+    """Atomically moves a queued job to running; None if someone else got it first."""
+    with SessionLocal() as db:
+        claimed = db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.id == job_id, IngestionJob.status == JOB_QUEUED)
+            .values(
+                status=JOB_RUNNING,
+                attempts=IngestionJob.attempts + 1,
+                started_at=func.now(),
+                message="Ingestion started",
+            )
+        ).rowcount
+        db.commit()
+        if not claimed:
+            return None
+        job = db.get(IngestionJob, job_id)
+        return {**job_to_dict(job), "pdf_path": job.pdf_path}
+
+
+def _update_job(job_id: str, **values):
+    with SessionLocal() as db:
+        db.execute(update(IngestionJob).where(IngestionJob.id == job_id).values(**values))
+        db.commit()
+
+
+def _recover_jobs(max_attempts: int) -> List[str]:
+    """
+    Re-queues jobs that were running when the process stopped (giving up on
+    ones that have already been interrupted too often) and returns the IDs of
+    all queued jobs, oldest first.
+    """
+    with SessionLocal() as db:
+        db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.status == JOB_RUNNING, IngestionJob.attempts >= max_attempts)
+            .values(
+                status=JOB_FAILED,
+                error=f"Interrupted {max_attempts} times; giving up.",
+                message=f"Error: ingestion was interrupted {max_attempts} times",
+                finished_at=func.now(),
+            )
+        )
+        db.execute(
+            update(IngestionJob)
+            .where(IngestionJob.status == JOB_RUNNING)
+            .values(status=JOB_QUEUED, message="Re-queued after restart")
+        )
+        db.commit()
+        rows = (
+            db.query(IngestionJob.id)
+            .filter(IngestionJob.status == JOB_QUEUED)
+            .order_by(IngestionJob.created_at)
+            .all()
+        )
+        return [row.id for row in rows]
+
+
+class _JobProgress:
+    """Live progress of one job: recent messages plus the streams attached to it."""
+
+    def __init__(self, history_size: int):
+        self.history: deque = deque(maxlen=history_size)
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.finished = False
+
+    def publish(self, event: dict):
+        self.history.append(event)
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(event)
+
+    def finish(self):
+        self.finished = True
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(None)
+
+    def subscribe(self) -> asyncio.Queue:
+        # Replay what already happened, then follow live.
+        subscriber: asyncio.Queue = asyncio.Queue()
+        for event in self.history:
+            subscriber.put_nowait(event)
+        if self.finished:
+            subscriber.put_nowait(None)
+        else:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+
+class IngestionJobManager:
+    """
+    Runs ingestions as durable background jobs, independent of the HTTP
+    request that submitted them.
+
+    Jobs are rows in the `ingestion_jobs` table, so they survive restarts:
+    anything queued or interrupted mid-run is picked up again on startup (the
+    content-addressed chunk IDs make a re-run cheap). A fixed number of worker
+    tasks bounds how many CPU-heavy ingestions run at once, and writes to a
+    category's vector store are still serialized by the ingestion service's
+    per-category lock. Progress is fanned out in memory to any number of SSE
+    streams, which can attach and re-attach at any time.
+    """
+
+    def __init__(self, workers: Optional[int] = None):
+        self.workers = workers or settings.INGEST_JOB_WORKERS
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._progress: Dict[str, _JobProgress] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, resume: Optional[bool] = None):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        resume = settings.INGEST_JOB_RESUME_ON_STARTUP if resume is None else resume
+        if resume:
+            try:
+                job_ids = await asyncio.to_thread(_recover_jobs, settings.INGEST_JOB_MAX_ATTEMPTS)
+            except Exception as e:
+                logger.warning(f"Could not recover ingestion jobs: {e}")
+                job_ids = []
+            for job_id in job_ids:
+                self._track(job_id)
+                self._queue.put_nowait(job_id)
+            if job_ids:
+                logger.info(f"Resuming {len(job_ids)} queued ingestion job(s)")
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"ingestion-worker-{index}")
+            for index in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Stops the workers and their ingestions. Interrupted jobs stay 'running' and are resumed on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _track(self, job_id: str) -> _JobProgress:
+        progress = self._progress.get(job_id)
+        if progress is None:
+            progress = self._progress[job_id] = _JobProgress(settings.INGEST_JOB_PROGRESS_HISTORY)
+        return progress
+
+    # -- public API -----------------------------------------------------------
+
+    async def enqueue(self, product_type: str, file_name: str, pdf_path: str, file_hash: Optional[str] = None) -> dict:
+        if not self._tasks:
+            raise RuntimeError("Ingestion job workers are not running.")
+        job = await asyncio.to_thread(_create_job, product_type, file_name, pdf_path, file_hash)
+        self._track(job["id"]).publish({"status": "processing", "message": job["message"]})
+        self._queue.put_nowait(job["id"])
+        logger.info(f"Queued ingestion job {job['id']} for {file_name} ({product_type})")
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(_get_job, job_id)
+
+    async def list_jobs(self, limit: int = 50, status: Optional[str] = None) -> List[dict]:
+        return await asyncio.to_thread(_list_jobs, limit, status)
+
+    async def stream(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Yields a job's progress events until it finishes. Attaching late replays
+        the recent history first; jobs this process is not running (finished,
+        or owned by another process) are followed by polling the table.
+        """
+        progress = self._progress.get(job_id)
+        if progress is not None:
+            subscriber = progress.subscribe()
+            try:
+                while True:
+                    event = await subscriber.get()
+                    if event is None:
+                        return
+                    yield event
+            finally:
+                progress.subscribers.discard(subscriber)
+
+        last_message = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            if job["message"] and job["message"] != last_message:
+                last_message = job["message"]
+                yield progress_event(last_message)
+            if job["status"] in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(settings.INGEST_PROGRESS_INTERVAL_SECONDS)
+
+    # -- workers --------------------------------------------------------------
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion worker {index} failed on job {job_id}: {e}", exc_info=True)
+                try:
+                    await asyncio.to_thread(
+                        _update_job, job_id, status=JOB_FAILED, message=f"Error: {e}",
+                        error=str(e), finished_at=func.now(),
+                    )
+                except Exception as db_error:
+                    logger.error(f"Could not mark ingestion job {job_id} as failed: {db_error}")
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        progress = self._track(job_id)
+        task = None
+        try:
+            job = await asyncio.to_thread(_claim_job, job_id)
+            if job is None:
+                # Finished, or claimed by another process in the meantime.
+                return
+
+            if not os.path.exists(job["pdf_path"]):
+                message = f"Error: stored PDF {job['file_name']} no longer exists"
+                progress.publish(progress_event(message))
+                await asyncio.to_thread(
+                    _update_job, job_id, status=JOB_FAILED, message=message,
+                    error="PDF file missing", finished_at=func.now(),
+                )
+                return
+
+            queue: asyncio.Queue = asyncio.Queue()
+            task = asyncio.create_task(
+                store_process_chunk_ingest(
+                    queue=queue,
+                    file_name=job["file_name"],
+                    pdf_path=job["pdf_path"],
+                    product_type=job["product_type"],
+                    # A retried job re-hashes in case the file was replaced meanwhile.
+                    file_hash=job["file_hash"] if job["attempts"] == 1 else None,
+                )
+            )
+
+            last_saved = 0.0
+            while True:
+                message = await queue.get()
+                if message is None:
+                    break
+                message = str(message)
+                progress.publish(progress_event(message))
+                if time.monotonic() - last_saved >= settings.INGEST_PROGRESS_INTERVAL_SECONDS:
+                    await asyncio.to_thread(_update_job, job_id, message=message)
+                    last_saved = time.monotonic()
+
+            outcome = await task
+            status = outcome.get("status", JOB_FAILED)
+            pdf_path = job["pdf_path"]
+            try:
+                # Only now does the upload replace an earlier version of the manual.
+                if status == JOB_FAILED:
+                    await asyncio.to_thread(discard_upload, pdf_path)
+                else:
+                    pdf_path = await asyncio.to_thread(promote_upload, pdf_path)
+            except OSError as e:
+                logger.error(f"Could not move the upload of job {job_id} into place: {e}")
+            await asyncio.to_thread(
+                _update_job,
+                job_id,
+                status=status,
+                pdf_path=pdf_path,
+                message=progress.history[-1]["message"] if progress.history else None,
+                result=outcome,
+                error=outcome.get("error"),
+                file_hash=outcome.get("file_hash") or job["file_hash"],
+                finished_at=func.now(),
+            )
+            logger.info(f"Ingestion job {job_id} ({job['file_name']}) finished: {status}")
+        finally:
+            if task is not None and not task.done():
+                # The worker was cancelled (shutdown): stop the ingestion too
+                # instead of leaving it running unowned. The job stays
+                # 'running' and is resumed on the next start.
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            progress.finish()
+            self._progress.pop(job_id, None)
+
+
+ingestion_job_manager = IngestionJobManager()
@@ -0,0 +1,142 @@
+import os
+import json
+import mmap
+import hashlib
+import logging
+import datetime
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from app.rag.model_numbers import normalize_model_number
+from app.rag.vector_store_pool import get_persist_directory
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, read through a memory map so large PDFs are not copied into memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            digest.update(mapped)
+    return digest.hexdigest()
+
+
+class ChunkIdAssigner:
+    """
+    Hands out deterministic, content-addressed IDs for a manual's chunks.
+
+    The ID is a hash of the manual name and the chunk text, so an unchanged
+    chunk keeps its ID across re-uploads and revisions. Identical chunks within
+    one manual are disambiguated by their occurrence number. Works one chunk at
+    a time so streaming ingestion can assign IDs as chunks are produced.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._seen: Dict[str, int] = {}
+
+    def assign(self, chunk: Document) -> str:
+        digest = hashlib.sha256(f"{self.source}\0{chunk.page_content}".encode("utf-8")).hexdigest()[:32]
+        occurrence = self._seen.get(digest, 0)
+        self._seen[digest] = occurrence + 1
+        return f"{digest}-{occurrence}"
+
+
+def assign_chunk_ids(chunks: List[Document], source: str) -> List[str]:
+    """Content-addressed IDs for a whole list of chunks (see `ChunkIdAssigner`)."""
+    assigner = ChunkIdAssigner(source)
+    return [assigner.assign(chunk) for chunk in chunks]
+
+
+class IngestionManifest:
+    """
+    Records which manuals are indexed in a category's collection: the PDF hash
+    and the chunk IDs each one contributed.
+
+    Stored inside the category's ChromaDB directory so clearing the vector
+    database also clears the manifest.
+    """
+
+    def __init__(self, product_category: str):
+        persist_directory = get_persist_directory(product_category)
+        if not persist_directory:
+            raise ValueError(f"Unknown product category: {product_category}")
+        self.product_category = product_category
+        self.path = os.path.join(persist_directory, MANIFEST_FILE_NAME)
+        # False when there is no manifest or it could not be read, i.e. an
+        # empty `manuals` does not prove the collection holds no manuals.
+        self.loaded = False
+        self.manuals: Dict[str, dict] = self._load()
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                manuals = json.load(f).get("manuals", {})
+            self.loaded = True
+            return manuals
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Could not read ingestion manifest {self.path}, starting empty: {e}")
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"category": self.product_category, "manuals": self.manuals}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, source: str) -> Optional[dict]:
+        return self.manuals.get(source)
+
+    def is_current(self, source: str, file_hash: str) -> bool:
+        entry = self.manuals.get(source)
+        return bool(entry) and entry.get("file_hash") == file_hash
+
+    def find_by_hash(self, file_hash: str) -> Optional[str]:
+        """Returns the name of an indexed manual with exactly this content, if any."""
+        for source, entry in self.manuals.items():
+            if entry.get("file_hash") == file_hash:
+                return source
+        return None
+
+    def find_sources(self, manual: Optional[str] = None, model_number: Optional[str] = None) -> List[str]:
+        """
+        Names of indexed manuals matching a manual name (case-insensitive,
+        ".pdf" optional, substring match) and/or a model number (matched
+        against the manual's extracted model numbers and its file name,
+        ignoring separators; "WM3400" matches "WM3400CW").
+        """
+        wanted_manual = manual.strip().lower().removesuffix(".pdf") if manual else None
+        wanted_model = normalize_model_number(model_number) if model_number else None
+
+        matches = []
+        for source, entry in self.manuals.items():
+            name = source.lower().removesuffix(".pdf")
+            if wanted_manual and wanted_manual not in name:
+                continue
+            if wanted_model:
+                codes = [normalize_model_number(code) for code in entry.get("model_numbers", [])]
+                if not (
+                    any(code.startswith(wanted_model) for code in codes)
+                    or wanted_model in normalize_model_number(name)
+                ):
+                    continue
+            matches.append(source)
+        return sorted(matches)
+
+    def record(self, source: str, file_hash: str, chunk_ids: List[str], **extra):
+        self.manuals[source] = {
+            "file_hash": file_hash,
+            "chunk_ids": chunk_ids,
+            "chunk_count": len(chunk_ids),
+            "ingested_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            **extra,
+        }
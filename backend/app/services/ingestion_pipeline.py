@@ -0,0 +1,353 @@
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Callable, ContextManager, Iterator, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.rag.embeddings import get_embedding_model
+from app.rag.keyword_index import KeywordIndex
+from app.rag.model_numbers import annotate_model_numbers
+from app.rag.parsers import iter_pdf_documents, iter_chunks
+from app.rag.vector_store_pool import vector_store_pool
+from app.services.ingestion_manifest import ChunkIdAssigner
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when another stage has failed or the run was cancelled."""
+
+
+class PipelineStats:
+    """Per-stage counters shared by the pipeline threads."""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.pages_parsed = 0
+        self.total_pages = 0
+        self.elements = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.skipped = 0
+        self.stored = 0
+        self.stage_seconds = {"parse": 0.0, "chunk": 0.0, "embed": 0.0, "upsert": 0.0}
+        self._lock = threading.Lock()
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.started_at, 1e-6)
+        return (
+            f"Pipeline: parsed {self.pages_parsed}/{self.total_pages} pages ({self.pages_parsed / elapsed:.1f} pages/s), "
+            f"{self.chunks} chunks ({self.chunks / elapsed:.1f} chunks/s), "
+            f"embedded {self.embedded}, unchanged {self.skipped}, stored {self.stored}"
+        )
+
+    def as_dict(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "elapsed_seconds": round(elapsed, 2),
+            "pages": self.pages_parsed,
+            "elements": self.elements,
+            "chunks": self.chunks,
+            "embedded": self.embedded,
+            "unchanged": self.skipped,
+            "stored": self.stored,
+            "stage_seconds": {k: round(v, 2) for k, v in self.stage_seconds.items()},
+        }
+
+
+class StreamingIngestionPipeline:
+    """
+    Parse -> chunk -> embed -> upsert, with each stage on its own thread and
+    bounded queues in between.
+
+    Pages flow into chunking as soon as a shard is parsed, chunks are embedded
+    in fixed-size batches while parsing continues, and each embedded batch is
+    upserted immediately. A full queue blocks the producer, so peak memory is
+    bounded by the queue sizes rather than by the size of the manual.
+
+    `write_lock` returns the context manager held around each write to the
+    category's collection and keyword index; parsing, chunking and embedding
+    run without it.
+    """
+
+    def __init__(
+        self,
+        pdf_path: str,
+        product_type: str,
+        source: str,
+        file_hash: str,
+        progress: Optional[Callable[[str], None]] = None,
+        raw_dump_path: Optional[str] = None,
+        embed_batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        write_lock: Optional[Callable[[], ContextManager]] = None,
+    ):
+        self.pdf_path = pdf_path
+        self.product_type = product_type
+        self.source = source
+        self.file_hash = file_hash
+        self.progress = progress or (lambda message: None)
+        self.raw_dump_path = raw_dump_path
+        self.embed_batch_size = embed_batch_size or settings.INGEST_EMBED_BATCH_SIZE
+        self.write_lock = write_lock or nullcontext
+        queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+
+        self.page_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.chunk_queue: "queue.Queue" = queue.Queue(maxsize=queue_size * self.embed_batch_size)
+        self.upsert_queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+
+        self.stats = PipelineStats()
+        self.chunk_ids: List[str] = []
+        self.model_numbers: List[List[str]] = []
+        self._metadata_updates: List[Tuple[str, dict]] = []
+        self._chunk_wait_seconds = 0.0
+        self._failed = threading.Event()
+        self._errors: List[BaseException] = []
+
+    # -- queue helpers -------------------------------------------------------
+
+    def _put(self, q: "queue.Queue", item):
+        while True:
+            if self._failed.is_set():
+                raise PipelineCancelled()
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, q: "queue.Queue") -> Iterator:
+        while True:
+            if self._failed.is_set():
+                raise PipelineCancelled()
+            try:
+                item = q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    @property
+    def stopping(self) -> bool:
+        """True once a stage has failed or the run was cancelled."""
+        return self._failed.is_set()
+
+    @contextmanager
+    def _writing(self):
+        with self.write_lock():
+            # The lock may have taken a while; don't write for a run that is over.
+            if self._failed.is_set():
+                raise PipelineCancelled()
+            yield
+
+    def _run_stage(self, name: str, target: Callable[[], None], downstream: Optional["queue.Queue"]):
+        try:
+            target()
+        except PipelineCancelled:
+            pass
+        except BaseException as e:
+            logger.error(f"Ingestion pipeline stage '{name}' failed: {e}", exc_info=True)
+            self._errors.append(e)
+            self._failed.set()
+        finally:
+            if downstream is not None and not self._failed.is_set():
+                try:
+                    self._put(downstream, _END)
+                except PipelineCancelled:
+                    pass
+
+    # -- stages ---------------------------------------------------------------
+
+    def _parse_stage(self):
+        def on_page(pages_done: int, total_pages: int):
+            self.stats.pages_parsed = pages_done
+            self.stats.total_pages = total_pages
+            self.progress(f"Parsed page {pages_done}/{total_pages}")
+
+        shards = iter_pdf_documents(self.pdf_path, progress_callback=on_page)
+        while True:
+            start = time.perf_counter()
+            shard_docs = next(shards, None)
+            self.stats.add_time("parse", time.perf_counter() - start)
+            if shard_docs is None:
+                return
+            self.stats.add(elements=len(shard_docs))
+            self._put(self.page_queue, shard_docs)
+
+    def _iter_elements(self, dump_file) -> Iterator[Document]:
+        index = 0
+        shards = self._iter_queue(self.page_queue)
+        while True:
+            # Time spent waiting on the parser is not chunking time.
+            wait_start = time.perf_counter()
+            shard_docs = next(shards, None)
+            self._chunk_wait_seconds += time.perf_counter() - wait_start
+            if shard_docs is None:
+                return
+            for doc in shard_docs:
+                index += 1
+                if dump_file is not None:
+                    write_raw_document(dump_file, index, doc)
+                yield doc
+
+    def _chunk_stage(self):
+        dump_file = open(self.raw_dump_path, "w", encoding="utf-8") if self.raw_dump_path else None
+        try:
+            if dump_file is not None:
+                dump_file.write(f"{'='*80}\nRAW PROCESSED DOCUMENTS - BEFORE CHUNKING\n{'='*80}\n\n")
+            chunks = iter_chunks(self._iter_elements(dump_file))
+            while True:
+                start = time.perf_counter()
+                self._chunk_wait_seconds = 0.0
+                chunk = next(chunks, None)
+                self.stats.add_time("chunk", time.perf_counter() - start - self._chunk_wait_seconds)
+                if chunk is None:
+                    break
+                self.stats.add(chunks=1)
+                self._put(self.chunk_queue, chunk)
+            if dump_file is not None:
+                dump_file.write(f"\nTotal Documents: {self.stats.elements}\n")
+        finally:
+            if dump_file is not None:
+                dump_file.close()
+
+    def _embed_stage(self):
+        embedding_model = get_embedding_model()
+        assigner = ChunkIdAssigner(self.source)
+
+        batch: List[Document] = []
+
+        def embed_batch(batch: List[Document]):
+            start = time.perf_counter()
+            ids = []
+            for chunk in batch:
+                chunk_id = assigner.assign(chunk)
+                chunk.metadata["chunk_id"] = chunk_id
+                chunk.metadata["file_hash"] = self.file_hash
+                self.model_numbers.append(annotate_model_numbers(chunk))
+                ids.append(chunk_id)
+            self.chunk_ids.extend(ids)
+
+            with self._writing():
+                # Looked up per batch: the collection is recreated if the category is cleared meanwhile.
+                vector_store = vector_store_pool.get(self.product_type)
+                # Content-addressed IDs: chunks already in the collection are unchanged.
+                already_stored = set(vector_store.get(ids=ids, include=[])["ids"])
+                new = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, batch) if chunk_id not in already_stored]
+                unchanged = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, batch) if chunk_id in already_stored]
+            # Same text, but a revision can move it to other pages. Written by
+            # apply_metadata_updates once the run has succeeded.
+            self._metadata_updates.extend((chunk_id, chunk.metadata) for chunk_id, chunk in unchanged)
+            self.stats.add(skipped=len(unchanged))
+            if new:
+                embeddings = embedding_model.embed_documents([chunk.page_content for _, chunk in new])
+                self.stats.add(embedded=len(new))
+                self._put(self.upsert_queue, (new, embeddings))
+            self.stats.add_time("embed", time.perf_counter() - start)
+
+        for chunk in self._iter_queue(self.chunk_queue):
+            batch.append(chunk)
+            if len(batch) >= self.embed_batch_size:
+                embed_batch(batch)
+                batch = []
+        if batch:
+            embed_batch(batch)
+
+    def _upsert_stage(self):
+        keyword_index = KeywordIndex(self.product_type)
+        for new, embeddings in self._iter_queue(self.upsert_queue):
+            start = time.perf_counter()
+            ids = [chunk_id for chunk_id, _ in new]
+            documents = [chunk.page_content for _, chunk in new]
+            with self._writing():
+                vector_store_pool.get(self.product_type)._collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=[chunk.metadata for _, chunk in new],
+                )
+                keyword_index.add(ids, documents, [self.source] * len(ids))
+            self.stats.add(stored=len(new))
+            self.stats.add_time("upsert", time.perf_counter() - start)
+            self.progress(self.stats.summary())
+
+    # -- driver ---------------------------------------------------------------
+
+    def apply_metadata_updates(self):
+        """
+        Writes the new metadata (pages, file hash) of chunks that were already
+        indexed. Call under the category lock once the run has succeeded, so a
+        failed re-ingestion leaves the indexed version's chunks untouched.
+        """
+        if not self._metadata_updates:
+            return
+        collection = vector_store_pool.get(self.product_type)._collection
+        for start in range(0, len(self._metadata_updates), 1000):
+            batch = self._metadata_updates[start:start + 1000]
+            collection.update(
+                ids=[chunk_id for chunk_id, _ in batch],
+                metadatas=[metadata for _, metadata in batch],
+            )
+
+    def cancel(self):
+        """Stops every stage at its next queue operation; `run` then raises PipelineCancelled."""
+        self._failed.set()
+
+    def run(self) -> dict:
+        """Runs every stage to completion; raises the first stage error, if any."""
+        stages = [
+            ("parse", self._parse_stage, self.page_queue),
+            ("chunk", self._chunk_stage, self.chunk_queue),
+            ("embed", self._embed_stage, self.upsert_queue),
+            ("upsert", self._upsert_stage, None),
+        ]
+        threads = [
+            threading.Thread(target=self._run_stage, args=stage, name=f"ingest-{stage[0]}", daemon=True)
+            for stage in stages
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_report = time.perf_counter()
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+            if time.perf_counter() - last_report >= settings.INGEST_PROGRESS_INTERVAL_SECONDS:
+                self.progress(self.stats.summary())
+                last_report = time.perf_counter()
+
+        if self._errors:
+            raise self._errors[0]
+        if self._failed.is_set():
+            raise PipelineCancelled(f"Ingestion of {self.source} was cancelled")
+
+        result = self.stats.as_dict()
+        logger.info(f"Streaming ingestion of {self.source} finished: {result}")
+        return result
+
+
+def write_raw_document(f, idx: int, doc: Document):
+    """Appends one parsed element to the raw debug dump."""
+    f.write(f"\n{'='*80}\nDOCUMENT #{idx}\n{'='*80}\n")
+    f.write(f"Type: {type(doc).__name__}\nModule: {type(doc).__module__}\n\n")
+    f.write(f"--- PAGE CONTENT (TEXT) ---\n{doc.page_content}\n\n")
+    f.write("--- METADATA ---\n")
+    for key, value in doc.metadata.items():
+        f.write(f"  {key}: {value}\n")
+    f.write("\n\n")
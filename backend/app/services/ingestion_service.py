@@ -1,19 +1,169 @@
 import os
 import logging 
 from pathlib import Path
+from typing import Iterable, List, Optional
 import asyncio
+import concurrent.futures
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
 from asyncio import Queue
 
 from app.core.config import settings
-from app.rag.parsers import process_pdf,chunk_documents
 from app.rag.embeddings import get_embedding_model
-from langchain_community.vectorstores import Chroma
+from app.rag.keyword_index import KeywordIndex
+from app.rag.model_numbers import top_model_numbers
+from app.rag.vector_store_pool import get_persist_directory, vector_store_pool
+from app.services.ingestion_manifest import IngestionManifest, hash_file
+from app.services.ingestion_pipeline import PipelineCancelled, StreamingIngestionPipeline
+from app.utils.file_lock import file_lock
 
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+_category_locks = {}
+
+
+def _category_lock(product_type: str) -> asyncio.Lock:
+    """Serializes vector store writes and manifest updates per product category."""
+    lock = _category_locks.get(product_type)
+    if lock is None:
+        lock = _category_locks[product_type] = asyncio.Lock()
+    return lock
+
+
+def category_lock_path(product_type: str) -> str:
+    # Next to (not inside) the category's ChromaDB directory, which clearing deletes.
+    return os.path.join(settings.CHROMA_DB_DIR, f".{product_type}.ingest.lock")
+
+
+@contextmanager
+def hold_category_file_locks(product_types: Iterable[str], timeout: Optional[float] = None):
+    """
+    Inter-process write locks of several categories, shared by the API server
+    and scripts/bulk_ingest.py so the two never write a category at once.
+    Taken in a fixed order; raises TimeoutError after `timeout` seconds.
+    """
+    with ExitStack() as stack:
+        for product_type in sorted(set(product_types)):
+            stack.enter_context(file_lock(category_lock_path(product_type), timeout))
+        yield
+
+
+@asynccontextmanager
+async def hold_category_locks(product_types: Iterable[str], timeout: Optional[float] = None):
+    """
+    Holds the write locks of several categories, taken in a fixed order to avoid deadlocks.
+    `timeout` bounds the wait for the inter-process locks (TimeoutError).
+    """
+    product_types = sorted(set(product_types))
+    async with AsyncExitStack() as stack:
+        for product_type in product_types:
+            await stack.enter_async_context(_category_lock(product_type))
+        # Then the inter-process locks, waited for off the event loop.
+        file_locks = hold_category_file_locks(product_types, timeout)
+        acquire = asyncio.ensure_future(asyncio.to_thread(file_locks.__enter__))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The thread may still get the locks; release them once it does.
+            acquire.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or file_locks.__exit__(None, None, None)
+            )
+            raise
+        stack.push(file_locks.__exit__)
+        yield
+
+
+@contextmanager
+def _pipeline_write_lock(product_type: str, loop: asyncio.AbstractEventLoop, pipeline: StreamingIngestionPipeline):
+    """
+    `hold_category_locks` for one write of a pipeline stage thread; the locks
+    are taken and released on `loop`. Gives up with PipelineCancelled if the
+    pipeline stops while waiting.
+    """
+    locks = hold_category_locks([product_type])
+    acquire = asyncio.run_coroutine_threadsafe(locks.__aenter__(), loop)
+    while True:
+        try:
+            acquire.result(timeout=0.2)
+            break
+        except concurrent.futures.TimeoutError:
+            # cancel() fails if the locks were just acquired; then go on and release them below.
+            if pipeline.stopping and acquire.cancel():
+                raise PipelineCancelled()
+    try:
+        yield
+    finally:
+        asyncio.run_coroutine_threadsafe(locks.__aexit__(None, None, None), loop).result()
+
+
+async def _discard_unrecorded_chunks(product_type: str, source: str, chunk_ids: List[str]) -> int:
+    """
+    Deletes what a failed or cancelled ingestion of `source` already stored:
+    every chunk ID the manifest does not list for that manual, from both the
+    collection and the keyword index. Returns how many IDs were deleted.
+    """
+    if not chunk_ids:
+        return 0
+    try:
+        async with hold_category_locks([product_type]):
+            recorded = set((IngestionManifest(product_type).get(source) or {}).get("chunk_ids", []))
+            orphan_ids = [chunk_id for chunk_id in dict.fromkeys(chunk_ids) if chunk_id not in recorded]
+            if orphan_ids:
+                await asyncio.to_thread(vector_store_pool.get(product_type).delete, ids=orphan_ids)
+                await asyncio.to_thread(KeywordIndex(product_type).remove, orphan_ids)
+                vector_store_pool.invalidate(product_type)
+                logger.info(f"Removed {len(orphan_ids)} chunks of the unfinished ingestion of {source}")
+            return len(orphan_ids)
+    except Exception as e:
+        # reconcile_collection removes them on the next startup.
+        logger.error(f"Could not remove the chunks of the unfinished ingestion of {source}: {e}")
+        return 0
+
+
+def _unreferenced_chunk_ids(collection, referenced: set, page_size: int = 1000) -> List[str]:
+    """IDs of manifest-tracked chunks (they carry a file hash) that no manifest entry lists."""
+    orphan_ids = []
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return orphan_ids
+        for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+            # Chunks stored before the manifest existed have no file hash; keep them.
+            if (metadata or {}).get("file_hash") and chunk_id not in referenced:
+                orphan_ids.append(chunk_id)
+        offset += len(page["ids"])
+
+
+async def reconcile_collection(product_type: str, lock_timeout: Optional[float] = None) -> int:
+    """
+    Deletes chunks that no manifest entry references, from both the collection
+    and the keyword index: leftovers of ingestions that stopped before their
+    cleanup could run (e.g. the process was killed). Skips categories without
+    a readable manifest. Returns how many chunks were deleted.
+    """
+    persist_directory = get_persist_directory(product_type)
+    if not persist_directory or not os.path.isdir(persist_directory):
+        return 0
+    async with hold_category_locks([product_type], timeout=lock_timeout):
+        manifest = IngestionManifest(product_type)
+        if not manifest.loaded:
+            return 0
+        referenced = {chunk_id for entry in manifest.manuals.values() for chunk_id in entry.get("chunk_ids", [])}
+        collection = vector_store_pool.get(product_type)._collection
+        orphan_ids = await asyncio.to_thread(_unreferenced_chunk_ids, collection, referenced)
+        if orphan_ids:
+            for start in range(0, len(orphan_ids), 1000):
+                batch = orphan_ids[start:start + 1000]
+                await asyncio.to_thread(collection.delete, ids=batch)
+                await asyncio.to_thread(KeywordIndex(product_type).remove, batch)
+            vector_store_pool.invalidate(product_type)
+            logger.info(f"Removed {len(orphan_ids)} chunks no manifest entry references from {product_type}")
+        return len(orphan_ids)
+
+
 def ensure_directories_exist(product_type: str):
     """Ensure all necessary directories exist with proper permissions."""
     directories = []
@@ -61,88 +211,56 @@ def ensure_directories_exist(product_type: str):
 async def store_process_chunk_ingest(
         queue: Queue,
         file_name: str,
-        file_contents: bytes,
-        product_type: str
+        pdf_path: str,
+        product_type: str,
+        file_hash: Optional[str] = None
 ):
-    """Store, process, chunk, and ingest a PDF file into the vector database."""
+    """
+    Process, chunk, and ingest a PDF file that is already stored on disk into
+    the vector database. `file_hash` is the SHA-256 computed while the upload
+    was spooled; it is recomputed (via mmap) when not supplied.
+
+    Progress messages go to `queue`, terminated by None. Returns the outcome as
+    a dict whose "status" is 'succeeded', 'skipped' or 'failed'.
+    """
     
     try:
         ensure_directories_exist(product_type)
-        
-        await queue.put("Starting PDF storage...")
-        storage_dir = {
-            "washing_machine": settings.PDF_DIR_WASHING_MACHINE,
-            "air_conditioner": settings.PDF_DIR_AC,
-            "refrigerator": settings.PDF_DIR_REFRIGERATOR
-        }.get(product_type)
-
-        stored_pdf_path = os.path.join(storage_dir, file_name)
-
-        with open(stored_pdf_path, "wb") as f:
-            f.write(file_contents)
-            
-        logger.info(f"Stored PDF at {stored_pdf_path}")
-        await queue.put(f"PDF stored successfully")
-        await asyncio.sleep(0.1) # Yield control briefly
-
-        # Step 2: Process the PDF (run in thread to avoid blocking event loop)
-        await queue.put("Starting PDF processing...")
-        await queue.put("Loading BLIP model for image captioning... This may take a moment on first run.")
-        documents = await asyncio.to_thread(process_pdf, stored_pdf_path)
-        logger.info(f"Extracted {len(documents)} document elements from PDF.")
-        await queue.put(f"Extracted {len(documents)} document elements")
-        if not documents:
-            raise ValueError("No content extracted from PDF. Please check the file.")
-        
-        #step 2.5: Save processed documents for debugging - RAW STRUCTURE
+        logger.info(f"Ingesting PDF stored at {pdf_path}")
+        await queue.put("PDF stored successfully")
+
+        if file_hash is None:
+            file_hash = await asyncio.to_thread(hash_file, pdf_path)
+        manifest = IngestionManifest(product_type)
+        if manifest.is_current(file_name, file_hash):
+            logger.info(f"{file_name} is unchanged (sha256 {file_hash[:12]}); skipping re-ingestion.")
+            await queue.put("This manual is already indexed and unchanged. Skipping re-ingestion.")
+            return {"status": "skipped", "file_hash": file_hash, "reason": "unchanged"}
+
+        duplicate_of = manifest.find_by_hash(file_hash)
+        if duplicate_of:
+            logger.info(f"{file_name} is identical to already indexed {duplicate_of}; skipping re-ingestion.")
+            await queue.put(f"This manual is identical to the already indexed '{duplicate_of}'. Skipping re-ingestion.")
+            return {"status": "skipped", "file_hash": file_hash, "reason": "duplicate", "duplicate_of": duplicate_of}
+
+        # Step 2: Stream the PDF through parse -> chunk -> embed -> upsert.
+        # The pipeline runs its stages on worker threads; progress messages are
+        # handed back to the event loop for the SSE stream.
+        await queue.put("Starting streaming PDF processing and ingestion...")
+        loop = asyncio.get_running_loop()
+
+        def report_progress(message: str):
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
         processed_dir = {
             "washing_machine": settings.DOCS_DIR_WASHING_MACHINE,
             "air_conditioner": settings.DOCS_DIR_AC,
             "refrigerator": settings.DOCS_DIR_REFRIGERATOR
         }.get(product_type, settings.DOCS_DIR)
         processed_file_path = os.path.join(processed_dir, f"{Path(file_name).stem}_processed_raw.txt")
-        
-        with open(processed_file_path, "w", encoding="utf-8") as f:
-            f.write(f"{'='*80}\nRAW PROCESSED DOCUMENTS - BEFORE CHUNKING\n")
-            f.write(f"Total Documents: {len(documents)}\n{'='*80}\n\n")
-            
-            for idx, doc in enumerate(documents, 1):
-                f.write(f"\n{'='*80}\nDOCUMENT #{idx}\n{'='*80}\n")
-                f.write(f"Type: {type(doc).__name__}\nModule: {type(doc).__module__}\n\n")
-                
-                if hasattr(doc, '__dict__'):
-                    f.write(f"--- ALL ATTRIBUTES ---\n")
-                    for key, value in doc.__dict__.items():
-                        f.write(f"{key}: {value}\n")
-                    f.write("\n")
-                
-                if hasattr(doc, 'page_content'):
-                    f.write(f"--- PAGE CONTENT (TEXT) ---\n{doc.page_content}\n\n")
-                
-                if hasattr(doc, 'metadata'):
-                    f.write(f"--- METADATA ---\n")
-                    for key, value in doc.metadata.items():
-                        f.write(f"  {key}: {value}\n")
-                    f.write("\n")
-                
-                if isinstance(doc, str):
-                    f.write(f"--- RAW STRING CONTENT ---\n{doc}\n\n")
-                
-                f.write(f"\n")
-        
-        logger.info(f"Saved RAW processed documents to {processed_file_path}")
 
-        await queue.put("Starting document chunking...")
-        chunked_docs = await asyncio.to_thread(chunk_documents, documents)
-        logger.info(f"Created {len(chunked_docs)} chunks from PDF documents.")
-        await queue.put(f"Created {len(chunked_docs)} text chunks")
-        if not chunked_docs:
-            raise ValueError("Document chunking resulted in zero chunks. Please check the content.")
-        
-        await queue.put("Starting embedding and ingestion...")
-        await queue.put("Creating embeddings using Gemini API...")
-        
-        embedding_model = get_embedding_model()
+        # Shared process-wide model; only the very first call loads weights.
+        await asyncio.to_thread(get_embedding_model)
         persist_directory = {
             "washing_machine": settings.CHROMA_DB_DIR_WASHING_MACHINE,
             "air_conditioner": settings.CHROMA_DB_DIR_AC,
@@ -151,21 +269,76 @@ async def store_process_chunk_ingest(
         
         logger.info(f"Using persist directory: {persist_directory}")
 
-        def create_vector_store():
-            return Chroma.from_documents(
-                documents=chunked_docs,
-                embedding=embedding_model,
-                persist_directory=persist_directory,
-                collection_name=product_type
-            )
-        
-        vector_store = await asyncio.to_thread(create_vector_store)
-        await queue.put(f"Successfully embedded {len(chunked_docs)} chunks")
+        pipeline = StreamingIngestionPipeline(
+            pdf_path=pdf_path,
+            product_type=product_type,
+            source=file_name,
+            file_hash=file_hash,
+            progress=report_progress,
+            raw_dump_path=processed_file_path,
+            # Parsing and embedding run unlocked; only the writes take the category lock.
+            write_lock=lambda: _pipeline_write_lock(product_type, loop, pipeline),
+        )
+
+        # New chunks are searchable as soon as they are upserted, but the
+        # manifest only lists them once the run succeeds; until then a failure
+        # must take them out again.
+        recorded = False
+        try:
+            run = asyncio.ensure_future(asyncio.to_thread(pipeline.run))
+            try:
+                result = await asyncio.shield(run)
+            except asyncio.CancelledError:
+                # Stop the stage threads and wait for them rather than leave
+                # them writing for an ingestion nobody owns any more.
+                pipeline.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+                await asyncio.shield(_discard_unrecorded_chunks(product_type, file_name, pipeline.chunk_ids))
+                raise
+            if not pipeline.chunk_ids:
+                raise ValueError("No content extracted from PDF. Please check the file.")
+
+            async with hold_category_locks([product_type]):
+                # Re-read under the lock in case another upload to this category just finished.
+                manifest = IngestionManifest(product_type)
+                await asyncio.to_thread(pipeline.apply_metadata_updates)
+                # Chunks from the previous version of this manual that no longer exist.
+                current_ids = set(pipeline.chunk_ids)
+                previous = manifest.get(file_name) or {}
+                stale_ids = [chunk_id for chunk_id in previous.get("chunk_ids", []) if chunk_id not in current_ids]
+                if stale_ids:
+                    await asyncio.to_thread(vector_store_pool.get(product_type).delete, ids=stale_ids)
+                    await asyncio.to_thread(KeywordIndex(product_type).remove, stale_ids)
+                manifest.record(file_name, file_hash, pipeline.chunk_ids, model_numbers=top_model_numbers(pipeline.model_numbers))
+                manifest.save()
+                recorded = True
+        except Exception:
+            if not recorded:
+                await _discard_unrecorded_chunks(product_type, file_name, pipeline.chunk_ids)
+            raise
+        finally:
+            # Readers reopen the category so they see the freshly written segments.
+            vector_store_pool.invalidate(product_type)
+
+        logger.info(f"Saved RAW processed documents to {processed_file_path}")
+        await queue.put(f"Extracted {result['elements']} document elements from {result['pages']} pages")
+        await queue.put(f"Created {result['chunks']} text chunks")
+        await queue.put(
+            f"Successfully embedded {result['embedded']} new chunks "
+            f"({result['unchanged']} unchanged, {len(stale_ids)} stale removed)"
+        )
+        stage_seconds = result["stage_seconds"]
+        await queue.put(
+            f"Finished in {result['elapsed_seconds']}s (parse {stage_seconds['parse']}s, chunk {stage_seconds['chunk']}s, "
+            f"embed {stage_seconds['embed']}s, upsert {stage_seconds['upsert']}s)"
+        )
         
-        logger.info(f"Persisted vector store with {len(chunked_docs)} documents to {persist_directory}")
-        await queue.put(f"Vector database updated successfully")
+        logger.info(f"Updated vector store at {persist_directory}: {result}")
+        await queue.put("Vector database updated successfully")
+        return {"status": "succeeded", "file_hash": file_hash, "stale_removed": len(stale_ids), **result}
     except Exception as e:
         logger.error(f"Error during ingestion process: {e}", exc_info=True)
         await queue.put(f"Error: {e}")
+        return {"status": "failed", "file_hash": file_hash, "error": str(e)}
     finally:
         await queue.put(None)
\ No newline at end of file
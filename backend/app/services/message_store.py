@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.database.database import AsyncSessionLocal
+from app.models.session import ChatMessage, ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+class StoredMessage(NamedTuple):
+    id: int
+    created_at: datetime
+
+
+async def append_message(db: AsyncSession, session_id: str, sender: str, content: str) -> Optional[StoredMessage]:
+    """
+    Inserts a message and bumps its session's `updated_at` in one
+    transaction, returning the new row's id and timestamp without a re-read.
+    On Postgres this is a single statement: the INSERT ... RETURNING and the
+    UPDATE run as data-modifying CTEs. Returns None if the session does not
+    exist.
+    """
+    if db.bind.dialect.name == "postgresql":
+        new_message = (
+            insert(ChatMessage)
+            .values(session_id=session_id, sender=sender, content=content)
+            .returning(ChatMessage.id, ChatMessage.created_at)
+            .cte("new_message")
+        )
+        bump_session = (
+            update(ChatSession)
+            .where(ChatSession.id == session_id)
+            .values(updated_at=select(new_message.c.created_at).scalar_subquery())
+            .returning(ChatSession.id)
+            .cte("bump_session")
+        )
+        try:
+            row = (await db.execute(select(new_message.c.id, new_message.c.created_at).add_cte(bump_session))).first()
+        except IntegrityError:
+            # Foreign key violation: the session is gone.
+            await db.rollback()
+            return None
+    else:
+        bumped = await db.scalar(
+            update(ChatSession).where(ChatSession.id == session_id).values(updated_at=func.now()).returning(ChatSession.id)
+        )
+        if bumped is None:
+            await db.rollback()
+            return None
+        row = (await db.execute(
+            insert(ChatMessage)
+            .values(session_id=session_id, sender=sender, content=content)
+            .returning(ChatMessage.id, ChatMessage.created_at)
+        )).first()
+    await db.commit()
+    return StoredMessage(row.id, row.created_at)
+
+
+async def _append_messages(db: AsyncSession, batch: List[Tuple[str, str, str]]) -> List[Optional[StoredMessage]]:
+    """Writes a batch of (session_id, sender, content) in one transaction; None for unknown sessions."""
+    existing = set((await db.execute(
+        update(ChatSession)
+        .where(ChatSession.id.in_({session_id for session_id, _, _ in batch}))
+        .values(updated_at=func.now())
+        .returning(ChatSession.id)
+    )).scalars())
+    rows = [
+        {"session_id": session_id, "sender": sender, "content": content}
+        for session_id, sender, content in batch
+        if session_id in existing
+    ]
+    stored = iter([])
+    if rows:
+        stored = iter((await db.execute(
+            insert(ChatMessage).returning(ChatMessage.id, ChatMessage.created_at, sort_by_parameter_order=True),
+            rows,
+        )).all())
+    await db.commit()
+    return [
+        StoredMessage(*next(stored)) if session_id in existing else None
+        for session_id, _, _ in batch
+    ]
+
+
+class MessageWriter:
+    """
+    Group commit for chat messages written at the end of a stream.
+
+    Callers enqueue a message and await its id. A single writer task commits
+    whatever has queued up (up to MESSAGE_GROUP_COMMIT_MAX_BATCH messages) in
+    one transaction, so under load many finishing streams share a round trip
+    and a commit instead of each holding a pooled connection. A lone message
+    is written immediately unless MESSAGE_GROUP_COMMIT_WINDOW_MS is set.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.messages_written = 0
+        self.batches = 0
+        self.largest_batch = 0
+        self.failed_batches = 0
+
+    async def start(self):
+        if self._task:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Writes what is still queued, then stops the writer."""
+        if not self._task:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def append(self, session_id: str, sender: str, content: str) -> Optional[StoredMessage]:
+        if not self._task:
+            await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((session_id, sender, content, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            if settings.MESSAGE_GROUP_COMMIT_WINDOW_MS > 0:
+                await asyncio.sleep(settings.MESSAGE_GROUP_COMMIT_WINDOW_MS / 1000)
+            while len(batch) < settings.MESSAGE_GROUP_COMMIT_MAX_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                async with AsyncSessionLocal() as db:
+                    results = await _append_messages(db, [item[:3] for item in batch])
+                for item, result in zip(batch, results):
+                    if not item[3].done():
+                        item[3].set_result(result)
+                self.messages_written += len(batch)
+                self.batches += 1
+                self.largest_batch = max(self.largest_batch, len(batch))
+            except Exception as e:
+                logger.error(f"Group commit of {len(batch)} message(s) failed: {e}")
+                self.failed_batches += 1
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.MESSAGE_GROUP_COMMIT_ENABLED,
+            "messages_written": self.messages_written,
+            "batches": self.batches,
+            "average_batch": round(self.messages_written / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "failed_batches": self.failed_batches,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+message_writer = MessageWriter()
+
+
+async def save_message(session_id: str, sender: str, content: str) -> Optional[StoredMessage]:
+    """Persists a message outside a request's session, through the group-commit writer when enabled."""
+    if settings.MESSAGE_GROUP_COMMIT_ENABLED:
+        return await message_writer.append(session_id, sender, content)
+    async with AsyncSessionLocal() as db:
+        return await append_message(db, session_id, sender, content)
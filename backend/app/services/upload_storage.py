@@ -0,0 +1,178 @@
+import os
+import uuid
+import shutil
+import asyncio
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from starlette import status
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Uploads wait here until their ingestion finishes, so a failed re-upload
+# never replaces the manual that is already indexed.
+PENDING_DIR_NAME = ".pending"
+# Room for the multipart boundaries and form fields around a single file.
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size cap."""
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized upload requests with 413 before Starlette spools their
+    multipart body to a temporary file: up front when Content-Length is too
+    large, or as soon as a chunked body grows past the limit. `limits` maps
+    request paths to the largest body accepted, in bytes; spool_upload still
+    enforces MAX_UPLOAD_BYTES per file.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    @staticmethod
+    def _detail(limit: int) -> str:
+        return f"Upload exceeds the maximum request size of {limit // (1024 * 1024)} MB."
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": self._detail(limit)}, status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Surfaces from request.form() as a 413 response.
+                    raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=self._detail(limit))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class SpooledUpload:
+    """A PDF that has been streamed to its final location on disk."""
+
+    def __init__(self, path: str, file_name: str, size: int, sha256: str):
+        self.path = path
+        self.file_name = file_name
+        self.size = size
+        self.sha256 = sha256
+
+
+def get_manual_directory(product_type: str) -> Optional[str]:
+    return {
+        "washing_machine": settings.PDF_DIR_WASHING_MACHINE,
+        "air_conditioner": settings.PDF_DIR_AC,
+        "refrigerator": settings.PDF_DIR_REFRIGERATOR
+    }.get(product_type)
+
+
+async def spool_upload(
+    file: UploadFile,
+    product_type: str,
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+) -> SpooledUpload:
+    """
+    Streams an uploaded PDF to a pending location under the category's manual
+    directory, hashing it on the fly. The manual it replaces stays in place
+    until `promote_upload` is called once ingestion has finished.
+
+    The whole body is never held in memory: at most `chunk_size` bytes are
+    buffered at a time. Raises UploadTooLargeError (and removes the partial
+    file) once more than `max_bytes` have been received.
+    """
+    max_bytes = max_bytes or settings.MAX_UPLOAD_BYTES
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+    storage_dir = get_manual_directory(product_type)
+    if not storage_dir:
+        raise ValueError(f"Unknown product type: {product_type}")
+
+    # Never trust client-supplied paths.
+    file_name = os.path.basename(file.filename or "upload.pdf")
+    # One directory per upload keeps the file name, which becomes the manual's
+    # source, and lets concurrent uploads of the same name coexist.
+    pending_dir = os.path.join(storage_dir, PENDING_DIR_NAME, uuid.uuid4().hex)
+    os.makedirs(pending_dir, exist_ok=True)
+    pending_path = os.path.join(pending_dir, file_name)
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=pending_dir, prefix=".upload-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(
+                        f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB."
+                    )
+                digest.update(chunk)
+                await asyncio.to_thread(tmp_file.write, chunk)
+            await asyncio.to_thread(os.fsync, tmp_file.fileno())
+
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, pending_path)
+    except BaseException:
+        shutil.rmtree(pending_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Spooled upload {file_name} ({size} bytes, sha256 {digest.hexdigest()[:12]}) to {pending_path}")
+    return SpooledUpload(path=pending_path, file_name=file_name, size=size, sha256=digest.hexdigest())
+
+
+def _pending_dir(path: str) -> Optional[str]:
+    """The per-upload directory of a pending upload, or None for any other path."""
+    pending_dir = os.path.dirname(path)
+    if os.path.basename(os.path.dirname(pending_dir)) == PENDING_DIR_NAME:
+        return pending_dir
+    return None
+
+
+def promote_upload(path: str) -> str:
+    """
+    Moves a pending upload over the manual of the same name (atomically, on
+    the same file system) and returns its final path. Paths that are not
+    pending uploads, e.g. manuals ingested from disk, are returned unchanged.
+    """
+    pending_dir = _pending_dir(path)
+    if pending_dir is None:
+        return path
+    final_path = os.path.join(os.path.dirname(os.path.dirname(pending_dir)), os.path.basename(path))
+    os.replace(path, final_path)
+    shutil.rmtree(pending_dir, ignore_errors=True)
+    logger.info(f"Moved ingested upload into place at {final_path}")
+    return final_path
+
+
+def discard_upload(path: str):
+    """Deletes a pending upload whose ingestion failed; other paths are left alone."""
+    pending_dir = _pending_dir(path)
+    if pending_dir is not None:
+        shutil.rmtree(pending_dir, ignore_errors=True)
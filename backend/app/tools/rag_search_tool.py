@@ -1,17 +1,29 @@
-from langchain_core.tools import tool
+from typing import Optional
+
+from langchain_core.tools import StructuredTool
 from pydantic import BaseModel, Field
 
-from app.rag.retrievers import get_retriever
-from app.rag.chains import format_docs 
+from app.rag.chains import estimate_tokens
+from app.rag.retrievers import retrieve_context, aretrieve_context
+
+# Start of the tool result returned when retrieval raised, so callers can tell it from context.
+RETRIEVAL_ERROR_PREFIX = "An error occurred while retrieving"
 
 class RagSearchInput(BaseModel):
     query: str = Field(description="The specific question to ask the knowledge base.")
     product_category: str = Field(
         description="The category of the product. Must be one of 'washing_machine', 'refrigerator', or 'air_conditioner'."
     )
+    manual: Optional[str] = Field(
+        default=None,
+        description="Optional manual file name (or part of it) to search only that manual.",
+    )
+    model_number: Optional[str] = Field(
+        default=None,
+        description="Optional product model number (e.g. 'WM3400CW') to search only the manuals for that model.",
+    )
 
-@tool("retrieve-knowledge", args_schema=RagSearchInput)
-def retrieve_knowledge(query: str, product_category: str) -> str:
+def _retrieve_knowledge(query: str, product_category: str, manual: Optional[str] = None, model_number: Optional[str] = None) -> str:
     """
     Retrieves factual information from the knowledge base for a specific product category.
     Use this to gather context before answering a question.
@@ -19,20 +31,51 @@ def retrieve_knowledge(query: str, product_category: str) -> str:
     print(f"\n--- 🛠️ TOOL: retrieve_knowledge ---")
     print(f"    Category: {product_category}")
     print(f"    Query: {query}")
+    if manual or model_number:
+        print(f"    Restricted to: manual={manual} model_number={model_number}")
 
     try:
-        # 1. Get the specific retriever.
-        retriever = get_retriever(product_category=product_category)
-        
-        # 2. Invoke the retriever to get the documents.
-        retrieved_docs = retriever.invoke(query)
-        
-        # 3. Format the documents into a single string context.
-        context = format_docs(retrieved_docs)
+        # Retrieve and format the context; repeated questions are served
+        # from the retrieval cache until the category's collection changes.
+        context = retrieve_context(
+            product_category=product_category, query=query, manual=manual, model_number=model_number
+        )
         
-        print(f"    ✅ Context Retrieved: {context}...")
+        print(f"    ✅ Context Retrieved: {len(context)} chars (~{estimate_tokens(context)} tokens)")
         return context
         
     except Exception as e:
         print(f"    ❌ ERROR in retrieval tool: {e}")
-        return f"An error occurred while retrieving from the {product_category} knowledge base."
\ No newline at end of file
+        return f"{RETRIEVAL_ERROR_PREFIX} from the {product_category} knowledge base."
+
+async def _aretrieve_knowledge(query: str, product_category: str, manual: Optional[str] = None, model_number: Optional[str] = None) -> str:
+    """
+    Retrieves factual information from the knowledge base for a specific product category.
+    Use this to gather context before answering a question.
+    """
+    print("\n--- 🛠️ TOOL: retrieve_knowledge (async) ---")
+    print(f"    Category: {product_category}")
+    print(f"    Query: {query}")
+    if manual or model_number:
+        print(f"    Restricted to: manual={manual} model_number={model_number}")
+
+    try:
+        context = await aretrieve_context(
+            product_category=product_category, query=query, manual=manual, model_number=model_number
+        )
+
+        print(f"    ✅ Context Retrieved: {len(context)} chars (~{estimate_tokens(context)} tokens)")
+        return context
+
+    except Exception as e:
+        print(f"    ❌ ERROR in retrieval tool: {e}")
+        return f"{RETRIEVAL_ERROR_PREFIX} from the {product_category} knowledge base."
+
+# Exposes both a sync and an async implementation; the ToolNode picks the
+# coroutine when the sub-agent graph is run with ainvoke.
+retrieve_knowledge = StructuredTool.from_function(
+    func=_retrieve_knowledge,
+    coroutine=_aretrieve_knowledge,
+    name="retrieve-knowledge",
+    args_schema=RagSearchInput,
+)
@@ -1,51 +1,121 @@
-from langchain_core.tools import tool
-from langchain_core.messages import AIMessage, HumanMessage
+import asyncio
+
+from langchain_core.tools import StructuredTool
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 
 from app.agents.sub_agents.ac_agent import ac_agent
 from app.agents.sub_agents.refrigerator_agent import refrigerator_agent
 from app.agents.sub_agents.washing_machine_agent import washing_machine_agent
+from app.services.answer_cache import answer_cache
+from app.tools.rag_search_tool import RETRIEVAL_ERROR_PREFIX
+
+def _retrieval_failed(messages) -> bool:
+    """True if any retrieve-knowledge call of the sub-agent run returned the error string instead of context."""
+    return any(
+        isinstance(message, ToolMessage) and str(message.content).startswith(RETRIEVAL_ERROR_PREFIX)
+        for message in messages
+    )
 
-@tool
-def washing_machine_expert_agent(question: str) -> str:
+def _ask_expert(agent, product_category: str, question: str) -> str:
     """
-    Use this tool when you need to answer any complex questions or handle user
-    queries related to washing machines.
+    Runs an expert sub-agent, answering from the semantic answer cache when a
+    close enough question was already answered for this category.
     """
-    print("\nDelegating to Washing Machine Expert ---")
+    cached_answer = answer_cache.lookup(product_category, question)
+    if cached_answer is not None:
+        print(f"    Answer cache hit for {product_category}")
+        return cached_answer
+
     initial_state = {"messages": [HumanMessage(content=question)]}
-    final_state = washing_machine_agent.invoke(initial_state, {"recursion_limit": 10})
+    final_state = agent.invoke(initial_state, {"recursion_limit": 10})
     final_answer = final_state['messages'][-1].content
 
+    if _retrieval_failed(final_state['messages']):
+        print(f"    Not caching {product_category} answer: retrieval failed")
+    else:
+        answer_cache.store(product_category, question, final_answer)
     return final_answer
 
-@tool
-def ac_expert_agent(question: str) -> str:
+async def _aask_expert(agent, product_category: str, question: str) -> str:
     """
-    Use this tool when you need to answer any complex questions or handle user
-    queries related to air conditioners (AC).
+    Async variant of `_ask_expert`. The sub-agent graph runs through `ainvoke`,
+    so several experts called in one supervisor turn proceed concurrently on
+    the event loop. Only the local embedding for the answer cache uses a thread.
     """
-    print("\nDelegating to AC Expert ---")
+    cached_answer = await asyncio.to_thread(answer_cache.lookup, product_category, question)
+    if cached_answer is not None:
+        print(f"    Answer cache hit for {product_category}")
+        return cached_answer
+
     initial_state = {"messages": [HumanMessage(content=question)]}
-    final_state = ac_agent.invoke(initial_state, {"recursion_limit": 10})
+    final_state = await agent.ainvoke(initial_state, {"recursion_limit": 10})
     final_answer = final_state['messages'][-1].content
 
+    if _retrieval_failed(final_state['messages']):
+        print(f"    Not caching {product_category} answer: retrieval failed")
+    else:
+        await asyncio.to_thread(answer_cache.store, product_category, question, final_answer)
     return final_answer
 
-@tool
-def refrigerator_expert_agent(question: str) -> str:
-    """
-    Use this tool when you need to answer any complex questions or handle user
-    queries related to refrigerators.
-    """
-    print("\nDelegating to Refrigerator Expert ---")
-    initial_state = {"messages": [HumanMessage(content=question)]}
-    final_state = refrigerator_agent.invoke(initial_state, {"recursion_limit": 10})
-    final_answer = final_state['messages'][-1].content
+def _expert_tool(name: str, description: str, label: str, agent, product_category: str) -> StructuredTool:
+    """Builds an expert delegation tool with both sync and async implementations."""
 
-    return final_answer
+    def run(question: str) -> str:
+        print(f"\nDelegating to {label} ---")
+        return _ask_expert(agent, product_category, question)
+
+    async def arun(question: str) -> str:
+        print(f"\nDelegating to {label} (async) ---")
+        return await _aask_expert(agent, product_category, question)
+
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=name,
+        description=description,
+    )
+
+washing_machine_expert_agent = _expert_tool(
+    name="washing_machine_expert_agent",
+    description=(
+        "Use this tool when you need to answer any complex questions or handle user "
+        "queries related to washing machines."
+    ),
+    label="Washing Machine Expert",
+    agent=washing_machine_agent,
+    product_category="washing_machine",
+)
+
+ac_expert_agent = _expert_tool(
+    name="ac_expert_agent",
+    description=(
+        "Use this tool when you need to answer any complex questions or handle user "
+        "queries related to air conditioners (AC)."
+    ),
+    label="AC Expert",
+    agent=ac_agent,
+    product_category="air_conditioner",
+)
+
+refrigerator_expert_agent = _expert_tool(
+    name="refrigerator_expert_agent",
+    description=(
+        "Use this tool when you need to answer any complex questions or handle user "
+        "queries related to refrigerators."
+    ),
+    label="Refrigerator Expert",
+    agent=refrigerator_agent,
+    product_category="refrigerator",
+)
 
 supervisor_tools = [
     washing_machine_expert_agent,
     ac_expert_agent,
     refrigerator_expert_agent
-]
\ No newline at end of file
+]
+
+expert_tools_by_category = {
+    "washing_machine": washing_machine_expert_agent,
+    "air_conditioner": ac_expert_agent,
+    "refrigerator": refrigerator_expert_agent,
+}
@@ -0,0 +1,38 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, callers only serialize within the process
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path: str, timeout: Optional[float] = None):
+    """
+    Exclusive advisory lock on `path` (created if needed), shared by every
+    process on the machine, e.g. the API server and the bulk-ingest CLI.
+    Waits indefinitely, or raises TimeoutError after `timeout` seconds.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            if timeout is None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise TimeoutError(f"{path} is locked by another process")
+                        time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,20 @@
+-- Durable background ingestion jobs (see app/models/ingestion_job.py).
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id VARCHAR PRIMARY KEY,
+    product_type VARCHAR(50) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    pdf_path VARCHAR NOT NULL,
+    file_hash VARCHAR(64),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    message TEXT,
+    result JSON,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_status_created_at
+    ON ingestion_jobs (status, created_at);
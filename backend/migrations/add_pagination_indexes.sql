@@ -0,0 +1,7 @@
+-- Keyset pagination of the session list and message history (see app/routers/chat.py).
+-- CONCURRENTLY keeps the tables writable while the indexes are built; run outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_sessions_updated_at_id
+    ON chat_sessions (updated_at, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_session_id_created_at_id
+    ON chat_messages (session_id, created_at, id);
@@ -0,0 +1,3 @@
+-- Rolling conversation summary per chat session (see app/services/conversation_context.py).
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_message_id BIGINT;
@@ -0,0 +1,91 @@
+"""
+Micro-benchmark of MMR selection: LangChain's loop-based implementation vs
+the vectorized `mmr_select`, over a growing candidate pool.
+
+    python -m scripts.benchmark_mmr
+    python -m scripts.benchmark_mmr --category air_conditioner   # also end-to-end against a collection
+
+Synthetic candidates are random unit vectors of the embedding size.
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from langchain_chroma.vectorstores import maximal_marginal_relevance
+
+from app.core.config import settings
+from app.rag.cache import query_embedding_cache
+from app.rag.retrievers import SEARCH_KWARGS, fast_mmr_search, mmr_select
+from app.rag.vector_store_pool import vector_store_pool
+
+
+def time_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+
+def synthetic(args):
+    rng = np.random.default_rng(0)
+    k, lambda_mult = SEARCH_KWARGS["k"], SEARCH_KWARGS["lambda_mult"]
+    print(f"Selection only (k={k}, dim={args.dim}, median of {args.repeat} runs)")
+    print(f"{'fetch_k':>8} {'langchain ms':>13} {'vectorized ms':>14} {'speedup':>8}  same picks")
+    for fetch_k in args.fetch_k:
+        candidates = rng.standard_normal((fetch_k, args.dim)).astype(np.float32)
+        candidates /= np.linalg.norm(candidates, axis=1, keepdims=True)
+        query = rng.standard_normal(args.dim).astype(np.float32)
+        query /= np.linalg.norm(query)
+
+        base_ms, base = time_ms(lambda: maximal_marginal_relevance(query, list(candidates), lambda_mult, k), args.repeat)
+        fast_ms, fast = time_ms(lambda: mmr_select(query, candidates, k, lambda_mult), args.repeat)
+        print(f"{fetch_k:>8} {base_ms:>13.3f} {fast_ms:>14.3f} {base_ms / max(fast_ms, 1e-9):>7.1f}x  {list(base) == fast}")
+
+
+def end_to_end(args):
+    vectorstore = vector_store_pool.get(args.category)
+    query = args.query
+    k, lambda_mult = SEARCH_KWARGS["k"], SEARCH_KWARGS["lambda_mult"]
+    # Warm up the model and the collection handle.
+    vectorstore.max_marginal_relevance_search(query, k=k, fetch_k=20, lambda_mult=lambda_mult)
+
+    print(f"\nEnd to end on '{args.category}' (query embedding cache cleared each run)")
+    print(f"{'fetch_k':>8} {'langchain mmr ms':>17} {'fast_mmr ms':>12}")
+    for fetch_k in args.fetch_k:
+        def langchain_path():
+            query_embedding_cache.clear()
+            return vectorstore.max_marginal_relevance_search(query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+
+        def fast_path():
+            query_embedding_cache.clear()
+            return fast_mmr_search(args.category, query, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+
+        base_ms, _ = time_ms(langchain_path, args.repeat)
+        fast_ms, _ = time_ms(fast_path, args.repeat)
+        print(f"{fetch_k:>8} {base_ms:>17.2f} {fast_ms:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MMR selection implementations.")
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 50, 100, 200, 400])
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (all-MiniLM-L6-v2: 384)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--category", choices=settings.VALID_PRODUCT_TYPES, help="Also benchmark end to end on this collection")
+    parser.add_argument("--query", default="How do I clean the filter?")
+    args = parser.parse_args()
+
+    synthetic(args)
+    if args.category:
+        end_to_end(args)
+
+
+if __name__ == "__main__":
+    main()
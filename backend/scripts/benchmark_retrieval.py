@@ -0,0 +1,84 @@
+"""
+Compare retrieval latency (and result overlap) across search modes.
+
+    python -m scripts.benchmark_retrieval air_conditioner
+    python -m scripts.benchmark_retrieval refrigerator --queries queries.txt --repeat 5
+
+Caches are bypassed, so every query pays for the embedding and the search.
+"""
+import sys
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.rag.cache import query_embedding_cache
+from app.rag.retrievers import SEARCH_MODES, get_retriever
+
+DEFAULT_QUERIES = [
+    "How do I clean the filter?",
+    "What does error code E4 mean?",
+    "The unit is making a loud noise",
+    "How do I reset the appliance?",
+    "Recommended temperature setting",
+    "Water is leaking from the bottom",
+    "How often should I descale it?",
+    "Installation clearance requirements",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval latency per search mode.")
+    parser.add_argument("product_category", choices=settings.VALID_PRODUCT_TYPES)
+    parser.add_argument("--queries", help="File with one query per line (default: a built-in set)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query and mode")
+    parser.add_argument("--modes", nargs="+", default=list(SEARCH_MODES), choices=SEARCH_MODES)
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    # Warm up: load the embedding model, open the store, sync the keyword index.
+    for mode in args.modes:
+        get_retriever(args.product_category, mode).invoke(queries[0])
+
+    results = {}
+    for mode in args.modes:
+        retriever = get_retriever(args.product_category, mode)
+        latencies = []
+        results[mode] = {}
+        for query in queries:
+            for _ in range(args.repeat):
+                query_embedding_cache.clear()
+                start = time.perf_counter()
+                docs = retriever.invoke(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+            results[mode][query] = [doc.id or doc.metadata.get("chunk_id") for doc in docs]
+        print(
+            f"{mode:<8} n={len(latencies):<4} mean={statistics.mean(latencies):7.1f} ms  "
+            f"p50={percentile(latencies, 50):7.1f} ms  p95={percentile(latencies, 95):7.1f} ms"
+        )
+
+    if len(args.modes) > 1:
+        base, *others = args.modes
+        for mode in others:
+            overlaps = [
+                len(set(results[base][query]) & set(results[mode][query])) / max(1, len(results[base][query]))
+                for query in queries
+            ]
+            print(f"mean top-k overlap {base} vs {mode}: {statistics.mean(overlaps):.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Bulk-ingest a corpus of PDF manuals into the vector databases.
+
+    python scripts/bulk_ingest.py data/corpus/                  # infer category from folder/file names
+    python scripts/bulk_ingest.py --product-type refrigerator a.pdf b.pdf
+    python scripts/bulk_ingest.py data/corpus/ --workers 8 --batch-size 512 --report report.json
+
+Categories the API server is currently ingesting into are waited for (or,
+with --no-wait, the run is refused); the server likewise waits for this run.
+"""
+import sys
+import logging
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core.config import settings
+from app.services.bulk_ingestion import BulkIngestionRunner, discover_manuals, write_report
+from app.services.ingestion_service import hold_category_file_locks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest PDF manuals into the vector databases.")
+    parser.add_argument("paths", nargs="+", help="PDF files and/or directories to walk")
+    parser.add_argument(
+        "--product-type", choices=settings.VALID_PRODUCT_TYPES,
+        help="Category for every file (default: inferred from folder and file names)",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: BULK_INGEST_WORKERS)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Chunks per embedding call (default: BULK_INGEST_EMBED_BATCH_SIZE)")
+    parser.add_argument("--report", default=None, help="Where to write the JSON report (default: BULK_INGEST_REPORT_DIR)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the manuals and their inferred categories")
+    parser.add_argument("--no-wait", action="store_true", help="Exit instead of waiting while the server is ingesting into a category")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    manuals, failures = discover_manuals(args.paths, args.product_type)
+    print(f"Found {len(manuals)} manuals ({len(failures)} without a category)")
+    if args.dry_run:
+        for pdf_path, product_type in manuals:
+            print(f"  {product_type:<16} {pdf_path}")
+        for failure in failures:
+            print(f"  {'?':<16} {failure['file']}")
+        return
+
+    categories = sorted({product_type for _, product_type in manuals})
+    try:
+        # Non-blocking first, so a wait is announced instead of looking like a hang.
+        locks = hold_category_file_locks(categories, timeout=0)
+        locks.__enter__()
+    except TimeoutError:
+        if args.no_wait:
+            print(f"Another process is ingesting into one of {categories}; exiting.")
+            sys.exit(2)
+        print(f"Waiting for another process to finish ingesting into {categories}...")
+        locks = hold_category_file_locks(categories)
+        locks.__enter__()
+    try:
+        runner = BulkIngestionRunner(workers=args.workers, embed_batch_size=args.batch_size, progress=print)
+        report = runner.run(manuals, failures)
+    finally:
+        locks.__exit__(None, None, None)
+    report_path = write_report(report, args.report)
+
+    print("-" * 60)
+    print(f"Files:      {report['files']} ({report['succeeded']} succeeded, {report['skipped']} skipped, {report['failed']} failed)")
+    print(f"Pages:      {report['pages']} ({report['pages_per_second']} pages/s)")
+    print(f"Chunks:     {report['chunks']} ({report['chunks_per_second']} chunks/s)")
+    print(f"Embedded:   {report['embedded']} new, {report['unchanged']} unchanged, {report['stale_removed']} stale removed")
+    print(f"Elapsed:    {report['elapsed_seconds']}s  stage seconds: {report['stage_seconds']}")
+    for manual in report["manuals"]:
+        if manual["status"] == "failed":
+            print(f"FAILED      {manual['file']}: {manual.get('error')}")
+    print(f"Report written to {report_path}")
+    sys.exit(1 if report["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()